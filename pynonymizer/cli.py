@@ -113,6 +113,14 @@ def default(
             help="Number of rows to populate the fake data table used during anonymization",
         ),
     ] = 150,
+    seed_batch_size: Annotated[
+        int,
+        typer.Option(
+            min=1,
+            show_envvar=True,
+            help="Maximum number of rows sent to the database in each batch while populating the fake data table",
+        ),
+    ] = 500,
     mssql_connection_string: Annotated[
         str,
         typer.Option(
@@ -149,6 +157,13 @@ def default(
             help="[mssql] set the query timeout option in seconds. This is used when anonymizing the data. A value of 0 leaves this setting at the default.",
         ),
     ] = None,
+    mssql_seed_lookup: Annotated[
+        str,
+        typer.Option(
+            "--mssql-seed-lookup",
+            help="[mssql] How rows pick a seed row. `newid` sorts the seed table for every value. `identity` seeks a random seed row by id, which is much faster on large tables.",
+        ),
+    ] = "newid",
     mysql_cmd_opts: Annotated[
         str,
         typer.Option(
@@ -163,6 +178,20 @@ def default(
             help="[mysql] pass additional arguments to the dump process.",
         ),
     ] = None,
+    mysql_execution_mode: Annotated[
+        str,
+        typer.Option(
+            "--mysql-execution-mode",
+            help="[mysql] `process` starts a new client for every statement. `session` keeps one client session open per worker.",
+        ),
+    ] = "process",
+    mysql_dump_mode: Annotated[
+        str,
+        typer.Option(
+            "--mysql-dump-mode",
+            help="[mysql] `single` runs one mysqldump for the whole database. `parallel` dumps tables separately, across --workers, and joins them into one output.",
+        ),
+    ] = "single",
     postgres_cmd_opts: Annotated[
         str,
         typer.Option(
@@ -177,6 +206,13 @@ def default(
             help="[postgres] pass additional arguments to the dump process.",
         ),
     ] = None,
+    postgres_execution_mode: Annotated[
+        str,
+        typer.Option(
+            "--postgres-execution-mode",
+            help="[postgres] `process` starts `psql` for every statement. `psycopg` runs statements over pooled native connections (requires pynonymizer[postgres]).",
+        ),
+    ] = "process",
     dry_run: Annotated[
         bool,
         typer.Option(
@@ -190,6 +226,37 @@ def default(
             help="Increases the verbosity of the logging feature, to help when troubleshooting issues.",
         ),
     ] = False,
+    restore_filter: Annotated[
+        bool,
+        typer.Option(
+            "--restore-filter/--no-restore-filter",
+            help="[mysql, postgres] When restoring and anonymizing, don't restore the data of tables that will be truncated or deleted. Unsafe when other tables reference them, see doc/process-control.md.",
+        ),
+    ] = False,
+    compress_level: Annotated[
+        int,
+        typer.Option(
+            "--compress-level",
+            min=0,
+            help="Compression level for compressed outputs: 0-9 for .gz/.xz, up to 22 for .zst, up to 16 for .lz4. Defaults to 9 for gzip, 6 for xz, 3 for zstd and 0 for lz4.",
+        ),
+    ] = None,
+    compress_threads: Annotated[
+        int,
+        typer.Option(
+            "--compress-threads",
+            min=1,
+            help="Compress outputs across this many threads. .gz/.xz/.lz4 are compressed in independent blocks, .zst uses zstd's own threading.",
+        ),
+    ] = 1,
+    io_queue_depth: Annotated[
+        int,
+        typer.Option(
+            "--io-queue-depth",
+            min=0,
+            help="[mysql, postgres] Chunks read and decompressed ahead of the database client during restore, and read ahead of compression during dump. 0 does all of it on one thread.",
+        ),
+    ] = 4,
     ignore_anonymization_errors: Annotated[
         bool,
         typer.Option(
@@ -249,13 +316,21 @@ def default(
             strategyfile_path=strategyfile,
             output_path=output,
             seed_rows=seed_rows,
+            seed_batch_size=seed_batch_size,
             mssql_driver=mssql_driver,
             mssql_backup_compression=mssql_backup_compression,
             mysql_cmd_opts=mysql_cmd_opts,
             mysql_dump_opts=mysql_dump_opts,
+            mysql_execution_mode=mysql_execution_mode,
+            mysql_dump_mode=mysql_dump_mode,
             postgres_cmd_opts=postgres_cmd_opts,
             postgres_dump_opts=postgres_dump_opts,
+            postgres_execution_mode=postgres_execution_mode,
             ignore_anonymization_errors=ignore_anonymization_errors,
+            restore_filter=restore_filter,
+            compress_level=compress_level,
+            compress_threads=compress_threads,
+            io_queue_depth=io_queue_depth,
             verbose=verbose,
             db_type=db_type,
             db_host=db_host,
@@ -267,12 +342,27 @@ def default(
             mssql_connection_string=mssql_connection_string,
             mssql_ansi_warnings_off=mssql_ansi_warnings_off,
             mssql_timeout=mssql_timeout,
+            mssql_seed_lookup=mssql_seed_lookup,
         )
     except ModuleNotFoundError as error:
         if error.name == "pyodbc" and db_type == "mssql":
             root_logger.error("Missing Required Packages for database support.")
             root_logger.error("Install package extras: pip install pynonymizer[mssql]")
             raise typer.Exit(1)
+        elif error.name == "psycopg" and db_type == "postgres":
+            root_logger.error("Missing Required Packages for psycopg execution.")
+            root_logger.error(
+                "Install package extras: pip install pynonymizer[postgres]"
+            )
+            raise typer.Exit(1)
+        elif error.name == "zstandard":
+            root_logger.error("Missing Required Packages for zstd compression.")
+            root_logger.error("Install package extras: pip install pynonymizer[zstd]")
+            raise typer.Exit(1)
+        elif error.name == "lz4":
+            root_logger.error("Missing Required Packages for lz4 compression.")
+            root_logger.error("Install package extras: pip install pynonymizer[lz4]")
+            raise typer.Exit(1)
         else:
             raise error
     except ImportError as error:
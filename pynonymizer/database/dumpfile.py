@@ -0,0 +1,75 @@
+import uuid
+from abc import ABC, abstractmethod
+
+
+class LineFilter(ABC):
+    """
+    Streams a plain sql dump through, line by line, dropping the lines rejected by `_keep_line`.
+
+    Only the start of each line is held in memory until `_keep_line` can make a decision, so very long lines
+    (e.g. extended inserts) are streamed through in pieces rather than being read whole.
+    """
+
+    @abstractmethod
+    def _keep_line(self, head, complete):
+        """
+        Decide whether to keep a line
+        :param head: the start of the line
+        :param complete: True if `head` is the whole line, including its newline
+        :return: True to keep the line, False to drop it, or None if more of the line is needed to decide
+        """
+
+    def __call__(self, chunks):
+        """
+        Filter an iterable of byte chunks
+        :return: A generator of filtered chunks, one for each chunk read
+        """
+        head = b""
+        keep = None
+
+        for chunk in chunks:
+            output = []
+            position = 0
+            while position < len(chunk):
+                newline = chunk.find(b"\n", position)
+                end = len(chunk) if newline == -1 else newline + 1
+
+                if keep is None:
+                    head += chunk[position:end]
+                    keep = self._keep_line(head, newline != -1)
+                    if keep is None and newline != -1:
+                        keep = True
+                    if keep:
+                        output.append(head)
+                    if keep is not None:
+                        head = b""
+                elif keep:
+                    output.append(chunk[position:end])
+
+                if newline != -1:
+                    keep = None
+                position = end
+
+            if len(output) > 0:
+                yield b"".join(output)
+
+        # a final line without a newline
+        if head and self._keep_line(head, True) is not False:
+            yield head
+
+
+def new_value(kind, payload, pools, seed_row, escape_value):
+    """
+    A column's new value, from a stream provider's column plan (see StreamProvider._get_column_plan)
+    :param escape_value: the dialect's function to write a generated value into the dump, in bytes
+    """
+    if kind == "fake":
+        return pools[payload][seed_row]
+    elif kind == "unique_email":
+        return escape_value(f"{uuid.uuid4().hex}@{uuid.uuid4().hex}.com")
+    elif kind == "unique_login":
+        return escape_value(uuid.uuid4().hex)
+    elif kind == "empty":
+        return escape_value("")
+    else:
+        return payload
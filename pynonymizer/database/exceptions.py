@@ -26,3 +26,13 @@ class UnsupportedColumnStrategyError(DatabaseProviderError):
     def __init__(self, column_strategy):
         self.column_strategy = column_strategy
         super().__init__("Unsupported Column Strategy Type: {}".format(column_strategy))
+
+
+class UnsupportedStreamStrategyError(DatabaseProviderError):
+    def __init__(self, message):
+        super().__init__("Unsupported by stream providers: {}".format(message))
+
+
+class DumpParseError(DatabaseProviderError):
+    def __init__(self, message):
+        super().__init__("Unable to parse dump: {}".format(message))
@@ -1,6 +1,15 @@
-from io import TextIOWrapper
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from functools import partial
+from io import BufferedReader, FileIO, TextIOWrapper, UnsupportedOperation
+from typing import Optional
 import os
-import struct
+import queue
+import threading
+import time
+import bz2
+import errno
 import gzip
 import sys
 import lzma
@@ -16,28 +25,370 @@ class UnknownOutputTypeError(Exception):
         super().__init__("Unable to detect output type for file: {}".format(filename))
 
 
+class InvalidCompressionLevelError(Exception):
+    def __init__(self, filename, level, max_level):
+        super().__init__(
+            "Compression level {} is not valid for file: {}, expected 0-{}".format(
+                level, filename, max_level
+            )
+        )
+
+
 def read_until_empty_byte(data, chunk_size):
     reader = lambda: data.read(chunk_size)
 
     return iter(reader, b"")
 
 
-def dump(progress, write_path, source, size, chunk_size=8192):
-    close_writer = True
+@dataclass
+class CompressionOptions:
+    """How compressed outputs (.gz, .xz, .zst, .lz4) are written"""
+
+    # compression level (see _MAX_COMPRESSION_LEVELS), or None for the format's default
+    level: Optional[int] = None
+    # threads compressing at once. More than one compresses in independent blocks
+    threads: int = 1
+    block_size: int = 4 * 1024 * 1024
+
+
+class ParallelCompressedWriter:
+    """
+    Compresses a stream in independent blocks on a pool of threads, writing the blocks in order.
+
+    Each block is compressed into a complete gzip member or xz stream. Concatenated members/streams are a valid
+    file, read as one by gunzip, xz and python. zlib and lzma release the GIL while compressing, so threads can
+    use several cores.
+    """
+
+    def __init__(self, raw, compress, threads, block_size):
+        """
+        :param raw: the file object to write compressed blocks to
+        :param compress: a function compressing a block of bytes into a complete member/stream
+        """
+        self.__raw = raw
+        self.__compress = compress
+        self.__block_size = block_size
+        # blocks compressed ahead of the writer, bounding memory use
+        self.__max_pending = threads * 2
+
+        self.__executor = ThreadPoolExecutor(max_workers=threads)
+        self.__pending = deque()
+        self.__buffer = []
+        self.__buffered = 0
+
+    def write(self, data):
+        self.__buffer.append(data)
+        self.__buffered += len(data)
+        if self.__buffered >= self.__block_size:
+            self.__submit()
+        return len(data)
+
+    def __submit(self):
+        block = b"".join(self.__buffer)
+        self.__buffer = []
+        self.__buffered = 0
+        self.__pending.append(self.__executor.submit(self.__compress, block))
+
+        while len(self.__pending) > self.__max_pending or (
+            len(self.__pending) > 0 and self.__pending[0].done()
+        ):
+            self.__raw.write(self.__pending.popleft().result())
+
+    def close(self):
+        try:
+            if self.__buffered > 0:
+                self.__submit()
+            while len(self.__pending) > 0:
+                self.__raw.write(self.__pending.popleft().result())
+        finally:
+            self.__executor.shutdown(cancel_futures=True)
+            self.__raw.close()
+
+
+def _zstd_writer(write_path, compression):
+    import zstandard
+
+    level = 3 if compression.level is None else compression.level
+    # zstd compresses across threads itself
+    threads = compression.threads if compression.threads > 1 else 0
+    return zstandard.ZstdCompressor(level=level, threads=threads).stream_writer(
+        open(write_path, "wb")
+    )
+
+
+def _zstd_reader(source):
+    import zstandard
+
+    raw = open(source, "rb") if isinstance(source, str) else source
+    # buffered, for readline and iteration
+    return BufferedReader(
+        zstandard.ZstdDecompressor().stream_reader(raw, read_across_frames=True)
+    )
+
+
+def _lz4_level(compression):
+    return 0 if compression.level is None else compression.level
+
+
+def _lz4_writer(write_path, compression):
+    import lz4.frame
+
+    return lz4.frame.open(write_path, "wb", compression_level=_lz4_level(compression))
+
+
+def _lz4_compressor(compression):
+    import lz4.frame
+
+    return partial(lz4.frame.compress, compression_level=_lz4_level(compression))
+
+
+def _lz4_reader(source):
+    import lz4.frame
+
+    return lz4.frame.open(source, "rb")
+
+
+# the highest compression level of each output format. The lowest is 0
+_MAX_COMPRESSION_LEVELS = {".gz": 9, ".xz": 9, ".zst": 22, ".lz4": 16}
+
+
+def check_compression_level(write_path, compression):
+    """
+    Check that a compression level is valid for the output path's format, before anything is written
+    :raises InvalidCompressionLevelError:
+    """
+    if compression is None or compression.level is None:
+        return
+
+    name, ext = os.path.splitext(write_path)
+    max_level = _MAX_COMPRESSION_LEVELS.get(ext)
+    if max_level is not None and not 0 <= compression.level <= max_level:
+        raise InvalidCompressionLevelError(write_path, compression.level, max_level)
+
+
+def open_output(write_path, compression=None):
+    """
+    Open an output path for writing, by extension. "-" is stdout.
+    :param compression: optional, CompressionOptions for compressed outputs
+    :return: a (file object, close_writer) pair. close_writer is False if the object shouldn't be closed (stdout)
+    """
     if write_path == "-":
-        output_obj = sys.stdout.buffer
-        close_writer = False
+        return sys.stdout.buffer, False
+
+    if compression is None:
+        compression = CompressionOptions()
+    check_compression_level(write_path, compression)
+
+    name, ext = os.path.splitext(write_path)
+
+    if ext == ".sql":
+        return open(write_path, "wb"), True
+    elif ext == ".gz":
+        level = 9 if compression.level is None else compression.level
+        if compression.threads > 1:
+            compress = partial(gzip.compress, compresslevel=level)
+        else:
+            return gzip.open(write_path, "wb", compresslevel=level), True
+    elif ext == ".xz":
+        preset = compression.level
+        if compression.threads > 1:
+            compress = partial(lzma.compress, format=lzma.FORMAT_XZ, preset=preset)
+        else:
+            return lzma.open(write_path, "wb", preset=preset), True
+    elif ext == ".zst":
+        return _zstd_writer(write_path, compression), True
+    elif ext == ".lz4":
+        if compression.threads > 1:
+            compress = _lz4_compressor(compression)
+        else:
+            return _lz4_writer(write_path, compression), True
     else:
-        name, ext = os.path.splitext(write_path)
+        raise UnknownOutputTypeError(write_path)
+
+    return (
+        ParallelCompressedWriter(
+            open(write_path, "wb"),
+            compress,
+            compression.threads,
+            compression.block_size,
+        ),
+        True,
+    )
+
+
+# (magic bytes, open function) for each supported input compression. Uncompressed input is plain sql
+_INPUT_FORMATS = [
+    (b"\x1f\x8b", partial(gzip.open, mode="rb")),
+    (b"\xfd7zXZ\x00", partial(lzma.open, mode="rb")),
+    (b"BZh", partial(bz2.open, mode="rb")),
+    (b"\x28\xb5\x2f\xfd", _zstd_reader),
+    (b"\x04\x22\x4d\x18", _lz4_reader),
+]
+_MAGIC_SIZE = max(len(magic) for magic, open_format in _INPUT_FORMATS)
+
+
+class _CompressedInput(BufferedReader):
+    """
+    A decompressing reader over a compressed file, which closes the file with it
+    """
+
+    def __init__(self, decompressed, compressed):
+        super().__init__(decompressed)
+        self.compressed = compressed
+
+    def close(self):
+        try:
+            super().close()
+        finally:
+            self.compressed.close()
+
+
+def open_input(read_path):
+    """
+    Open an input path for reading. "-" is stdin.
+    Compressed inputs are detected by their magic bytes, so compressed stdin works too. Uncompressed files must have
+    a .sql extension.
+    :return: a (file object, size, position) tuple. size is the size of the file in bytes, or 0 if unknown (stdin).
+    For compressed files, position is a function returning how many compressed bytes have been read, so progress
+    doesn't depend on the uncompressed size (which gzip only records mod 4GB, and other formats may not record at
+    all). Otherwise it is None, and progress is the number of bytes read from the file object.
+    """
+    if read_path == "-":
+        source = sys.stdin.buffer
+        magic = source.peek(_MAGIC_SIZE)[:_MAGIC_SIZE]
+        for format_magic, open_format in _INPUT_FORMATS:
+            if magic.startswith(format_magic):
+                return open_format(source), 0, None
+        return source, 0, None
+
+    name, ext = os.path.splitext(read_path)
+    size = os.path.getsize(read_path)
+    raw = open(read_path, "rb")
+    try:
+        magic = raw.read(_MAGIC_SIZE)
+        raw.seek(0)
+
+        for format_magic, open_format in _INPUT_FORMATS:
+            if magic.startswith(format_magic):
+                return _CompressedInput(open_format(raw), raw), size, raw.tell
 
         if ext == ".sql":
-            output_obj = open(write_path, "wb")
-        elif ext == ".gz":
-            output_obj = gzip.open(write_path, "wb")
-        elif ext == ".xz":
-            output_obj = lzma.open(write_path, "wb")
-        else:
-            raise UnknownOutputTypeError(write_path)
+            return raw, size, None
+    except BaseException:
+        raw.close()
+        raise
+
+    raw.close()
+    raise UnknownInputTypeError(read_path)
+
+
+class InputProgress:
+    """
+    Advances a progress bar as the file object from open_input is read
+    """
+
+    # decompressed bytes read between checks of a compressed file's position
+    __POSITION_INTERVAL = 1024 * 1024
+
+    def __init__(self, bar, position):
+        self.bar = bar
+        self.position = position
+        self.__unchecked = 0
+        self.__last_position = 0
+
+    def update(self, data):
+        """Record a chunk (or line) read from the input"""
+        if self.position is None:
+            self.bar.update(len(data))
+            return
+
+        self.__unchecked += len(data)
+        if self.__unchecked >= self.__POSITION_INTERVAL:
+            self.finish()
+
+    def finish(self):
+        """Bring the progress bar up to date with a compressed file's position"""
+        if self.position is None:
+            return
+        position = self.position()
+        self.bar.update(position - self.__last_position)
+        self.__last_position = position
+        self.__unchecked = 0
+
+
+DEFAULT_QUEUE_DEPTH = 4
+
+
+class _ReaderFailure:
+    def __init__(self, error):
+        self.error = error
+
+
+_END_OF_CHUNKS = object()
+
+
+def pipelined(chunks, queue_depth=DEFAULT_QUEUE_DEPTH):
+    """
+    Iterate `chunks` on a reader thread, handing them to the caller through a queue of up to `queue_depth` chunks.
+    Reading and decompressing then overlap with the caller's writing and compressing. When the queue is full the reader
+    waits, so memory use stays bounded.
+    Errors in the reader are raised in the caller. A queue_depth of 0 iterates on the caller's thread instead.
+    """
+    if queue_depth <= 0:
+        yield from chunks
+        return
+
+    handoff = queue.Queue(maxsize=queue_depth)
+    stopped = threading.Event()
+
+    def put(item):
+        # give up if the caller has stopped reading, rather than blocking forever
+        while not stopped.is_set():
+            try:
+                handoff.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def read():
+        try:
+            for chunk in chunks:
+                if not put(chunk):
+                    return
+            put(_END_OF_CHUNKS)
+        except BaseException as error:
+            put(_ReaderFailure(error))
+
+    reader = threading.Thread(target=read, name="pynonymizer-io-reader", daemon=True)
+    reader.start()
+    try:
+        while True:
+            item = handoff.get()
+            if item is _END_OF_CHUNKS:
+                return
+            if isinstance(item, _ReaderFailure):
+                raise item.error
+            yield item
+    finally:
+        stopped.set()
+        reader.join()
+
+
+def dump(
+    progress,
+    write_path,
+    source,
+    size,
+    chunk_size=65536,
+    compression=None,
+    queue_depth=DEFAULT_QUEUE_DEPTH,
+):
+    """
+    :param compression: optional, CompressionOptions for compressed outputs
+    :param queue_depth: chunks read ahead of the writer. See `pipelined`
+    """
+    output_obj, close_writer = open_output(write_path, compression)
 
     # TODO: replace with context manager?
     try:
@@ -48,7 +399,9 @@ def dump(progress, write_path, source, size, chunk_size=8192):
             unit_scale=True,
             unit_divisor=1000,
         ) as bar:
-            for chunk in read_until_empty_byte(source, chunk_size):
+            for chunk in pipelined(
+                read_until_empty_byte(source, chunk_size), queue_depth
+            ):
                 output_obj.write(chunk)
                 bar.update(len(chunk))
     finally:
@@ -56,40 +409,147 @@ def dump(progress, write_path, source, size, chunk_size=8192):
             output_obj.close()
 
 
-def restore(progress, read_path, target, chunk_size=8192):
-    if read_path == "-":
-        input_obj = sys.stdin.buffer
-        dumpsize = 0
+class AdaptiveChunkSize:
+    """
+    Sizes read chunks by measured throughput, so each chunk takes about `target_seconds` to read and write.
+    Fast pipelines grow towards `maximum`, amortizing per-chunk overhead (syscalls, filters, progress updates), while
+    slow ones keep small chunks so progress stays responsive.
+    """
 
-    else:
-        name, ext = os.path.splitext(read_path)
+    def __init__(self, initial=64 * 1024, maximum=4 * 1024 * 1024, target_seconds=0.1):
+        self.initial = initial
+        self.maximum = maximum
+        self.target_seconds = target_seconds
+        self.size = initial
+
+    def record(self, elapsed_seconds):
+        """Record how long the last chunk of `size` took, and adjust the size for the next one"""
+        if elapsed_seconds < self.target_seconds / 2:
+            self.size = min(self.size * 2, self.maximum)
+        elif elapsed_seconds > self.target_seconds * 2:
+            self.size = max(self.size // 2, self.initial)
+
+
+# bytes moved per zero-copy call
+_ZERO_COPY_CHUNK = 4 * 1024 * 1024
+
+
+def _can_zero_copy(input_obj, target):
+    """
+    Whether the input is a plain file that can be copied straight into the target in the kernel.
+    Only files opened directly by open_input qualify: decompressed or already-read input (stdin) does not.
+    """
+    if input_obj is sys.stdin.buffer:
+        return False
+    if not isinstance(getattr(input_obj, "raw", None), FileIO):
+        return False
+    if not (hasattr(os, "splice") or hasattr(os, "sendfile")):
+        return False
+    try:
+        target.fileno()
+    except (AttributeError, OSError, UnsupportedOperation):
+        return False
+    return True
+
+
+def _zero_copy(input_obj, target, bar):
+    """
+    Copy a file into the target with os.splice (or os.sendfile), without the data passing through python
+    :return: True if the file was copied, or False if zero-copy isn't supported here and nothing was copied
+    """
+    target.flush()
+    in_fd = input_obj.fileno()
+    out_fd = target.fileno()
+    offset = 0
+
+    while True:
+        try:
+            if hasattr(os, "splice"):
+                copied = os.splice(in_fd, out_fd, _ZERO_COPY_CHUNK, offset_src=offset)
+            else:
+                copied = os.sendfile(out_fd, in_fd, offset, _ZERO_COPY_CHUNK)
+        except OSError as error:
+            # unsupported by this kernel or file type, e.g. sendfile to a pipe on older kernels
+            if offset == 0 and error.errno in (
+                errno.EINVAL,
+                errno.ENOSYS,
+                errno.EBADF,
+                errno.ENOTSUP,
+            ):
+                return False
+            raise
+
+        if copied == 0:
+            return True
+        offset += copied
+        bar.update(copied)
+
+
+def restore(
+    progress,
+    read_path,
+    target,
+    chunk_size=None,
+    data_filter=None,
+    flush_interval=1.0,
+    queue_depth=DEFAULT_QUEUE_DEPTH,
+    zero_copy=True,
+):
+    """
+    :param chunk_size: optional, a fixed read size in bytes. By default, the size adapts to the restore's throughput
+    :param data_filter: optional, a function that takes the input's chunks and returns the chunks to restore
+    :param flush_interval: seconds between flushes of the target. It is always flushed at the end
+    :param queue_depth: chunks read (decompressed and filtered) ahead of the writer. See `pipelined`
+    :param zero_copy: copy plain .sql files without a filter into the target with os.splice/os.sendfile, where
+    available
+    """
+    input_obj, dumpsize, position = open_input(read_path)
+    chunk_sizer = None if chunk_size is not None else AdaptiveChunkSize()
+
+    try:
+        with progress(
+            desc="Restoring",
+            total=dumpsize,
+            unit="B",
+            unit_scale=True,
+            unit_divisor=1000,
+        ) as bar:
+            input_progress = InputProgress(bar, position)
+            if (
+                zero_copy
+                and data_filter is None
+                and _can_zero_copy(input_obj, target)
+                and _zero_copy(input_obj, target, bar)
+            ):
+                return
+
+            def read_chunks():
+                while True:
+                    started = time.perf_counter()
+                    chunk = input_obj.read(
+                        chunk_size if chunk_sizer is None else chunk_sizer.size
+                    )
+                    if not chunk:
+                        input_progress.finish()
+                        return
+                    input_progress.update(chunk)
+                    yield chunk
+                    # the time to read, filter and hand over the chunk, which waits on the writer when it falls behind
+                    if chunk_sizer is not None:
+                        chunk_sizer.record(time.perf_counter() - started)
+
+            chunks = pipelined(
+                (read_chunks() if data_filter is None else data_filter(read_chunks())),
+                queue_depth,
+            )
+            last_flush = time.monotonic()
+            for chunk in chunks:
+                target.write(chunk)
+                if time.monotonic() - last_flush >= flush_interval:
+                    target.flush()
+                    last_flush = time.monotonic()
 
-        if ext == ".sql":
-            input_obj = open(read_path, "rb")
-            dumpsize = os.path.getsize(read_path)
-        elif ext == ".gz":
-            input_obj = gzip.open(read_path, "rb")
-            """
-            Get the uncompressed filesize of a gzip
-            The last 4 bytes of a gzip contain the uncompressed filesize in little endian format (broken on >4GB zips)
-            :param filename: gzip filename to read from
-            :returns uncompressed gzip filesize.
-            """
-            with open(read_path, "rb") as file:
-                file.seek(-4, 2)
-                rawsize = file.read()
-                dumpsize = struct.unpack("<I", rawsize)[0]
-        else:
-            raise UnknownInputTypeError(read_path)
-
-    with progress(
-        desc="Restoring",
-        total=dumpsize,
-        unit="B",
-        unit_scale=True,
-        unit_divisor=1000,
-    ) as bar:
-        for chunk in read_until_empty_byte(input_obj, chunk_size):
-            target.write(chunk)
             target.flush()
-            bar.update(len(chunk))
+    finally:
+        if input_obj is not sys.stdin.buffer:
+            input_obj.close()
@@ -1,4 +1,5 @@
-from concurrent.futures import ThreadPoolExecutor
+from pynonymizer.database.pool import ThreadConnectionPool
+from pynonymizer.database.scheduling import LargestFirstSchedule, estimate_costs
 from pynonymizer.database.provider import SEED_TABLE_NAME
 from pynonymizer.strategy.update_column import UpdateColumnStrategyTypes
 from pynonymizer.strategy.table import TableStrategy, TableStrategyTypes
@@ -24,6 +25,13 @@ _FAKE_COLUMN_TYPES = {
     FakeDataType.INT: "INT",
 }
 
+# Seed Table Id column name
+_ID = "_id"
+
+# newid: pick a random seed row by sorting the seed table, per row & column (slow on large tables)
+# identity: seek a random seed row by its identity column, once per row
+SEED_LOOKUP_MODES = ["newid", "identity"]
+
 
 def _extract_driver_version(driver):
     try:
@@ -51,15 +59,26 @@ class MsSqlProvider:
         seed_rows,
         progress,
         db_port=None,
+        seed_batch_size=None,
         connection_string=None,
         backup_compression=False,
         driver=None,
         ansi_warnings_off=True,
         timeout=None,
+        seed_lookup=None,
     ):
         # import here for fast-failiness
         import pyodbc
 
+        if seed_batch_size is None:
+            seed_batch_size = 500
+        if seed_lookup is None:
+            seed_lookup = "newid"
+        if seed_lookup not in SEED_LOOKUP_MODES:
+            raise ValueError(
+                f"Unknown seed lookup '{seed_lookup}', expected one of {SEED_LOOKUP_MODES}"
+            )
+
         self.connnectionstr = ConnectionString.from_string(connection_string or "")
 
         # Allow multiple results sets as this can cause connection busy when using multiple threads
@@ -88,12 +107,14 @@ class MsSqlProvider:
             self.connnectionstr["driver"] = driver or self.__detect_driver()
 
         self.seed_rows = int(seed_rows)
+        self.seed_batch_size = int(seed_batch_size)
 
-        self.__conn = None
-        self.__db_conn = None
+        self.__server_pool = ThreadConnectionPool(self.__connect_server, name="server")
+        self.__db_pool = ThreadConnectionPool(self.__connect_db, name="database")
         self.__backup_compression = backup_compression
         self.ansi_warnings_off = ansi_warnings_off
         self.timeout = timeout
+        self.seed_lookup = seed_lookup
 
         logger.debug("connnectionstr: %s", self.connnectionstr)
 
@@ -112,29 +133,35 @@ class MsSqlProvider:
         # Sort by the highest number (like, ODBC driver 14 for SQL server)
         return sorted(ms_drivers, key=_extract_driver_version, reverse=True)[0]
 
-    def __connection(self):
+    def __connect_server(self):
         import pyodbc
 
-        """a lazy-evaluated connection"""
-        self.__conn = pyodbc.connect(
+        return pyodbc.connect(
             self.connnectionstr.get_string(),
             autocommit=True,
         )
 
-        return self.__conn
-
-    def __db_connection(self):
+    def __connect_db(self):
         import pyodbc
 
-        """a lazy-evaluated db-specific connection"""
-
-        self.__db_conn = pyodbc.connect(
+        return pyodbc.connect(
             self.connnectionstr.get_string(),
             database=self.db_name,
             autocommit=True,
         )
 
-        return self.__db_conn
+    def __connection(self):
+        """a pooled connection, one per thread"""
+        return self.__server_pool.get()
+
+    def __db_connection(self):
+        """a pooled db-specific connection, one per thread"""
+        return self.__db_pool.get()
+
+    def __close_connections(self):
+        """close all pooled connections, at the end of each step"""
+        self.__db_pool.close()
+        self.__server_pool.close()
 
     def __execute_dml(self, statement, *args):
         logger.debug("sql: %s, args: %s", statement, args)
@@ -267,8 +294,32 @@ class MsSqlProvider:
                 pass
             logger.info(results)
 
+    def __get_row_estimates(self):
+        """
+        Look up each table's row count from sys.partitions, for scheduling
+        :return: a dict of "schema.table": rows
+        """
+        try:
+            rows = self.__execute_ddl(
+                """
+            SELECT s.[name] + '.' + t.[name], SUM(p.[rows])
+            FROM sys.tables t
+            INNER JOIN sys.schemas s ON t.[schema_id] = s.[schema_id]
+            INNER JOIN sys.partitions p ON p.[object_id] = t.[object_id] AND p.[index_id] IN (0, 1)
+            GROUP BY s.[name], t.[name]
+            """
+            ).fetchall()
+            return {row[0]: row[1] for row in rows}
+        except Exception:
+            logger.warning(
+                "Unable to estimate table sizes, tables will be anonymized in strategyfile order",
+                exc_info=True,
+            )
+            return {}
+
     def __create_seed_table(self, qualifier_map):
-        seed_column_lines = [
+        seed_column_lines = [f"[{_ID}] INT IDENTITY(1,1) NOT NULL PRIMARY KEY"]
+        seed_column_lines += [
             "[{}] {}".format(name, _FAKE_COLUMN_TYPES[col.data_type])
             for name, col in qualifier_map.items()
         ]
@@ -281,25 +332,40 @@ class MsSqlProvider:
     def __drop_seed_table(self):
         self.__execute_ddl("DROP TABLE IF EXISTS [{}];".format(SEED_TABLE_NAME))
 
-    def __insert_seed_row(self, qualifier_map):
+    def __get_insert_seed_row(self, qualifier_map):
         column_list = ",".join(
             ["[{}]".format(qualifier) for qualifier in qualifier_map]
         )
-        substitution_list = ",".join(
-            [" ?".format(qualifier) for qualifier in qualifier_map]
-        )
-        value_list = [column.value for qualifier, column in qualifier_map.items()]
+        substitution_list = ",".join([" ?" for qualifier in qualifier_map])
 
-        statement = "INSERT INTO [{}]({}) VALUES ({});".format(
+        return "INSERT INTO [{}]({}) VALUES ({});".format(
             SEED_TABLE_NAME, column_list, substitution_list
         )
-        self.__execute_dml(statement, value_list)
 
     def __seed(self, qualifier_map):
-        for i in self.progress(
-            range(0, self.seed_rows), desc="Inserting seed data", unit="rows"
-        ):
-            self.__insert_seed_row(qualifier_map)
+        """
+        Insert the seed rows over a single connection, `seed_batch_size` rows at a time.
+        fast_executemany sends each batch to the server as one parameter array, rather than a round-trip per row.
+        """
+        statement = self.__get_insert_seed_row(qualifier_map)
+        logger.debug("sql: %s", statement)
+
+        cursor = self.__db_connection().cursor()
+        cursor.fast_executemany = True
+        try:
+            with self.progress(
+                desc="Inserting seed data", total=self.seed_rows, unit="rows"
+            ) as progressbar:
+                for batch_start in range(0, self.seed_rows, self.seed_batch_size):
+                    batch_rows = min(self.seed_batch_size, self.seed_rows - batch_start)
+                    value_lists = [
+                        [column.value for column in qualifier_map.values()]
+                        for i in range(0, batch_rows)
+                    ]
+                    cursor.executemany(statement, value_lists)
+                    progressbar.update(batch_rows)
+        finally:
+            cursor.close()
 
     def __get_column_subquery(self, column_strategy, table_name, column_name):
         if column_strategy.strategy_type == UpdateColumnStrategyTypes.EMPTY:
@@ -312,6 +378,9 @@ class MsSqlProvider:
             column = f"[{column_strategy.qualifier}]"
             if column_strategy.sql_type:
                 column = f"CAST({column} AS {column_strategy.sql_type})"
+            if self.seed_lookup == "identity":
+                # seek the first seed row at or after this row's random id, see __get_seed_lookup
+                return f"( SELECT TOP 1 {column} FROM [{SEED_TABLE_NAME}] WHERE [{_ID}] >= [_seed_lookup].[_rid] ORDER BY [{_ID}])"
             # Add WHERE LIKE % OR NULL to make subquery correlated with outer table, therefore uncachable
             return f"( SELECT TOP 1 {column} FROM [{SEED_TABLE_NAME}] WHERE [{table_name}].[{column_name}] LIKE '%' OR [{table_name}].[{column_name}] IS NULL ORDER BY NEWID())"
         elif column_strategy.strategy_type == UpdateColumnStrategyTypes.LITERAL:
@@ -319,19 +388,53 @@ class MsSqlProvider:
         else:
             raise UnsupportedColumnStrategyError(column_strategy)
 
+    def __get_seed_lookup(self, schema_prefix, table_name, column_map):
+        """
+        For identity seed lookups, the statements needed around an UPDATE to give each row a random seed row id.
+        The seed table's size is read once per statement, then NEWID() is evaluated once per row in the CROSS APPLY,
+        rather than once per seed row in a sort.
+        :return: a (prefix, from clause) pair, both empty if not needed
+        """
+        uses_seed = any(
+            column.strategy_type == UpdateColumnStrategyTypes.FAKE_UPDATE
+            for column in column_map.values()
+        )
+        if self.seed_lookup != "identity" or not uses_seed:
+            return "", ""
+
+        prefix = f"DECLARE @n INT = (SELECT MAX([{_ID}]) FROM [{SEED_TABLE_NAME}]);"
+        # modulo before ABS: ABS() overflows when CHECKSUM() returns the minimum INT
+        from_clause = (
+            f" FROM {schema_prefix}[{table_name}]"
+            " CROSS APPLY (SELECT ABS(CHECKSUM(NEWID()) % @n) + 1 AS [_rid]) AS [_seed_lookup]"
+        )
+        return prefix, from_clause
+
     def create_database(self):
         logger.warning(
             "MSSQL: create_database ignored, database will be created when restore_db is run"
         )
 
     def drop_database(self):
-        # force connection close so we can always drop the db: sometimes timing makes a normal drop impossible.
-        self.__execute_server(
-            f"ALTER DATABASE [{self.db_name}] SET SINGLE_USER WITH ROLLBACK IMMEDIATE;"
-        )
-        self.__execute_server(f"DROP DATABASE IF EXISTS [{self.db_name}];")
+        try:
+            # force connection close so we can always drop the db: sometimes timing makes a normal drop impossible.
+            self.__execute_server(
+                f"ALTER DATABASE [{self.db_name}] SET SINGLE_USER WITH ROLLBACK IMMEDIATE;"
+            )
+            self.__execute_server(f"DROP DATABASE IF EXISTS [{self.db_name}];")
+        finally:
+            self.__close_connections()
 
     def anonymize_database(self, database_strategy, db_workers):
+        # one connection per worker, plus the main thread for seeding and scripts
+        self.__db_pool.max_size = db_workers + 1
+        try:
+            self.__anonymize_database(database_strategy, db_workers)
+        finally:
+            self.__close_connections()
+            self.__db_pool.max_size = None
+
+    def __anonymize_database(self, database_strategy, db_workers):
         qualifier_map = database_strategy.fake_update_qualifier_map
 
         if len(qualifier_map) > 0:
@@ -368,6 +471,17 @@ class MsSqlProvider:
                     )
 
                 elif table_strategy.strategy_type == TableStrategyTypes.UPDATE_COLUMNS:
+                    if table_strategy.chunk_size is not None:
+                        logger.warning(
+                            "%s: MSSQL provider does not support chunk_size. This option will be ignored.",
+                            table_name,
+                        )
+                    if table_strategy.single_pass:
+                        logger.warning(
+                            "%s: MSSQL provider does not support single_pass. This option will be ignored.",
+                            table_name,
+                        )
+
                     progressbar.set_description("Anonymizing {}".format(table_name))
                     where_grouping = table_strategy.group_by_where()
                     total_wheres = len(where_grouping)
@@ -385,6 +499,9 @@ class MsSqlProvider:
                             ]
                         )
                         where_clause = f" WHERE {where}" if where else ""
+                        lookup_prefix, lookup_from = self.__get_seed_lookup(
+                            schema_prefix, table_name, column_map
+                        )
                         progressbar.set_description(
                             "Anonymizing {}: w[{}/{}]".format(
                                 table_name, i + 1, total_wheres
@@ -401,7 +518,7 @@ class MsSqlProvider:
                         # set ansi warnings off because otherwise we run into lots of little incompatibilities between the seed data nd the columns
                         # e.g. string or binary data would be truncated (when the data is too long)
                         self.__execute_dml(
-                            f"{ansi_warnings_prefix} UPDATE {schema_prefix}[{table_name}] SET {column_assignments}{where_clause}; {ansi_warnings_suffix}"
+                            f"{ansi_warnings_prefix}{lookup_prefix} UPDATE {schema_prefix}[{table_name}] SET {column_assignments}{lookup_from}{where_clause}; {ansi_warnings_suffix}"
                         )
 
                 else:
@@ -415,12 +532,21 @@ class MsSqlProvider:
 
             progressbar.update()
 
+        # start the biggest tables first, so they can't be left running alone at the end
+        table_tasks = [(table_strategy,) for table_strategy in table_strategies]
+        row_estimates = self.__get_row_estimates()
+        costs = estimate_costs(
+            table_tasks,
+            lambda table_strategy: row_estimates.get(
+                f"{table_strategy.schema or 'dbo'}.{table_strategy.table_name}", 0
+            ),
+        )
+        schedule = LargestFirstSchedule(table_tasks, costs, db_workers)
+
         with self.progress(
             desc="Anonymizing database", total=len(table_strategies)
         ) as progressbar:
-            with ThreadPoolExecutor(max_workers=db_workers) as e:
-                for table_strategy in table_strategies:
-                    e.submit(anonymize_table, progressbar, table_strategy)
+            schedule.run(anonymize_table, progressbar)
 
         if len(anonymization_errors) > 0:
             raise Exception("Error during anonymization" + repr(anonymization_errors))
@@ -430,34 +556,54 @@ class MsSqlProvider:
         logger.info("Dropping seed table")
         self.__drop_seed_table()
 
-    def restore_database(self, input_path):
-        move_files = self.__get_file_moves(input_path)
+    def restore_database(
+        self, input_path, skip_data=None, db_workers=1, io_queue_depth=None
+    ):
+        """
+        :param skip_data: ignored, backups are always restored whole
+        :param db_workers: ignored, the server restores backups itself
+        :param io_queue_depth: ignored, the server reads backups itself
+        """
+        try:
+            move_files = self.__get_file_moves(input_path)
 
-        logger.info("Found %d files in %s", len(move_files), input_path)
-        logger.debug(move_files)
+            logger.info("Found %d files in %s", len(move_files), input_path)
+            logger.debug(move_files)
 
-        # get move statements and flatten pairs out so we can do the 2-param substitution
-        move_clauses = ", ".join(["MOVE ? TO ?"] * len(move_files))
-        move_clause_params = [item for pair in move_files.items() for item in pair]
+            # get move statements and flatten pairs out so we can do the 2-param substitution
+            move_clauses = ", ".join(["MOVE ? TO ?"] * len(move_files))
+            move_clause_params = [item for pair in move_files.items() for item in pair]
 
-        restore_cursor = self.__execute_server(
-            f"RESTORE DATABASE ? FROM DISK = ? WITH {move_clauses}, STATS = ?;",
-            [self.db_name, input_path, *move_clause_params, self.__STATS],
-        )
+            restore_cursor = self.__execute_server(
+                f"RESTORE DATABASE ? FROM DISK = ? WITH {move_clauses}, STATS = ?;",
+                [self.db_name, input_path, *move_clause_params, self.__STATS],
+            )
 
-        self.__async_operation_progress("Restoring Database", restore_cursor)
+            self.__async_operation_progress("Restoring Database", restore_cursor)
+        finally:
+            self.__close_connections()
 
-    def dump_database(self, output_path):
-        with_options = []
-        if self.__backup_compression:
-            with_options.append("COMPRESSION")
+    def dump_database(
+        self, output_path, db_workers=1, compression=None, io_queue_depth=None
+    ):
+        """
+        :param db_workers: ignored, the server writes backups itself
+        :param compression: ignored, see backup_compression
+        :param io_queue_depth: ignored, the server writes backups itself
+        """
+        try:
+            with_options = []
+            if self.__backup_compression:
+                with_options.append("COMPRESSION")
 
-        with_options_str = (
-            ",".join(with_options) + ", " if len(with_options) > 0 else ""
-        )
+            with_options_str = (
+                ",".join(with_options) + ", " if len(with_options) > 0 else ""
+            )
 
-        dump_cursor = self.__execute_server(
-            f"BACKUP DATABASE ? TO DISK = ? WITH {with_options_str}STATS = ?;",
-            [self.db_name, output_path, self.__STATS],
-        )
-        self.__async_operation_progress("Dumping Database", dump_cursor)
+            dump_cursor = self.__execute_server(
+                f"BACKUP DATABASE ? TO DISK = ? WITH {with_options_str}STATS = ?;",
+                [self.db_name, output_path, self.__STATS],
+            )
+            self.__async_operation_progress("Dumping Database", dump_cursor)
+        finally:
+            self.__close_connections()
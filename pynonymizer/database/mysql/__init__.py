@@ -1,12 +1,22 @@
-from concurrent.futures import ThreadPoolExecutor
 from time import sleep
 import logging
 
-from pynonymizer.database.io import dump, restore
-from pynonymizer.database.provider import SEED_TABLE_NAME
+from pynonymizer.database.io import DEFAULT_QUEUE_DEPTH, dump, restore
+from pynonymizer.database.provider import (
+    SEED_TABLE_NAME,
+    describe_key_range,
+    get_key_ranges,
+    parse_chunk_starts,
+)
 from pynonymizer.database.exceptions import UnsupportedTableStrategyError
-from pynonymizer.database.mysql import execution, query_factory
+from pynonymizer.database.mysql import dumpfile, execution, query_factory
+from pynonymizer.database.scheduling import (
+    LargestFirstSchedule,
+    estimate_costs,
+    parse_row_estimates,
+)
 from pynonymizer.strategy.table import TableStrategy, TableStrategyTypes
+from pynonymizer.strategy.update_column import UpdateColumnStrategyTypes
 
 logger = logging.getLogger(__name__)
 
@@ -29,8 +39,11 @@ class MySqlProvider:
         seed_rows,
         progress,
         db_port=None,
+        seed_batch_size=None,
         cmd_opts=None,
         dump_opts=None,
+        execution_mode=None,
+        dump_mode=None,
     ):
         if db_host is None:
             db_host = "127.0.0.1"
@@ -40,6 +53,16 @@ class MySqlProvider:
             cmd_opts = ""
         if dump_opts is None:
             dump_opts = ""
+        if seed_batch_size is None:
+            seed_batch_size = 500
+        if execution_mode is None:
+            execution_mode = "process"
+        if dump_mode is None:
+            dump_mode = "single"
+        if dump_mode not in execution.DUMP_MODES:
+            raise ValueError(
+                f"Unknown dump mode '{dump_mode}', expected one of {execution.DUMP_MODES}"
+            )
 
         self.db_host = db_host
         self.db_user = db_user
@@ -49,9 +72,17 @@ class MySqlProvider:
         self.progress = progress
 
         self.seed_rows = int(seed_rows)
+        self.seed_batch_size = int(seed_batch_size)
+        self.dump_mode = dump_mode
 
         self.__runner = execution.MySqlCmdRunner(
-            db_host, db_user, db_pass, db_name, db_port, additional_opts=cmd_opts
+            db_host,
+            db_user,
+            db_pass,
+            db_name,
+            db_port,
+            additional_opts=cmd_opts,
+            execution_mode=execution_mode,
         )
         self.__dumper = execution.MySqlDumpRunner(
             db_host, db_user, db_pass, db_name, db_port, additional_opts=dump_opts
@@ -60,14 +91,28 @@ class MySqlProvider:
     def __seed(self, qualifier_map):
         """
         'Seed' the database with a bunch of pre-generated random records so updates can be performed in batch updates
+        Rows are sent through a single client session as multi-row INSERTs of up to `seed_batch_size` rows.
         """
-        for i in self.progress(
-            range(0, self.seed_rows), desc="Inserting seed data", unit="rows"
-        ):
-            logger.debug(f"Inserting seed row {i}")
-            self.__runner.db_execute(
-                query_factory.get_insert_seed_row(SEED_TABLE_NAME, qualifier_map)
-            )
+        with self.progress(
+            desc="Inserting seed data", total=self.seed_rows, unit="rows"
+        ) as progressbar:
+            try:
+                seed_pipe = self.__runner.open()
+                for batch_start in range(0, self.seed_rows, self.seed_batch_size):
+                    batch_rows = min(self.seed_batch_size, self.seed_rows - batch_start)
+                    logger.debug(
+                        f"Inserting seed rows {batch_start}-{batch_start + batch_rows}"
+                    )
+                    statement = query_factory.get_insert_seed_rows(
+                        SEED_TABLE_NAME,
+                        qualifier_map,
+                        batch_rows,
+                        first_id=batch_start + 1,
+                    )
+                    seed_pipe.write(statement.encode() + b"\n")
+                    progressbar.update(batch_rows)
+            finally:
+                self.__runner.close()
 
     def __estimate_dumpsize(self):
         """
@@ -83,6 +128,85 @@ class MySqlProvider:
             # Value unparsable, likely NULL
             return None
 
+    def __get_primary_key_columns(self, table_name):
+        """
+        Look up a table's primary key columns, in index order
+        :return: A list of column names, or None (no primary key)
+        """
+        statement = query_factory.get_primary_key_columns(self.db_name, table_name)
+        process_output = self.__runner.get_single_result(statement).strip()
+
+        # GROUP_CONCAT of no rows is NULL
+        if process_output in ("", "NULL"):
+            return None
+
+        return process_output.split(",")
+
+    def __get_key_ranges(self, table_strategy):
+        """
+        Split a table's update into primary key ranges of `chunk_size` rows, so they can be run in parallel.
+        The range boundaries are read from the table's keys, so sparse keys don't make empty ranges.
+        Only tables with a `chunk_size` and a single-column integer primary key are split.
+        :return: A list of (key column, start, end) ranges, or [None] to update the whole table at once
+        """
+        if (
+            table_strategy.strategy_type != TableStrategyTypes.UPDATE_COLUMNS
+            or table_strategy.chunk_size is None
+        ):
+            return [None]
+
+        key_columns = self.__get_primary_key_columns(table_strategy.table_name)
+        if key_columns is None or len(key_columns) != 1:
+            logger.warning(
+                "%s: chunk_size requires a single-column primary key. The table will be updated at once.",
+                table_strategy.table_name,
+            )
+            return [None]
+
+        key_column = key_columns[0]
+        starts = parse_chunk_starts(
+            self.__runner.get_single_result(
+                query_factory.get_chunk_starts(
+                    table_strategy.table_name, key_column, table_strategy.chunk_size
+                )
+            )
+        )
+        if starts is None:
+            logger.warning(
+                "%s: no integer keys found for chunking. The table will be updated at once.",
+                table_strategy.table_name,
+            )
+            return [None]
+
+        return [(key_column, start, end) for start, end in get_key_ranges(starts)]
+
+    def __get_row_estimates(self):
+        """
+        Look up each table's approximate row count from the catalog, for scheduling
+        :return: a dict of table name: estimated rows
+        """
+        try:
+            return parse_row_estimates(
+                self.__runner.get_single_result(
+                    query_factory.get_row_estimates(self.db_name)
+                )
+            )
+        except Exception:
+            logger.warning(
+                "Unable to estimate table sizes, tables will be anonymized in strategyfile order",
+                exc_info=True,
+            )
+            return {}
+
+    def __get_table_names(self):
+        """
+        :return: the names of the database's tables, in the order mysqldump would dump them
+        """
+        output = self.__runner.get_single_result(
+            query_factory.get_table_names(self.db_name)
+        )
+        return [table_name for table_name in output.splitlines() if table_name]
+
     def __run_scripts(self, script_list, title=""):
         for i, script in enumerate(script_list):
             logger.info(f'Running {title} script #{i} "{script[:50]}"')
@@ -102,6 +226,12 @@ class MySqlProvider:
         :param database_strategy: a strategy.DatabaseStrategy configuration
         :return:
         """
+        try:
+            self.__anonymize_database(database_strategy, db_workers)
+        finally:
+            self.__runner.close_sessions()
+
+    def __anonymize_database(self, database_strategy, db_workers):
         qualifier_map = database_strategy.fake_update_qualifier_map
 
         if len(qualifier_map) > 0:
@@ -121,7 +251,7 @@ class MySqlProvider:
 
         anonymization_errors = []
 
-        def anonymize_table(progressbar, table_strategy: TableStrategy):
+        def anonymize_table(progressbar, table_strategy: TableStrategy, key_range):
             try:
                 if table_strategy.schema is not None:
                     logger.warning(
@@ -146,11 +276,36 @@ class MySqlProvider:
                     )
 
                 elif table_strategy.strategy_type == TableStrategyTypes.UPDATE_COLUMNS:
-                    progressbar.set_description(
-                        "Anonymizing {}".format(table_strategy.table_name)
-                    )
+                    if key_range is None:
+                        progressbar.set_description(
+                            "Anonymizing {}".format(table_strategy.table_name)
+                        )
+                        key_columns = self.__get_primary_key_columns(
+                            table_strategy.table_name
+                        )
+                        if key_columns is None and any(
+                            column_strategy.strategy_type
+                            == UpdateColumnStrategyTypes.FAKE_UPDATE
+                            for column_strategy in table_strategy.column_strategies
+                        ):
+                            logger.warning(
+                                "%s: no primary key, seed rows will be picked with ORDER BY RAND(). This is slow on large tables.",
+                                table_strategy.table_name,
+                            )
+                    else:
+                        progressbar.set_description(
+                            "Anonymizing {}: {}".format(
+                                table_strategy.table_name, describe_key_range(key_range)
+                            )
+                        )
+                        key_columns = [key_range[0]]
+
                     statements = query_factory.get_update_table(
-                        SEED_TABLE_NAME, table_strategy
+                        SEED_TABLE_NAME,
+                        table_strategy,
+                        seed_rows=self.seed_rows,
+                        key_columns=key_columns,
+                        key_range=key_range,
                     )
                     self.__runner.db_execute(statements)
 
@@ -164,12 +319,25 @@ class MySqlProvider:
 
             progressbar.update()
 
+        # plan chunked tables up front, so their chunks can be spread across the workers
+        table_tasks = [
+            (table_strategy, key_range)
+            for table_strategy in table_strategies
+            for key_range in self.__get_key_ranges(table_strategy)
+        ]
+
+        # start the biggest tasks first, so they can't be left running alone at the end
+        row_estimates = self.__get_row_estimates()
+        costs = estimate_costs(
+            table_tasks,
+            lambda table_strategy: row_estimates.get(table_strategy.table_name, 0),
+        )
+        schedule = LargestFirstSchedule(table_tasks, costs, db_workers)
+
         with self.progress(
-            desc="Anonymizing database", total=len(table_strategies)
+            desc="Anonymizing database", total=len(table_tasks)
         ) as progressbar:
-            with ThreadPoolExecutor(max_workers=db_workers) as e:
-                for table_strategy in table_strategies:
-                    e.submit(anonymize_table, progressbar, table_strategy)
+            schedule.run(anonymize_table, progressbar)
 
         if len(anonymization_errors) > 0:
             raise Exception("Error during anonymization" + repr(anonymization_errors))
@@ -184,16 +352,70 @@ class MySqlProvider:
         logger.debug("Waiting for trailing operations to complete...")
         sleep(0.2)
 
-    def restore_database(self, input_path):
+    def restore_database(
+        self,
+        input_path,
+        skip_data=None,
+        db_workers=1,
+        io_queue_depth=DEFAULT_QUEUE_DEPTH,
+    ):
+        """
+        :param skip_data: optional, a list of table strategies whose data doesn't need to be restored
+        :param db_workers: ignored, dumps are restored through a single client
+        :param io_queue_depth: chunks read ahead of the writer, see io.pipelined
+        """
+        data_filter = None
+        if skip_data:
+            data_filter = dumpfile.TableDataFilter(
+                [table_strategy.table_name for table_strategy in skip_data]
+            )
+
         try:
             restore_pipe = self.__runner.open()
-            restore(self.progress, input_path, restore_pipe)
+            restore(
+                self.progress,
+                input_path,
+                restore_pipe,
+                data_filter=data_filter,
+                queue_depth=io_queue_depth,
+            )
         finally:
             self.__runner.close()
 
-    def dump_database(self, output_path):
+    def dump_database(
+        self,
+        output_path,
+        db_workers=1,
+        compression=None,
+        io_queue_depth=DEFAULT_QUEUE_DEPTH,
+    ):
+        """
+        :param db_workers: the number of tables to dump at once, in the `parallel` dump mode
+        :param compression: optional, io.CompressionOptions for compressed outputs
+        :param io_queue_depth: chunks read ahead of the writer, see io.pipelined
+        """
         try:
-            dump_stream = self.__dumper.open()
-            dump(self.progress, output_path, dump_stream, self.__estimate_dumpsize())
+            dumpsize = self.__estimate_dumpsize()
+            if self.dump_mode == "parallel":
+                table_names = self.__get_table_names()
+                table_sizes = self.__get_row_estimates()
+        finally:
+            self.__runner.close_sessions()
+
+        try:
+            if self.dump_mode == "parallel":
+                dump_stream = self.__dumper.open_parallel(
+                    table_names, db_workers, table_sizes=table_sizes
+                )
+            else:
+                dump_stream = self.__dumper.open()
+            dump(
+                self.progress,
+                output_path,
+                dump_stream,
+                dumpsize,
+                compression=compression,
+                queue_depth=io_queue_depth,
+            )
         finally:
             self.__dumper.close()
@@ -0,0 +1,253 @@
+import random
+import re
+from pynonymizer.database.dumpfile import LineFilter, new_value
+from pynonymizer.database.exceptions import DumpParseError
+
+_INSERT = re.compile(rb"(?:INSERT(?: IGNORE)? INTO|REPLACE INTO) `((?:[^`]|``)+)`")
+
+# enough bytes to hold any insert prefix: identifiers are up to 64 characters, of up to 4 bytes, with backticks doubled
+_INSERT_MAX_PREFIX = 32 + 64 * 4 * 2
+
+_DELIMITER = b"DELIMITER "
+
+
+class TableDataFilter(LineFilter):
+    """
+    Drops the data of some tables from a mysqldump, keeping everything else (e.g. DDL).
+    mysqldump writes each INSERT statement on one line, escaping any newlines in the data.
+    Lines between `DELIMITER ;;` and `DELIMITER ;` belong to triggers and routines, and are always kept.
+    """
+
+    def __init__(self, table_names):
+        self.__table_names = set(table_names)
+        self.__delimited = False
+
+    def _keep_line(self, head, complete):
+        first = head[:1]
+        if first == b"D" and (
+            head.startswith(_DELIMITER) or _DELIMITER.startswith(head)
+        ):
+            if not complete:
+                return None
+            if head.startswith(_DELIMITER):
+                self.__delimited = head.split()[1:2] != [b";"]
+            return True
+
+        if self.__delimited or (first != b"I" and first != b"R"):
+            return True
+
+        match = _INSERT.match(head)
+        if match:
+            table_name = match.group(1).replace(b"``", b"`").decode()
+            return table_name not in self.__table_names
+
+        if not complete and len(head) < _INSERT_MAX_PREFIX:
+            return None
+
+        return True
+
+
+_IDENTIFIER = rb"`(?:[^`]|``)+`|[\w$]+"
+_CREATE_TABLE_START = re.compile(
+    rb"CREATE TABLE (?:IF NOT EXISTS )?(" + _IDENTIFIER + rb")", re.IGNORECASE
+)
+_INSERT_START = re.compile(
+    rb"(?:INSERT(?:\s+IGNORE)?\s+INTO|REPLACE\s+INTO)\s+(" + _IDENTIFIER + rb")",
+    re.IGNORECASE,
+)
+_INSERT_HEAD = re.compile(
+    rb"\s*(?:INSERT(?:\s+IGNORE)?\s+INTO|REPLACE\s+INTO)\s+(?:"
+    + _IDENTIFIER
+    + rb")\s*(?:\(([^)]*)\))?\s*VALUES\s*",
+    re.IGNORECASE,
+)
+_CREATE_TABLE_COLUMN = re.compile(rb"\s*(" + _IDENTIFIER + rb")\s")
+_CREATE_TABLE_KEYWORDS = {
+    "PRIMARY",
+    "KEY",
+    "INDEX",
+    "UNIQUE",
+    "CONSTRAINT",
+    "FOREIGN",
+    "FULLTEXT",
+    "SPATIAL",
+    "CHECK",
+}
+
+# string literals (unrolled, so they match in linear time), comments, tuple punctuation, and everything else
+_VALUE_TOKEN = re.compile(
+    rb"'[^'\\]*(?:\\.[^'\\]*)*'|/\*.*?\*/|[(),]|[^'(),/]+|/", re.DOTALL
+)
+
+# constant sql literals: NULL, numbers, booleans and strings
+_SQL_LITERAL = re.compile(
+    r"\s*(NULL|[-+]?\d+(?:\.\d+)?|TRUE|FALSE|'(?:[^'\\]|''|\\.)*')\s*",
+    re.IGNORECASE | re.DOTALL,
+)
+
+
+def unquote_identifier(identifier):
+    if identifier.startswith(b"`"):
+        identifier = identifier[1:-1].replace(b"``", b"`")
+    return identifier.decode()
+
+
+def match_create_table(line):
+    """:return: the table name, if the line starts a CREATE TABLE statement"""
+    match = _CREATE_TABLE_START.match(line)
+    return unquote_identifier(match.group(1)) if match else None
+
+
+def match_insert(line):
+    """:return: the table name, if the line starts an INSERT statement"""
+    match = _INSERT_START.match(line)
+    return unquote_identifier(match.group(1)) if match else None
+
+
+def find_statement_end(data, start=0):
+    """
+    Find the end of the first statement in `data`, skipping over semicolons in string literals
+    :return: the index just after the statement's semicolon, or -1 if the statement is incomplete
+    """
+    position = start
+    semicolon = -1
+    quote = -1
+    while True:
+        if semicolon < position:
+            semicolon = data.find(b";", position)
+            if semicolon == -1:
+                return -1
+        if quote < position and quote != -2:
+            quote = data.find(b"'", position)
+            if quote == -1:
+                # no more strings, don't look again
+                quote = -2
+
+        if quote < 0 or semicolon < quote:
+            return semicolon + 1
+
+        # skip the string literal, including any escaped characters
+        position = quote + 1
+        while True:
+            end_quote = data.find(b"'", position)
+            if end_quote == -1:
+                return -1
+            backslashes = 0
+            while data[end_quote - 1 - backslashes] == 0x5C:
+                backslashes += 1
+            position = end_quote + 1
+            if backslashes % 2 == 0:
+                break
+
+
+def parse_create_table_columns(statement):
+    """
+    The column names of a CREATE TABLE statement, in order.
+    Expects one column or key definition per line, as written by mysqldump.
+    """
+    columns = []
+    for line in statement.splitlines()[1:]:
+        match = _CREATE_TABLE_COLUMN.match(line)
+        if match is None:
+            continue
+        column_name = match.group(1)
+        if column_name.upper().decode() in _CREATE_TABLE_KEYWORDS:
+            continue
+        columns.append(unquote_identifier(column_name))
+
+    return columns
+
+
+def escape_value(value):
+    """A seed value as a mysql literal"""
+    if value is None:
+        return b"NULL"
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return str(value).encode()
+
+    escaped = str(value).replace("\\", "\\\\").replace("'", "\\'")
+    return f"'{escaped}'".encode()
+
+
+def parse_sql_literal(value):
+    """
+    Check that an sql literal (e.g. from a `literal` column strategy) is a constant that can be written into VALUES
+    :return: the literal, or None if the value isn't a constant
+    """
+    # compact strategyfile literals are wrapped in parentheses
+    value = value.strip()
+    while value.startswith("(") and value.endswith(")"):
+        value = value[1:-1].strip()
+
+    match = _SQL_LITERAL.fullmatch(value)
+    if match is None:
+        return None
+
+    return match.group(1).encode()
+
+
+def rewrite_insert(context, statement, table_name, table_columns, column_plan):
+    """
+    Rewrite the values of an INSERT statement, using a column plan from a stream provider.
+    Every column of a row that uses fake data takes it from the same random seed row.
+    :param table_columns: the table's columns, in order, or None if unknown. An INSERT's own column list is preferred.
+    :param column_plan: a dict of column name: (kind, payload)
+    """
+    head = _INSERT_HEAD.match(statement)
+    if head is None:
+        raise DumpParseError(f"unrecognised INSERT for table {table_name}")
+
+    if head.group(1) is not None:
+        table_columns = [
+            unquote_identifier(column.strip()) for column in head.group(1).split(b",")
+        ]
+    if table_columns is None:
+        raise DumpParseError(
+            f"column order for table {table_name} is unknown. CREATE TABLE must come before its data"
+        )
+
+    column_indexes = {column.lower(): i for i, column in enumerate(table_columns)}
+    replacements = []
+    for column_name, (kind, payload) in column_plan.items():
+        if column_name.lower() not in column_indexes:
+            raise DumpParseError(f"unknown column {table_name}.{column_name}")
+        replacements.append((column_indexes[column_name.lower()], kind, payload))
+
+    pools = context["pools"]
+    seed_rows = min([len(pool) for pool in pools.values()], default=0)
+
+    output = [statement[: head.end()]]
+    depth = 0
+    values = []
+    value_start = 0
+    for token in _VALUE_TOKEN.finditer(statement, head.end()):
+        text = token.group()
+        if text == b"(":
+            depth += 1
+            if depth == 1:
+                values = []
+                value_start = token.end()
+                continue
+        elif text == b")":
+            depth -= 1
+            if depth == 0:
+                values.append(statement[value_start : token.start()])
+                if len(values) != len(table_columns):
+                    raise DumpParseError(
+                        f"{len(values)} values in a row of {table_name}, expected {len(table_columns)}"
+                    )
+                seed_row = random.randrange(seed_rows) if seed_rows > 0 else None
+                for index, kind, payload in replacements:
+                    values[index] = new_value(
+                        kind, payload, pools, seed_row, escape_value
+                    )
+                output.append(b"(" + b",".join(values) + b")")
+                continue
+        elif text == b"," and depth == 1:
+            values.append(statement[value_start : token.start()])
+            value_start = token.end()
+
+        if depth == 0:
+            output.append(text)
+
+    return b"".join(output)
@@ -1,14 +1,35 @@
 import logging
+import os
+import re
 import shutil
 import shlex
 import subprocess
+import tempfile
+import uuid
+from concurrent.futures import ThreadPoolExecutor
 from pynonymizer.database.exceptions import DependencyError
+from pynonymizer.database.pool import ThreadConnectionPool
 
 logger = logging.getLogger(__name__)
 
 RESTORE_CMD = "mysql"
 DUMP_CMD = "mysqldump"
 
+EXECUTION_MODES = ["session", "process"]
+DUMP_MODES = ["single", "parallel"]
+
+# mysqldump options for each part of a parallel dump, which follow (and override) the user's dump options.
+# Triggers, routines and events are left to the final part, which dumps them unless the user's options say otherwise,
+# as in a single dump
+_SCHEMA_PART_OPTS = ["--no-data", "--skip-triggers", "--skip-routines", "--skip-events"]
+_TABLE_PART_OPTS = [
+    "--no-create-info",
+    "--skip-triggers",
+    "--skip-routines",
+    "--skip-events",
+]
+_FINAL_PART_OPTS = ["--no-data", "--no-create-info"]
+
 
 def _optional_arg(condition, value):
     if condition:
@@ -21,6 +42,42 @@ def _optional_arg_pair(arg_value_pair):
     return _optional_arg(arg_value_pair[1], arg_value_pair)
 
 
+class _PartReader:
+    """
+    Reads the part files of a parallel dump in order, as a single stream.
+    Each part is read as soon as it has been written, and deleted once it has been read.
+    """
+
+    def __init__(self, parts):
+        """
+        :param parts: a list of futures, each resolving to a part's file path
+        """
+        self.__parts = parts
+        self.__index = 0
+        self.__current = None
+
+    def read(self, size=-1):
+        while self.__index < len(self.__parts):
+            if self.__current is None:
+                self.__current = open(self.__parts[self.__index].result(), "rb")
+
+            chunk = self.__current.read(size)
+            if chunk:
+                return chunk
+
+            self.__current.close()
+            os.remove(self.__current.name)
+            self.__current = None
+            self.__index += 1
+
+        return b""
+
+    def close(self):
+        if self.__current is not None:
+            self.__current.close()
+            self.__current = None
+
+
 class MySqlDumpRunner:
     def __init__(
         self,
@@ -39,6 +96,11 @@ class MySqlDumpRunner:
         self.additional_opts = shlex.split(additional_opts)
         self.process = None
 
+        # parallel dumps
+        self.__part_dir = None
+        self.__part_executor = None
+        self.__part_reader = None
+
         if db_name is None:
             raise ValueError("db_name cannot be null")
 
@@ -67,6 +129,59 @@ class MySqlDumpRunner:
         )
         return self.process.stdout
 
+    def __dump_part(self, part_path, args):
+        with open(part_path, "wb") as part:
+            return_code = subprocess.call(
+                [DUMP_CMD] + self.__get_base_params() + self.additional_opts + args,
+                stdout=part,
+            )
+        if return_code > 0:
+            raise DependencyError(DUMP_CMD, "returned error during run")
+        return part_path
+
+    def open_parallel(self, table_names, jobs, table_sizes=None):
+        """
+        Dump the database as separate parts, `jobs` at a time, and read them back as one stream in dump order:
+        the schema, each table's data, then triggers (and any routines/events requested in the dump options).
+        Parts are written to temporary files, so the database should not be changing while it is dumped.
+        :param table_names: the tables whose data to dump, in output order
+        :param table_sizes: optional, a dict of table name: size, to start dumping the largest tables first
+        """
+        self.close()
+        self.__part_dir = tempfile.TemporaryDirectory(prefix="pynonymizer-dump-")
+        self.__part_executor = ThreadPoolExecutor(max_workers=jobs)
+
+        def part_path(name):
+            return os.path.join(self.__part_dir.name, name)
+
+        table_parts = {}
+        schema_part = self.__part_executor.submit(
+            self.__dump_part,
+            part_path("schema.sql"),
+            _SCHEMA_PART_OPTS + [self.db_name],
+        )
+        table_sizes = table_sizes or {}
+        for i, table_name in sorted(
+            enumerate(table_names),
+            key=lambda pair: table_sizes.get(pair[1], 0),
+            reverse=True,
+        ):
+            table_parts[table_name] = self.__part_executor.submit(
+                self.__dump_part,
+                part_path(f"table-{i}.sql"),
+                _TABLE_PART_OPTS + [self.db_name, table_name],
+            )
+        final_part = self.__part_executor.submit(
+            self.__dump_part, part_path("final.sql"), _FINAL_PART_OPTS + [self.db_name]
+        )
+
+        self.__part_reader = _PartReader(
+            [schema_part]
+            + [table_parts[table_name] for table_name in table_names]
+            + [final_part]
+        )
+        return self.__part_reader
+
     def close(self):
         if self.process is not None:
             self.process.stdout.close()
@@ -75,6 +190,102 @@ class MySqlDumpRunner:
                 raise DependencyError(DUMP_CMD, "returned error during run")
             self.process = None
 
+        if self.__part_executor is not None:
+            self.__part_reader.close()
+            self.__part_executor.shutdown(cancel_futures=True)
+            self.__part_dir.cleanup()
+            self.__part_executor = None
+            self.__part_reader = None
+            self.__part_dir = None
+
+
+def _ends_with_terminator(statement):
+    """
+    Whether the last thing in a statement, ignoring comments and whitespace, is a ";"
+    """
+    last = None
+    quote = None
+    i = 0
+    while i < len(statement):
+        char = statement[i]
+        if quote is not None:
+            if char == "\\":
+                i += 1
+            elif char == quote:
+                quote = None
+        elif char in "'\"`":
+            quote = char
+            last = char
+        elif char == "#" or re.match(r"--(\s|$)", statement[i : i + 3]):
+            end = statement.find("\n", i)
+            if end == -1:
+                break
+            i = end
+        elif statement.startswith("/*", i):
+            end = statement.find("*/", i + 2)
+            if end == -1:
+                break
+            i = end + 1
+        elif not char.isspace():
+            last = char
+        i += 1
+
+    return last == ";"
+
+
+class MySqlSession:
+    """
+    A long-lived `mysql` client process that statements are fed to over stdin.
+    Each statement is followed by a query for a unique marker, so the output of each statement can be read back
+    separately. In batch mode the client exits on the first error, which is reported as a CalledProcessError.
+    """
+
+    def __init__(self, args):
+        self.args = args
+        self.__marker = f"__pynonymizer_{uuid.uuid4().hex}__".encode()
+        self.process = subprocess.Popen(
+            args + ["--batch", "--skip-column-names", "--unbuffered"],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+        )
+
+    def execute(self, statement):
+        statement = statement.strip()
+        # statements that change the delimiter can't be terminated with ";", reset the delimiter afterwards instead
+        changes_delimiter = re.search(r"^\s*DELIMITER\s", statement, re.I | re.M)
+        if not changes_delimiter and not _ends_with_terminator(statement):
+            # on its own line, so it can't end up in a trailing comment
+            statement += "\n;"
+
+        self.process.stdin.write(
+            statement.encode()
+            + b"\n"
+            + (b"DELIMITER ;\n" if changes_delimiter else b"")
+            + b"SELECT '"
+            + self.__marker
+            + b"';\n"
+        )
+        self.process.stdin.flush()
+
+        output = []
+        for line in iter(self.process.stdout.readline, b""):
+            if line.rstrip(b"\n") == self.__marker:
+                return b"".join(output)
+            output.append(line)
+
+        # stdout closed before the marker came back: the client has exited
+        raise subprocess.CalledProcessError(
+            self.process.wait(), self.args, output=b"".join(output)
+        )
+
+    def close(self):
+        try:
+            self.process.stdin.close()
+        except BrokenPipeError:
+            pass
+        self.process.stdout.close()
+        self.process.wait()
+
 
 class MySqlCmdRunner:
     def __init__(
@@ -85,6 +296,7 @@ class MySqlCmdRunner:
         db_name,
         db_port,
         additional_opts="",
+        execution_mode="process",
     ):
         self.db_host = db_host
         self.db_user = db_user
@@ -97,6 +309,15 @@ class MySqlCmdRunner:
         if db_name is None:
             raise ValueError("db_name cannot be null")
 
+        if execution_mode not in EXECUTION_MODES:
+            raise ValueError(
+                f"Unknown execution mode '{execution_mode}', expected one of {EXECUTION_MODES}"
+            )
+        self.execution_mode = execution_mode
+        self.__sessions = ThreadConnectionPool(
+            self.__open_session, name="mysql session"
+        )
+
         if not (shutil.which(RESTORE_CMD)):
             raise DependencyError(
                 RESTORE_CMD, f"The '{RESTORE_CMD}' client must be present in the $PATH"
@@ -130,6 +351,24 @@ class MySqlCmdRunner:
             *_optional_arg(self.db_pass, [f"-p{self.db_pass}"]),
         ]
 
+    def __open_session(self):
+        return MySqlSession(
+            self.__get_base_params() + self.additional_opts + [self.db_name]
+        )
+
+    def __session_execute(self, statement):
+        """run a statement in this thread's session, replacing the session if the client exits"""
+        session = self.__sessions.get()
+        try:
+            return session.execute(statement)
+        except subprocess.CalledProcessError as error:
+            self.__sessions.discard()
+            self.__mask_subprocess_error(error)
+
+    def close_sessions(self):
+        """close all open client sessions"""
+        self.__sessions.close()
+
     def execute(self, statements):
         if not isinstance(statements, list):
             statements = [statements]
@@ -159,6 +398,10 @@ class MySqlCmdRunner:
 
         for statement in statements:
             logger.debug(statement)
+            if self.execution_mode == "session":
+                outputs.append(self.__session_execute(statement))
+                continue
+
             try:
                 outputs.append(
                     subprocess.check_output(
@@ -174,6 +417,9 @@ class MySqlCmdRunner:
 
     def get_single_result(self, statement):
         logger.debug(statement)
+        if self.execution_mode == "session":
+            return self.__session_execute(statement).decode()
+
         try:
             return subprocess.check_output(
                 self.__get_base_params()
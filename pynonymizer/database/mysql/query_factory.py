@@ -17,12 +17,32 @@ _FAKE_COLUMN_TYPES = {
 # https://bugs.mysql.com/bug.php?id=89474, use md5 based rand subqueries for unique values (rather than UUIDs)
 _RAND_MD5 = "MD5(FLOOR((NOW() + RAND()) * (RAND() * RAND() / RAND()) + RAND()))"
 
+# Seed Table Id column name
+_ID = "_id"
+
 
 def _get_sql_type(data_type):
     return _FAKE_COLUMN_TYPES[data_type]
 
 
-def _get_column_subquery(seed_table_name, column_strategy):
+def _get_pseudo_random_row_id(table_name, key_columns, seed_rows):
+    """
+    A seed row id derived from the outer row's primary key, rather than RAND().
+    As it only references the outer row, mysql evaluates it once per updated row and can use it for a primary key
+    lookup on the seed table, instead of sorting the whole seed table for every row.
+    :return: the id expression, or None for tables without a primary key
+    """
+    # hashing other columns would give rows with equal values the same fake data, leaking equality and frequency
+    if not key_columns:
+        return None
+
+    hashed_columns = ",".join([f"`{table_name}`.`{column}`" for column in key_columns])
+    return (
+        f"MOD(CRC32(CONCAT_WS(',', '{table_name}', {hashed_columns})), {seed_rows}) + 1"
+    )
+
+
+def _get_column_subquery(seed_table_name, column_strategy, row_id):
     if column_strategy.strategy_type == UpdateColumnStrategyTypes.EMPTY:
         return "('')"
     elif column_strategy.strategy_type == UpdateColumnStrategyTypes.UNIQUE_EMAIL:
@@ -33,7 +53,11 @@ def _get_column_subquery(seed_table_name, column_strategy):
         column = f"`{column_strategy.qualifier}`"
         if column_strategy.sql_type:
             column = f"CAST({column} AS {column_strategy.sql_type})"
-        return f"( SELECT {column} FROM `{seed_table_name}` ORDER BY RAND() LIMIT 1)"
+        if row_id is None:
+            return (
+                f"( SELECT {column} FROM `{seed_table_name}` ORDER BY RAND() LIMIT 1)"
+            )
+        return f"( SELECT {column} FROM `{seed_table_name}` WHERE `{_ID}` = {row_id})"
     elif column_strategy.strategy_type == UpdateColumnStrategyTypes.LITERAL:
         return column_strategy.value
     else:
@@ -63,7 +87,8 @@ def get_create_seed_table(table_name, qualifier_map):
     if len(qualifier_map) < 1:
         raise ValueError("Cannot create a seed table with no columns")
 
-    create_columns = [
+    create_columns = [f"`{_ID}` INT NOT NULL AUTO_INCREMENT PRIMARY KEY"]
+    create_columns += [
         f"`{qualifier}` {_get_sql_type(strategy.data_type)}"
         for qualifier, strategy in qualifier_map.items()
     ]
@@ -75,14 +100,27 @@ def get_drop_seed_table(table_name):
     return f"DROP TABLE IF EXISTS `{table_name}`;"
 
 
-def get_insert_seed_row(table_name, qualifier_map):
-    column_names = ",".join([f"`{qualifier}`" for qualifier in qualifier_map.keys()])
-    column_values = ",".join(
-        [f"{_escape_sql_value(strategy.value)}" for strategy in qualifier_map.values()]
+def get_insert_seed_rows(table_name, qualifier_map, row_count, first_id=1):
+    """
+    A multi-row INSERT of `row_count` freshly generated seed rows
+    Ids are given explicitly, so they stay contiguous regardless of auto_increment_increment
+    """
+    column_names = ",".join(
+        [f"`{_ID}`"] + [f"`{qualifier}`" for qualifier in qualifier_map.keys()]
     )
+    rows = []
+    for i in range(0, row_count):
+        column_values = ",".join(
+            [str(first_id + i)]
+            + [
+                f"{_escape_sql_value(strategy.value)}"
+                for strategy in qualifier_map.values()
+            ]
+        )
+        rows.append(f"({column_values})")
 
-    return "INSERT INTO `{}`({}) VALUES ({});".format(
-        table_name, column_names, column_values
+    return "INSERT INTO `{}`({}) VALUES {};".format(
+        table_name, column_names, ",".join(rows)
     )
 
 
@@ -94,23 +132,109 @@ def get_drop_database(database_name):
     return f"DROP DATABASE IF EXISTS `{database_name}`;"
 
 
+def _get_where_clause(table_name, where, key_range):
+    if key_range is None:
+        return f" WHERE {where}" if where else ""
+
+    column, start, end = key_range
+    range_condition = f"`{table_name}`.`{column}` >= {start}"
+    if end is not None:
+        range_condition += f" AND `{table_name}`.`{column}` < {end}"
+    return (
+        f" WHERE ({where}) AND {range_condition}"
+        if where
+        else f" WHERE {range_condition}"
+    )
+
+
+def _get_single_pass_update_table(
+    seed_table_name, update_table_strategy, seed_rows, key_columns, key_range
+):
+    """
+    One UPDATE for every where-group, choosing each column's value with a CASE expression.
+    Rows not matched by any condition keep their current value.
+    """
+    table_name = update_table_strategy.table_name
+    column_groups = update_table_strategy.group_by_column()
+    row_id = _get_pseudo_random_row_id(table_name, key_columns, seed_rows)
+
+    assignments = []
+    wheres = []
+    unconditional = False
+    for column_name, pairs in column_groups.items():
+        cases = []
+        default = f"`{column_name}`"
+        for where, column_strategy in pairs:
+            value = _get_column_subquery(seed_table_name, column_strategy, row_id)
+            if where is None:
+                default = value
+                unconditional = True
+            else:
+                cases.append(f"WHEN ({where}) THEN {value}")
+                if where not in wheres:
+                    wheres.append(where)
+
+        if len(cases) > 0:
+            assignments.append(
+                f"`{column_name}` = CASE {' '.join(cases)} ELSE {default} END"
+            )
+        else:
+            assignments.append(f"`{column_name}` = {default}")
+
+    # only rows matching a condition need to be touched, unless something is updated unconditionally
+    where = None if unconditional else " OR ".join([f"({w})" for w in wheres])
+    where_clause = _get_where_clause(table_name, where, key_range)
+
+    return f"UPDATE `{table_name}` SET {','.join(assignments)}{where_clause};"
+
+
 # TODO: this where-grouping behaviour should probably return to the provider, rather than implementing as q-gen logic
-def get_update_table(seed_table_name, update_table_strategy):
+def get_update_table(
+    seed_table_name,
+    update_table_strategy,
+    seed_rows=1,
+    key_columns=None,
+    key_range=None,
+):
+    """
+    :param seed_rows: number of rows in the seed table
+    :param key_columns: the table's primary key columns, used to pick a seed row for each updated row.
+    When the table has no primary key, each value picks a random seed row with ORDER BY RAND(), which is much slower.
+    :param key_range: optional (column, start, end), to only update rows where start <= column < end.
+    end may be None, for no upper bound
+    """
+    if (
+        update_table_strategy.single_pass
+        and not update_table_strategy.where_references_updated_columns()
+    ):
+        return [
+            _get_single_pass_update_table(
+                seed_table_name,
+                update_table_strategy,
+                seed_rows,
+                key_columns,
+                key_range,
+            )
+        ]
+
     # group on where_condition
     # build lists of update statements based on the where
     output_statements = []
     where_update_statements = {}
+    table_name = update_table_strategy.table_name
     for where, column_map in update_table_strategy.group_by_where().items():
         where_update_statements[where] = []
+        row_id = _get_pseudo_random_row_id(table_name, key_columns, seed_rows)
         for column_name, column_strategy in column_map.items():
             where_update_statements[where].append(
                 "`{}` = {}".format(
-                    column_name, _get_column_subquery(seed_table_name, column_strategy)
+                    column_name,
+                    _get_column_subquery(seed_table_name, column_strategy, row_id),
                 )
             )
 
         assignments = ",".join(where_update_statements[where])
-        where_clause = f" WHERE {where}" if where else ""
+        where_clause = _get_where_clause(table_name, where, key_range)
 
         output_statements.append(
             f"UPDATE `{update_table_strategy.table_name}` SET {assignments}{where_clause};"
@@ -119,6 +243,40 @@ def get_update_table(seed_table_name, update_table_strategy):
     return output_statements
 
 
+def get_primary_key_columns(database_name, table_name):
+    return (
+        "SELECT GROUP_CONCAT(COLUMN_NAME ORDER BY ORDINAL_POSITION) "
+        "FROM information_schema.KEY_COLUMN_USAGE "
+        f"WHERE TABLE_SCHEMA = '{database_name}' AND TABLE_NAME = '{table_name}' AND CONSTRAINT_NAME = 'PRIMARY';"
+    )
+
+
+def get_chunk_starts(table_name, column, chunk_size):
+    """
+    The first key of every `chunk_size` rows, in key order. Chunks follow the rows, so sparse keys don't make empty
+    chunks
+    """
+    return (
+        f"SELECT `{column}` FROM ("
+        f"SELECT `{column}`, ROW_NUMBER() OVER (ORDER BY `{column}`) AS _row FROM `{table_name}`"
+        f") AS _keys WHERE MOD(_row - 1, {chunk_size}) = 0 ORDER BY 1;"
+    )
+
+
+def get_row_estimates(database_name):
+    return (
+        "SELECT TABLE_NAME, TABLE_ROWS FROM information_schema.tables "
+        f"WHERE TABLE_SCHEMA = '{database_name}' AND TABLE_TYPE = 'BASE TABLE';"
+    )
+
+
+def get_table_names(database_name):
+    return (
+        "SELECT TABLE_NAME FROM information_schema.tables "
+        f"WHERE TABLE_SCHEMA = '{database_name}' AND TABLE_TYPE = 'BASE TABLE' ORDER BY TABLE_NAME;"
+    )
+
+
 def get_dumpsize_estimate(database_name):
     return (
         "SELECT data_bytes "
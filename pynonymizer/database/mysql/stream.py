@@ -0,0 +1,92 @@
+from pynonymizer.database.mysql import dumpfile
+from pynonymizer.database.stream import StreamProvider
+
+_DELIMITER = b"DELIMITER "
+
+
+class MySqlStreamProvider(StreamProvider):
+    """
+    Anonymizes a plain mysqldump file on its way to the output, without a mysql server.
+    INSERT statements for updated tables are rewritten, and the data of truncated and deleted tables is dropped.
+    Everything else (DDL, triggers, routines) is written unchanged.
+
+    Column order is taken from each INSERT's column list if it has one, otherwise from the table's CREATE TABLE,
+    which must come before the table's data (as in any mysqldump).
+    """
+
+    def _get_table_key(self, table_strategy):
+        return table_strategy.table_name
+
+    def _escape_value(self, value):
+        return dumpfile.escape_value(value)
+
+    def _parse_literal(self, value):
+        return dumpfile.parse_sql_literal(value)
+
+    def _read_items(self, lines, plan):
+        table_columns = {}
+        delimited = False
+
+        # a statement that spans several lines: (kind, table name, [lines])
+        buffered = None
+
+        for line in lines:
+            if buffered is not None:
+                buffered[2].append(line)
+            else:
+                if line.startswith(_DELIMITER):
+                    delimited = line.split()[1:2] != [b";"]
+                    yield line
+                    continue
+
+                if delimited:
+                    yield line
+                    continue
+
+                table_name = dumpfile.match_insert(line)
+                if table_name is not None:
+                    if (
+                        table_name not in plan.drop_tables
+                        and table_name not in plan.update_tables
+                    ):
+                        yield line
+                        continue
+                    buffered = ("insert", table_name, [line])
+                else:
+                    table_name = dumpfile.match_create_table(line)
+                    if table_name is None or table_name not in plan.update_tables:
+                        yield line
+                        continue
+                    buffered = ("create", table_name, [line])
+
+            # statements end with a semicolon at the end of a line, outside of any string
+            if not line.rstrip().endswith(b";"):
+                continue
+            statement = b"".join(buffered[2])
+            if dumpfile.find_statement_end(statement) == -1:
+                continue
+
+            kind, table_name, _ = buffered
+            buffered = None
+
+            if kind == "create":
+                table_columns[table_name] = dumpfile.parse_create_table_columns(
+                    statement
+                )
+                yield statement
+            elif table_name in plan.drop_tables:
+                continue
+            else:
+                yield (
+                    dumpfile.rewrite_insert,
+                    (
+                        statement,
+                        table_name,
+                        table_columns.get(table_name),
+                        plan.update_tables[table_name],
+                    ),
+                )
+
+        if buffered is not None:
+            # an incomplete statement at the end of the input, leave it as it was
+            yield b"".join(buffered[2])
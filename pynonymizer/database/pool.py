@@ -0,0 +1,128 @@
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class ThreadConnectionPool:
+    """
+    A connection pool that gives each thread one reusable connection.
+
+    Connections are created lazily using `connect` the first time a thread asks for one, and are kept for that thread
+    until the pool is closed. Connections belonging to threads that have since finished (e.g. the workers of a previous
+    ThreadPoolExecutor) are handed over to the next thread that needs one, rather than opening a new connection.
+
+    If `max_size` is set, at most `max_size` connections are open at once and any further threads will wait until a
+    connection is released.
+    """
+
+    def __init__(self, connect, max_size=None, name="connection"):
+        self.__connect = connect
+        self.__condition = threading.Condition()
+        self.__connections = {}
+        self.__idle = []
+
+        self.max_size = max_size
+        self.name = name
+
+        self.created = 0
+        self.reused = 0
+        self.handed_over = 0
+        self.peak_size = 0
+
+    @property
+    def size(self):
+        """The number of connections currently open (or being opened)"""
+        with self.__condition:
+            return len(self.__connections) + len(self.__idle)
+
+    def __reclaim(self):
+        """move connections belonging to finished threads into the idle list"""
+        for thread, connection in list(self.__connections.items()):
+            if connection is not None and not thread.is_alive():
+                del self.__connections[thread]
+                self.__idle.append(connection)
+
+    def get(self):
+        """
+        Get the current thread's connection, creating one if necessary
+        """
+        thread = threading.current_thread()
+
+        with self.__condition:
+            connection = self.__connections.get(thread)
+            if connection is not None:
+                self.reused += 1
+                return connection
+
+            while True:
+                self.__reclaim()
+                if len(self.__idle) > 0:
+                    connection = self.__idle.pop()
+                    self.__connections[thread] = connection
+                    self.handed_over += 1
+                    return connection
+
+                if self.max_size is None or len(self.__connections) < self.max_size:
+                    # reserve a slot so the (slow) connect can happen outside the lock
+                    self.__connections[thread] = None
+                    self.peak_size = max(self.peak_size, len(self.__connections))
+                    break
+
+                # a slot will only free up when a thread finishes, which doesn't notify, so poll.
+                self.__condition.wait(timeout=0.1)
+
+        try:
+            connection = self.__connect()
+        except Exception:
+            with self.__condition:
+                del self.__connections[thread]
+                self.__condition.notify()
+            raise
+
+        with self.__condition:
+            self.__connections[thread] = connection
+            self.created += 1
+
+        return connection
+
+    def discard(self):
+        """
+        Close and forget the current thread's connection, e.g. when it's no longer usable after an error.
+        """
+        thread = threading.current_thread()
+        with self.__condition:
+            connection = self.__connections.pop(thread, None)
+            self.__condition.notify()
+
+        if connection is not None:
+            connection.close()
+
+    def close(self):
+        """
+        Close every connection in the pool. The pool can still be used afterwards, and will open new connections.
+        """
+        with self.__condition:
+            connections = [c for c in self.__connections.values() if c is not None]
+            connections += self.__idle
+            self.__connections = {}
+            self.__idle = []
+            self.__condition.notify_all()
+
+        logger.debug(
+            "%s pool: closing %d connection(s). created: %d, reused: %d, handed over: %d, peak size: %d",
+            self.name,
+            len(connections),
+            self.created,
+            self.reused,
+            self.handed_over,
+            self.peak_size,
+        )
+
+        for connection in connections:
+            try:
+                connection.close()
+            except Exception:
+                logger.debug(
+                    "%s pool: error closing connection", self.name, exc_info=True
+                )
@@ -1,9 +1,20 @@
-from concurrent.futures import ThreadPoolExecutor
-from pynonymizer.database.io import dump, restore
-from pynonymizer.database.provider import SEED_TABLE_NAME
+import os
+import tempfile
+from pynonymizer.database.io import DEFAULT_QUEUE_DEPTH, dump, restore
+from pynonymizer.database.provider import (
+    SEED_TABLE_NAME,
+    describe_key_range,
+    get_key_ranges,
+    parse_chunk_starts,
+)
 import logging
 from pynonymizer.database.exceptions import UnsupportedTableStrategyError
-from pynonymizer.database.postgres import execution, query_factory
+from pynonymizer.database.postgres import dumpfile, execution, query_factory
+from pynonymizer.database.scheduling import (
+    LargestFirstSchedule,
+    estimate_costs,
+    parse_row_estimates,
+)
 from pynonymizer.strategy.table import TableStrategy, TableStrategyTypes
 
 
@@ -16,6 +27,9 @@ class PostgreSqlProvider:
 
     logger = logging.getLogger(__name__)
 
+    # COPY text is smaller than the table on disk, which has per-row headers, alignment padding and free space
+    __DUMPSIZE_ESTIMATE_INFLATION = 0.85
+
     def __init__(
         self,
         db_host,
@@ -25,8 +39,10 @@ class PostgreSqlProvider:
         seed_rows,
         progress,
         db_port=None,
+        seed_batch_size=None,
         cmd_opts=None,
         dump_opts=None,
+        execution_mode=None,
     ):
         if db_port is None:
             db_port = "5432"
@@ -37,6 +53,10 @@ class PostgreSqlProvider:
             cmd_opts = ""
         if dump_opts is None:
             dump_opts = ""
+        if seed_batch_size is None:
+            seed_batch_size = 500
+        if execution_mode is None:
+            execution_mode = "process"
 
         self.db_host = db_host
         self.db_user = db_user
@@ -46,6 +66,7 @@ class PostgreSqlProvider:
         self.progress = progress
 
         self.seed_rows = int(seed_rows)
+        self.seed_batch_size = int(seed_batch_size)
 
         self.__runner = execution.PSqlCmdRunner(
             db_host=db_host,
@@ -64,17 +85,113 @@ class PostgreSqlProvider:
             additional_opts=dump_opts,
         )
 
+        # psql is always used for restores, statements can optionally run over native connections
+        if execution_mode == "process":
+            self.__db_runner = self.__runner
+        elif execution_mode == "psycopg":
+            self.__db_runner = execution.PsycopgRunner(
+                db_host=db_host,
+                db_user=db_user,
+                db_pass=db_pass,
+                db_name=db_name,
+                db_port=db_port,
+            )
+        else:
+            raise ValueError(
+                f"Unknown execution mode '{execution_mode}', expected one of {execution.EXECUTION_MODES}"
+            )
+
+    def __seed_chunks(self, qualifier_map, progressbar):
+        for batch_start in range(0, self.seed_rows, self.seed_batch_size):
+            batch_rows = min(self.seed_batch_size, self.seed_rows - batch_start)
+            self.logger.debug(
+                f"Copying seed rows {batch_start}-{batch_start + batch_rows}"
+            )
+            yield query_factory.get_copy_seed_data(qualifier_map, batch_rows)
+            progressbar.update(batch_rows)
+
     def __seed(self, qualifier_map):
         """
         'Seed' the database with a bunch of pre-generated random records so updates can be performed in batch updates
+        Rows are streamed through a single client session using COPY FROM STDIN, `seed_batch_size` rows at a time.
+        """
+        with self.progress(
+            desc="Inserting seed data", total=self.seed_rows, unit="rows"
+        ) as progressbar:
+            self.__db_runner.copy(
+                query_factory.get_copy_seed_rows(SEED_TABLE_NAME, qualifier_map),
+                self.__seed_chunks(qualifier_map, progressbar),
+            )
+
+    def __get_seed_row_count(self):
+        """
+        Count the seed rows once, so updates can use it as a constant
+        :return: The highest seed row id
         """
-        for i in self.progress(
-            range(0, self.seed_rows), desc="Inserting seed data", unit="rows"
+        statement = query_factory.get_seed_row_count(SEED_TABLE_NAME)
+        return int(self.__db_runner.get_single_result(statement))
+
+    def __get_key_ranges(self, table_strategy):
+        """
+        Split a table's update into primary key ranges of `chunk_size` rows, so they can be run in parallel.
+        The range boundaries are read from the table's keys, so sparse keys don't make empty ranges.
+        Only tables with a `chunk_size` and a single-column integer primary key are split.
+        :return: A list of (key column, start, end) ranges, or [None] to update the whole table at once
+        """
+        if (
+            table_strategy.strategy_type != TableStrategyTypes.UPDATE_COLUMNS
+            or table_strategy.chunk_size is None
         ):
-            self.logger.debug(f"Inserting seed row {i}")
-            self.__runner.db_execute(
-                query_factory.get_insert_seed_row(SEED_TABLE_NAME, qualifier_map)
+            return [None]
+
+        # psql output ends with a newline, and is empty for tables without a primary key
+        key_columns = (
+            self.__db_runner.get_single_result(
+                query_factory.get_primary_key_columns(table_strategy)
+            )
+            .strip()
+            .split(",")
+        )
+        if len(key_columns) != 1 or key_columns[0] == "":
+            self.logger.warning(
+                "%s: chunk_size requires a single-column primary key. The table will be updated at once.",
+                table_strategy.qualified_name,
             )
+            return [None]
+
+        key_column = key_columns[0]
+        starts = parse_chunk_starts(
+            self.__db_runner.get_single_result(
+                query_factory.get_chunk_starts(
+                    table_strategy, key_column, table_strategy.chunk_size
+                )
+            )
+        )
+        if starts is None:
+            self.logger.warning(
+                "%s: no integer keys found for chunking. The table will be updated at once.",
+                table_strategy.qualified_name,
+            )
+            return [None]
+
+        return [(key_column, start, end) for start, end in get_key_ranges(starts)]
+
+    def __get_row_estimates(self):
+        """
+        Look up each table's approximate row count from the catalog, for scheduling
+        :return: a dict of "schema.table": estimated rows
+        """
+        try:
+            return parse_row_estimates(
+                self.__db_runner.get_single_result(query_factory.get_row_estimates()),
+                separator="|",
+            )
+        except Exception:
+            self.logger.warning(
+                "Unable to estimate table sizes, tables will be anonymized in strategyfile order",
+                exc_info=True,
+            )
+            return {}
 
     def __estimate_dumpsize(self):
         """
@@ -82,18 +199,32 @@ class PostgreSqlProvider:
         :return: A value in bytes, or None (unknown)
         """
         statement = query_factory.get_dumpsize_estimate(self.db_name)
-        process_output = self.__runner.get_single_result(statement)
+        process_output = self.__db_runner.get_single_result(statement)
 
         try:
-            return int(process_output)
-        except ValueError:
+            return int(process_output) * self.__DUMPSIZE_ESTIMATE_INFLATION
+        except (TypeError, ValueError):
             # Value unparsable, likely NULL
             return None
 
+    def __get_table_count(self):
+        """
+        Count the tables a dump will write data for
+        :return: a number of tables, or None (unknown)
+        """
+        process_output = self.__db_runner.get_single_result(
+            query_factory.get_table_count()
+        )
+
+        try:
+            return int(process_output) or None
+        except (TypeError, ValueError):
+            return None
+
     def __run_scripts(self, script_list, title=""):
         for i, script in enumerate(script_list):
             self.logger.info(f'Running {title} script #{i} "{script[:50]}"')
-            self.logger.info(self.__runner.db_execute(script))
+            self.logger.info(self.__db_runner.db_execute(script))
 
     def create_database(self):
         """Create the working database"""
@@ -109,17 +240,28 @@ class PostgreSqlProvider:
         :param database_strategy: a strategy.DatabaseStrategy configuration
         :return:
         """
+        # one connection per worker, plus the main thread for seeding and scripts
+        self.__db_runner.set_max_sessions(db_workers + 1)
+        try:
+            self.__anonymize_database(database_strategy, db_workers)
+        finally:
+            self.__db_runner.close_sessions()
+            self.__db_runner.set_max_sessions(None)
+
+    def __anonymize_database(self, database_strategy, db_workers):
         qualifier_map = database_strategy.fake_update_qualifier_map
+        seed_rows = None
 
         if len(qualifier_map) > 0:
             self.logger.info("creating seed table with %d columns", len(qualifier_map))
             create_seed_table_sql = query_factory.get_create_seed_table(
                 SEED_TABLE_NAME, qualifier_map
             )
-            self.__runner.db_execute(create_seed_table_sql)
+            self.__db_runner.db_execute(create_seed_table_sql)
 
             self.logger.info("Inserting seed data")
             self.__seed(qualifier_map)
+            seed_rows = self.__get_seed_row_count()
 
         self.__run_scripts(database_strategy.before_scripts, "before")
 
@@ -128,53 +270,76 @@ class PostgreSqlProvider:
 
         anonymization_errors = []
 
-        def anonymize_table(progressbar, table_strategy: TableStrategy):
-            for table_strategy in table_strategies:
-                try:
-                    if table_strategy.strategy_type == TableStrategyTypes.TRUNCATE:
-                        progressbar.set_description(
-                            "Truncating {}".format(table_strategy.qualified_name)
-                        )
-                        self.__runner.db_execute(
-                            query_factory.get_truncate_table(table_strategy)
-                        )
+        def anonymize_table(progressbar, table_strategy: TableStrategy, key_range):
+            try:
+                if table_strategy.strategy_type == TableStrategyTypes.TRUNCATE:
+                    progressbar.set_description(
+                        "Truncating {}".format(table_strategy.qualified_name)
+                    )
+                    self.__db_runner.db_execute(
+                        query_factory.get_truncate_table(table_strategy)
+                    )
 
-                    elif table_strategy.strategy_type == TableStrategyTypes.DELETE:
-                        progressbar.set_description(
-                            "Deleting {}".format(table_strategy.qualified_name)
-                        )
-                        self.__runner.db_execute(
-                            query_factory.get_delete_table(table_strategy)
-                        )
+                elif table_strategy.strategy_type == TableStrategyTypes.DELETE:
+                    progressbar.set_description(
+                        "Deleting {}".format(table_strategy.qualified_name)
+                    )
+                    self.__db_runner.db_execute(
+                        query_factory.get_delete_table(table_strategy)
+                    )
 
-                    elif (
-                        table_strategy.strategy_type
-                        == TableStrategyTypes.UPDATE_COLUMNS
-                    ):
+                elif table_strategy.strategy_type == TableStrategyTypes.UPDATE_COLUMNS:
+                    if key_range is None:
                         progressbar.set_description(
                             "Anonymizing {}".format(table_strategy.qualified_name)
                         )
-                        statements = query_factory.get_update_table(
-                            SEED_TABLE_NAME, table_strategy
+                    else:
+                        progressbar.set_description(
+                            "Anonymizing {}: {}".format(
+                                table_strategy.qualified_name,
+                                describe_key_range(key_range),
+                            )
                         )
-                        self.__runner.db_execute(statements)
 
-                    else:
-                        raise UnsupportedTableStrategyError(table_strategy)
-                except Exception as e:
-                    anonymization_errors.append(e)
-                    self.logger.exception(
-                        f"Error while anonymizing table {table_strategy.qualified_name}"
+                    statements = query_factory.get_update_table(
+                        SEED_TABLE_NAME,
+                        table_strategy,
+                        seed_rows=seed_rows,
+                        key_range=key_range,
                     )
+                    self.__db_runner.db_execute(statements)
 
-                progressbar.update()
+                else:
+                    raise UnsupportedTableStrategyError(table_strategy)
+            except Exception as e:
+                anonymization_errors.append(e)
+                self.logger.exception(
+                    f"Error while anonymizing table {table_strategy.qualified_name}"
+                )
+
+            progressbar.update()
+
+        # plan chunked tables up front, so their chunks can be spread across the workers
+        table_tasks = [
+            (table_strategy, key_range)
+            for table_strategy in table_strategies
+            for key_range in self.__get_key_ranges(table_strategy)
+        ]
+
+        # start the biggest tasks first, so they can't be left running alone at the end
+        row_estimates = self.__get_row_estimates()
+        costs = estimate_costs(
+            table_tasks,
+            lambda table_strategy: row_estimates.get(
+                f"{table_strategy.schema or 'public'}.{table_strategy.table_name}", 0
+            ),
+        )
+        schedule = LargestFirstSchedule(table_tasks, costs, db_workers)
 
         with self.progress(
-            desc="Anonymizing database", total=len(table_strategies)
+            desc="Anonymizing database", total=len(table_tasks)
         ) as progressbar:
-            with ThreadPoolExecutor(max_workers=db_workers) as e:
-                for table_strategy in table_strategies:
-                    e.submit(anonymize_table, progressbar, table_strategy)
+            schedule.run(anonymize_table, progressbar)
 
         if len(anonymization_errors) > 0:
             raise Exception("Error during anonymization" + repr(anonymization_errors))
@@ -182,18 +347,144 @@ class PostgreSqlProvider:
         self.__run_scripts(database_strategy.after_scripts, "after")
 
         self.logger.info("dropping seed table")
-        self.__runner.db_execute(query_factory.get_drop_seed_table(SEED_TABLE_NAME))
+        self.__db_runner.db_execute(query_factory.get_drop_seed_table(SEED_TABLE_NAME))
+
+    def restore_database(
+        self,
+        input_path,
+        skip_data=None,
+        db_workers=1,
+        io_queue_depth=DEFAULT_QUEUE_DEPTH,
+    ):
+        """
+        :param skip_data: optional, a list of table strategies whose data doesn't need to be restored
+        :param db_workers: the number of tables to restore at once, for directory/custom format archives
+        :param io_queue_depth: chunks read ahead of the writer for plain sql dumps, see io.pipelined
+        """
+        archive_format = dumpfile.get_input_archive_format(input_path)
+        if archive_format is not None:
+            self.__restore_archive(input_path, skip_data, db_workers)
+            return
+
+        data_filter = None
+        if skip_data:
+            data_filter = dumpfile.TableDataFilter(
+                [
+                    (table_strategy.schema, table_strategy.table_name)
+                    for table_strategy in skip_data
+                ]
+            )
 
-    def restore_database(self, input_path):
         try:
             restore_pipe = self.__runner.open()
-            restore(self.progress, input_path, restore_pipe)
+            restore(
+                self.progress,
+                input_path,
+                restore_pipe,
+                data_filter=data_filter,
+                queue_depth=io_queue_depth,
+            )
         finally:
             self.__runner.close()
 
-    def dump_database(self, output_path):
+    def __restore_archive(self, input_path, skip_data, db_workers):
+        """
+        Restore a pg_dump archive with pg_restore, `db_workers` tables at a time
+        """
+        restore_runner = execution.PgRestoreRunner(
+            db_host=self.db_host,
+            db_user=self.db_user,
+            db_pass=self.db_pass,
+            db_name=self.db_name,
+            db_port=self.db_port,
+        )
+        skip_tables = {
+            (table_strategy.schema or "public", table_strategy.table_name)
+            for table_strategy in skip_data or []
+        }
+        restore_list, table_count = dumpfile.get_restore_list(
+            restore_runner.list(input_path), skip_tables
+        )
+
+        with tempfile.TemporaryDirectory() as list_dir:
+            list_path = None
+            if skip_tables:
+                list_path = os.path.join(list_dir, "restore.list")
+                with open(list_path, "w") as list_file:
+                    list_file.write(restore_list)
+
+            with self.progress(
+                desc="Restoring", total=table_count, unit="tables"
+            ) as progressbar:
+
+                def on_table(table_name):
+                    progressbar.set_description(f"Restoring {table_name}")
+                    progressbar.update()
+
+                restore_runner.restore(
+                    input_path, jobs=db_workers, use_list=list_path, on_table=on_table
+                )
+
+    def dump_database(
+        self,
+        output_path,
+        db_workers=1,
+        compression=None,
+        io_queue_depth=DEFAULT_QUEUE_DEPTH,
+    ):
+        """
+        :param db_workers: the number of tables to dump at once, for directory format archives
+        :param compression: optional, io.CompressionOptions for compressed plain sql outputs
+        :param io_queue_depth: chunks read ahead of the writer, see io.pipelined
+        """
+        archive_format = dumpfile.get_output_archive_format(output_path)
+        if archive_format is not None:
+            try:
+                self.__dump_archive(output_path, archive_format, db_workers)
+            finally:
+                self.__db_runner.close_sessions()
+            return
+
+        try:
+            dumpsize = self.__estimate_dumpsize()
+        finally:
+            self.__db_runner.close_sessions()
+
         try:
             dump_stream = self.__dumper.open()
-            dump(self.progress, output_path, dump_stream, self.__estimate_dumpsize())
+            dump(
+                self.progress,
+                output_path,
+                dump_stream,
+                dumpsize,
+                compression=compression,
+                queue_depth=io_queue_depth,
+            )
         finally:
             self.__dumper.close()
+
+    def __dump_archive(self, output_path, archive_format, db_workers):
+        """
+        Dump to a pg_dump archive with pg_dump, `db_workers` tables at a time (directory format only)
+        """
+        if archive_format != dumpfile.ARCHIVE_DIRECTORY and db_workers > 1:
+            self.logger.warning(
+                "Only directory format dumps can use several workers. The dump will use one."
+            )
+            db_workers = 1
+
+        table_count = self.__get_table_count()
+        with self.progress(
+            desc="Dumping", total=table_count, unit="tables"
+        ) as progressbar:
+
+            def on_table(table_name):
+                progressbar.set_description(f"Dumping {table_name}")
+                progressbar.update()
+
+            self.__dumper.dump_archive(
+                output_path.rstrip(os.sep),
+                archive_format,
+                jobs=db_workers,
+                on_table=on_table,
+            )
@@ -0,0 +1,225 @@
+import os
+import random
+import re
+from pynonymizer.database.dumpfile import LineFilter, new_value
+from pynonymizer.database.exceptions import DumpParseError
+
+_IDENTIFIER = rb'"(?:[^"]|"")+"|[^\s."(]+'
+_COPY = re.compile(rb"COPY (" + _IDENTIFIER + rb")(?:\.(" + _IDENTIFIER + rb"))? ")
+_COPY_PREFIX = b"COPY "
+_COPY_SUFFIX = b"FROM stdin;"
+_END_OF_DATA = b"\\."
+_COPY_COLUMNS = re.compile(rb"\s*\(([^)]*)\)\s*FROM stdin;")
+_COLUMN = re.compile(rb'"(?:[^"]|"")+"|[^\s,"]+')
+
+# pg_dump archive formats, read and written by pg_restore/pg_dump rather than streamed through psql
+ARCHIVE_DIRECTORY = "directory"
+ARCHIVE_CUSTOM = "custom"
+_ARCHIVE_MAGIC = b"PGDMP"
+_ARCHIVE_CUSTOM_EXTENSIONS = (".dump", ".backup")
+
+# a table's data in a `pg_restore --list` table of contents: "<id>; <oid> <oid> TABLE DATA <schema> <table> <owner>"
+_TOC_TABLE_DATA = re.compile(r"^\d+; \d+ \d+ TABLE DATA (\S+) (\S+) ", re.MULTILINE)
+
+# a constant sql literal: NULL, a number, a boolean or a (non-escape) string
+_SQL_LITERAL = re.compile(
+    r"\s*(?:(NULL)|([-+]?\d+(?:\.\d+)?)|(TRUE|FALSE)|'((?:[^']|'')*)')\s*",
+    re.IGNORECASE,
+)
+
+
+def _unquote_identifier(identifier):
+    if identifier.startswith(b'"'):
+        return identifier[1:-1].replace(b'""', b'"').decode()
+    return identifier.decode()
+
+
+class TableDataFilter(LineFilter):
+    """
+    Drops the data of some tables from a pg_dump plain sql dump, keeping everything else (e.g. DDL).
+    The `COPY ... FROM stdin;` line and `\\.` terminator of each dropped table are kept, leaving an empty COPY.
+    """
+
+    def __init__(self, tables):
+        """
+        :param tables: a list of (schema, table name) pairs. A schema of None means `public`
+        """
+        self.__tables = {
+            (schema or "public", table_name) for schema, table_name in tables
+        }
+        # while reading a COPY block, whether to keep its data lines
+        self.__copy_data = None
+
+    def _keep_line(self, head, complete):
+        if self.__copy_data is not None:
+            # data lines can't start with a backslash unless escaped, so this skips most of them quickly
+            if head[:1] != b"\\":
+                return self.__copy_data
+            if not complete:
+                return None if len(head) <= len(_END_OF_DATA) + 1 else self.__copy_data
+            if is_end_of_data(head):
+                self.__copy_data = None
+                return True
+            return self.__copy_data
+
+        if head.startswith(_COPY_PREFIX) or _COPY_PREFIX.startswith(head):
+            if not complete:
+                return None
+
+            copy = match_copy(head)
+            if copy is not None:
+                schema, table_name, _ = copy
+                self.__copy_data = (schema, table_name) not in self.__tables
+
+        return True
+
+
+def match_copy(line):
+    """
+    :return: a (schema, table name, [column names]) tuple, if the line starts a COPY block
+    """
+    match = _COPY.match(line)
+    if match is None or not line.rstrip().endswith(_COPY_SUFFIX):
+        return None
+
+    if match.group(2) is None:
+        schema, table_name = "public", _unquote_identifier(match.group(1))
+    else:
+        schema = _unquote_identifier(match.group(1))
+        table_name = _unquote_identifier(match.group(2))
+
+    columns = _COPY_COLUMNS.match(line, match.end() - 1)
+    if columns is None:
+        return schema, table_name, None
+
+    return (
+        schema,
+        table_name,
+        [_unquote_identifier(column) for column in _COLUMN.findall(columns.group(1))],
+    )
+
+
+def is_end_of_data(line):
+    return line.rstrip(b"\r\n") == _END_OF_DATA
+
+
+def escape_copy_value(value):
+    """A seed value as a field of COPY's text format"""
+    if value is None:
+        return b"\\N"
+
+    return (
+        str(value)
+        .replace("\\", "\\\\")
+        .replace("\t", "\\t")
+        .replace("\n", "\\n")
+        .replace("\r", "\\r")
+        .encode()
+    )
+
+
+def parse_sql_literal(value):
+    """
+    Convert a constant sql literal (e.g. from a `literal` column strategy) to a COPY field
+    :return: the COPY field, or None if the value isn't a constant that can be converted
+    """
+    # compact strategyfile literals are wrapped in parentheses
+    value = value.strip()
+    while value.startswith("(") and value.endswith(")"):
+        value = value[1:-1].strip()
+
+    match = _SQL_LITERAL.fullmatch(value)
+    if match is None:
+        return None
+
+    null, number, boolean, string = match.groups()
+    if null is not None:
+        return escape_copy_value(None)
+    elif number is not None:
+        return number.encode()
+    elif boolean is not None:
+        return boolean[0].lower().encode()
+    else:
+        return escape_copy_value(string.replace("''", "'"))
+
+
+def rewrite_copy_rows(context, rows, table_name, column_count, replacements):
+    """
+    Rewrite a batch of COPY data lines, using a column plan from a stream provider.
+    Every column of a row that uses fake data takes it from the same random seed row.
+    :param replacements: a list of (column index, kind, payload)
+    """
+    pools = context["pools"]
+    seed_rows = min([len(pool) for pool in pools.values()], default=0)
+
+    output = []
+    for row in rows:
+        # tabs and newlines in the data are always escaped, so fields can be split directly
+        fields = row.rstrip(b"\n").split(b"\t")
+        if len(fields) != column_count:
+            raise DumpParseError(
+                f"{len(fields)} fields in a row of {table_name}, expected {column_count}"
+            )
+
+        seed_row = random.randrange(seed_rows) if seed_rows > 0 else None
+        for index, kind, payload in replacements:
+            fields[index] = new_value(kind, payload, pools, seed_row, escape_copy_value)
+        output.append(b"\t".join(fields) + b"\n")
+
+    return b"".join(output)
+
+
+def get_input_archive_format(read_path):
+    """
+    Detect a pg_dump archive: a directory, or a custom format file (by its header)
+    :return: ARCHIVE_DIRECTORY, ARCHIVE_CUSTOM, or None for plain sql
+    """
+    if read_path == "-":
+        return None
+    if os.path.isdir(read_path):
+        return ARCHIVE_DIRECTORY
+
+    try:
+        with open(read_path, "rb") as file:
+            if file.read(len(_ARCHIVE_MAGIC)) == _ARCHIVE_MAGIC:
+                return ARCHIVE_CUSTOM
+    except OSError:
+        pass
+
+    return None
+
+
+def get_output_archive_format(write_path):
+    """
+    Choose a pg_dump archive format by path: a directory (ending with a separator) or a `.dump`/`.backup` custom
+    format file
+    :return: ARCHIVE_DIRECTORY, ARCHIVE_CUSTOM, or None for plain sql
+    """
+    if write_path == "-":
+        return None
+    if write_path.endswith(os.sep) or os.path.isdir(write_path):
+        return ARCHIVE_DIRECTORY
+    if os.path.splitext(write_path)[1] in _ARCHIVE_CUSTOM_EXTENSIONS:
+        return ARCHIVE_CUSTOM
+
+    return None
+
+
+def get_restore_list(toc, skip_tables=None):
+    """
+    Make a `pg_restore --use-list` list from an archive's table of contents, leaving out the data of some tables
+    :param toc: the output of `pg_restore --list`
+    :param skip_tables: a set of (schema, table name) pairs
+    :return: a (list, number of tables restored with data) pair
+    """
+    skip_tables = skip_tables or set()
+    restored_tables = 0
+
+    def comment_skipped(match):
+        nonlocal restored_tables
+        if (match.group(1), match.group(2)) in skip_tables:
+            return ";" + match.group(0)
+        restored_tables += 1
+        return match.group(0)
+
+    return _TOC_TABLE_DATA.sub(comment_skipped, toc), restored_tables
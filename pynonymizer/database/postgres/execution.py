@@ -1,8 +1,10 @@
 import logging
+import re
 import shutil
 import shlex
 import subprocess
 from pynonymizer.database.exceptions import DependencyError
+from pynonymizer.database.pool import ThreadConnectionPool
 import os
 
 """
@@ -11,9 +13,37 @@ Seperate everything that touches actual query exec into its own module
 
 RESTORE_CMD = "psql"
 DUMP_CMD = "pg_dump"
+ARCHIVE_RESTORE_CMD = "pg_restore"
+
+EXECUTION_MODES = ["process", "psycopg"]
 
 logger = logging.getLogger(__name__)
 
+# --verbose messages from pg_dump/pg_restore as each table's data is started
+_VERBOSE_TABLE = re.compile(
+    r'(?:dumping contents of table|processing data for table) "(.+)"'
+)
+
+
+def _run_verbose(command, args, env, on_table=None):
+    """
+    Run pg_dump/pg_restore with --verbose, calling on_table(name) as each table's data is started
+    """
+    process = subprocess.Popen(
+        args, env=env, stderr=subprocess.PIPE, universal_newlines=True
+    )
+    for line in process.stderr:
+        match = _VERBOSE_TABLE.search(line)
+        if match and on_table is not None:
+            on_table(match.group(1))
+        elif "error:" in line or "warning:" in line:
+            logger.warning(line.rstrip())
+        else:
+            logger.debug(line.rstrip())
+
+    if process.wait() > 0:
+        raise DependencyError(command, "returned error during run")
+
 
 class PSqlDumpRunner:
     def __init__(
@@ -26,6 +56,7 @@ class PSqlDumpRunner:
         self.db_port = db_port
         self.additional_opts = shlex.split(additional_opts)
         self.process = None
+        self.__env = None
 
         if not (shutil.which(DUMP_CMD)):
             raise DependencyError(
@@ -44,11 +75,30 @@ class PSqlDumpRunner:
         ]
 
     def __get_env(self):
-        new_env = os.environ.copy()
-        if self.db_pass:
-            new_env.update({"PGPASSWORD": self.db_pass})
+        # os.environ only needs copying once per runner
+        if self.__env is None:
+            self.__env = os.environ.copy()
+            if self.db_pass:
+                self.__env.update({"PGPASSWORD": self.db_pass})
+
+        return self.__env
 
-        return new_env
+    def dump_archive(self, output_path, archive_format, jobs=1, on_table=None):
+        """
+        Dump to a pg_dump archive, rather than a plain sql stream
+        :param jobs: the number of tables to dump at once. Only supported by the directory format
+        :param on_table: optional, called with each table's name as its data is dumped
+        """
+        params = ["--format", archive_format, "--file", output_path, "--verbose"]
+        if jobs > 1:
+            params += ["--jobs", str(jobs)]
+
+        _run_verbose(
+            DUMP_CMD,
+            self.__get_base_params() + params + self.additional_opts + [self.db_name],
+            self.__get_env(),
+            on_table,
+        )
 
     def open(self):
         self.close()
@@ -68,6 +118,67 @@ class PSqlDumpRunner:
             self.process = None
 
 
+class PgRestoreRunner:
+    """
+    Restores pg_dump archives (directory or custom format) using `pg_restore`, which can restore several tables at
+    once.
+    """
+
+    def __init__(self, db_host, db_user, db_pass, db_name, db_port="5432"):
+        self.db_host = db_host
+        self.db_user = db_user
+        self.db_pass = db_pass
+        self.db_name = db_name
+        self.db_port = db_port
+
+        if not (shutil.which(ARCHIVE_RESTORE_CMD)):
+            raise DependencyError(
+                ARCHIVE_RESTORE_CMD,
+                f"The '{ARCHIVE_RESTORE_CMD}' client must be present in the $PATH",
+            )
+
+    def __get_env(self):
+        env = os.environ.copy()
+        if self.db_pass:
+            env.update({"PGPASSWORD": self.db_pass})
+        return env
+
+    def list(self, input_path):
+        """
+        :return: the archive's table of contents, as written by `pg_restore --list`
+        """
+        return subprocess.check_output(
+            [ARCHIVE_RESTORE_CMD, "--list", input_path]
+        ).decode()
+
+    def restore(self, input_path, jobs=1, use_list=None, on_table=None):
+        """
+        :param jobs: the number of tables to restore at once
+        :param use_list: optional, the path of a `--use-list` file choosing which entries to restore
+        :param on_table: optional, called with each table's name as its data is restored
+        """
+        params = [
+            ARCHIVE_RESTORE_CMD,
+            "--host",
+            self.db_host,
+            "--port",
+            self.db_port,
+            "--username",
+            self.db_user,
+            "--dbname",
+            self.db_name,
+            "--verbose",
+        ]
+        if jobs > 1:
+            params += ["--jobs", str(jobs)]
+        if use_list is not None:
+            params += ["--use-list", use_list]
+
+        _run_verbose(
+            ARCHIVE_RESTORE_CMD, params + [input_path], self.__get_env(), on_table
+        )
+
+
 class PSqlCmdRunner:
     def __init__(
         self, db_host, db_user, db_pass, db_name, db_port="5432", additional_opts=""
@@ -79,6 +190,7 @@ class PSqlCmdRunner:
         self.db_port = db_port
         self.additional_opts = shlex.split(additional_opts)
         self.process = None
+        self.__env = None
 
         if not (shutil.which(RESTORE_CMD)):
             raise DependencyError(
@@ -97,11 +209,13 @@ class PSqlCmdRunner:
         ]
 
     def __get_env(self):
-        new_env = os.environ.copy()
-        if self.db_pass:
-            new_env.update({"PGPASSWORD": self.db_pass})
+        # os.environ only needs copying once per runner
+        if self.__env is None:
+            self.__env = os.environ.copy()
+            if self.db_pass:
+                self.__env.update({"PGPASSWORD": self.db_pass})
 
-        return new_env
+        return self.__env
 
     def execute(self, statements):
         if not isinstance(statements, list):
@@ -161,11 +275,38 @@ class PSqlCmdRunner:
             env=self.__get_env(),
         ).decode()
 
-    def open(self):
+    def copy(self, statement, chunks):
+        """
+        Run a COPY ... FROM STDIN statement, streaming the data from an iterable of text chunks
+        """
+        logger.debug(statement)
+        try:
+            copy_pipe = self.open(on_error_stop=True)
+            copy_pipe.write(statement.encode() + b"\n")
+            for chunk in chunks:
+                copy_pipe.write(chunk.encode())
+            copy_pipe.write(b"\\.\n")
+        finally:
+            self.close()
+
+    def close_sessions(self):
+        """psql is started for each statement, so there are no sessions to close"""
+        pass
+
+    def set_max_sessions(self, max_sessions):
+        """psql is started for each statement, so there are no sessions to limit"""
+        pass
+
+    def open(self, on_error_stop=False):
+        """
+        Start a psql session that reads statements from the returned pipe. close() raises if psql fails
+        :param on_error_stop: exit with an error on the first failed statement, rather than carrying on
+        """
         self.close()
         self.process = subprocess.Popen(
             self.__get_base_params()
             + ["--dbname", self.db_name, "--quiet"]
+            + (["-v", "ON_ERROR_STOP=1"] if on_error_stop else [])
             + self.additional_opts,
             env=self.__get_env(),
             stdin=subprocess.PIPE,
@@ -179,3 +320,84 @@ class PSqlCmdRunner:
             if return_code > 0:
                 raise DependencyError(RESTORE_CMD, "returned error during run")
             self.process = None
+
+
+def _format_unaligned(rows):
+    """format result rows the way `psql -tA` does: one line per row, columns separated by |, NULL as empty"""
+    return "\n".join(
+        "|".join("" if value is None else str(value) for value in row) for row in rows
+    )
+
+
+class PsycopgRunner:
+    """
+    Runs statements over native psycopg connections rather than starting `psql` for every statement.
+    Connections are pooled, one per worker thread.
+    """
+
+    def __init__(self, db_host, db_user, db_pass, db_name, db_port="5432"):
+        # import here for fast-failiness
+        import psycopg
+
+        self.db_host = db_host
+        self.db_user = db_user
+        self.db_pass = db_pass
+        self.db_name = db_name
+        self.db_port = db_port
+
+        self.__pool = ThreadConnectionPool(self.__connect, name="psycopg")
+
+    def __connect(self):
+        import psycopg
+
+        return psycopg.connect(
+            host=self.db_host,
+            port=self.db_port,
+            user=self.db_user,
+            password=self.db_pass or None,
+            dbname=self.db_name,
+            autocommit=True,
+        )
+
+    def __execute(self, statement):
+        import psycopg
+
+        logger.debug(statement)
+        connection = self.__pool.get()
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute(statement)
+                if cursor.description is not None:
+                    return _format_unaligned(cursor.fetchall())
+                return cursor.statusmessage or ""
+        except psycopg.Error:
+            if connection.broken:
+                self.__pool.discard()
+            raise
+
+    def db_execute(self, statements):
+        if not isinstance(statements, list):
+            statements = [statements]
+
+        return [self.__execute(statement).encode() for statement in statements]
+
+    def get_single_result(self, statement):
+        return self.__execute(statement)
+
+    def copy(self, statement, chunks):
+        """
+        Run a COPY ... FROM STDIN statement, streaming the data from an iterable of text chunks
+        """
+        logger.debug(statement)
+        with self.__pool.get().cursor() as cursor:
+            with cursor.copy(statement) as copy:
+                for chunk in chunks:
+                    copy.write(chunk)
+
+    def close_sessions(self):
+        """close all pooled connections"""
+        self.__pool.close()
+
+    def set_max_sessions(self, max_sessions):
+        """limit how many connections are open at once, or None for no limit"""
+        self.__pool.max_size = max_sessions
@@ -1,5 +1,5 @@
-from datetime import date, datetime
 from pynonymizer.database.exceptions import UnsupportedColumnStrategyError
+from pynonymizer.database.postgres.dumpfile import escape_copy_value
 from pynonymizer.strategy.update_column import UpdateColumnStrategyTypes
 from pynonymizer.fake import FakeDataType
 
@@ -27,7 +27,7 @@ def _get_sql_type(data_type):
     return _FAKE_COLUMN_TYPES[data_type]
 
 
-def _get_column_subquery(seed_table_name, column_strategy):
+def _get_column_subquery(seed_table_name, column_strategy, seed_rows):
     if column_strategy.strategy_type == UpdateColumnStrategyTypes.EMPTY:
         return "('')"
     elif column_strategy.strategy_type == UpdateColumnStrategyTypes.UNIQUE_EMAIL:
@@ -39,8 +39,7 @@ def _get_column_subquery(seed_table_name, column_strategy):
         if column_strategy.sql_type:
             column += "::" + column_strategy.sql_type
 
-        num_rows = f'(SELECT MAX("{_ID}") FROM "{seed_table_name}")'
-        pseudo_random_row_id = f"MOD({_PSEUDO_RANDOM_INT}, {num_rows}) + 1"
+        pseudo_random_row_id = f"MOD({_PSEUDO_RANDOM_INT}, {seed_rows}) + 1"
 
         return f'( SELECT {column} FROM "{seed_table_name}" WHERE "{_ID}"={pseudo_random_row_id})'
     elif column_strategy.strategy_type == UpdateColumnStrategyTypes.LITERAL:
@@ -49,17 +48,6 @@ def _get_column_subquery(seed_table_name, column_strategy):
         raise UnsupportedColumnStrategyError(column_strategy)
 
 
-def _escape_sql_value(value):
-    """
-    return a sql-ified version of a seed column's value
-    Normally this defines the stringification of datatypes and escaping for strings
-    """
-    if isinstance(value, (str, datetime, date)):
-        return "'" + str(value).replace("'", "''") + "'"
-    else:
-        return str(value)
-
-
 def _get_qualified_table_name(schema, table):
     return f'"{schema}"."{table}"' if schema else f'"{table}"'
 
@@ -91,15 +79,36 @@ def get_drop_seed_table(table_name):
     return f"DROP TABLE IF EXISTS {table_name};"
 
 
-def get_insert_seed_row(table_name, qualifier_map):
+def get_copy_seed_rows(table_name, qualifier_map):
+    """
+    The COPY statement that precedes the seed data lines
+    """
     column_names = ",".join([f"{qualifier}" for qualifier in qualifier_map.keys()])
-    column_values = ",".join(
-        [f"{_escape_sql_value(strategy.value)}" for strategy in qualifier_map.values()]
-    )
 
-    return 'INSERT INTO "{}" ({}) VALUES ({});'.format(
-        table_name, column_names, column_values
-    )
+    return 'COPY "{}" ({}) FROM STDIN;'.format(table_name, column_names)
+
+
+def get_copy_seed_data(qualifier_map, row_count):
+    """
+    `row_count` freshly generated seed rows in COPY text format, one line per row
+    """
+    lines = []
+    for i in range(0, row_count):
+        lines.append(
+            "\t".join(
+                [
+                    escape_copy_value(strategy.value).decode()
+                    for strategy in qualifier_map.values()
+                ]
+            )
+            + "\n"
+        )
+
+    return "".join(lines)
+
+
+def get_seed_row_count(table_name):
+    return f'SELECT MAX("{_ID}") FROM "{table_name}";'
 
 
 def get_create_database(database_name):
@@ -114,7 +123,85 @@ def get_drop_database(database_name):
     ]
 
 
-def get_update_table(seed_table_name, update_table_strategy):
+def _get_where_clause(where, key_range):
+    if key_range is None:
+        return f" WHERE {where}" if where else ""
+
+    column, start, end = key_range
+    range_condition = f'"updatetarget"."{column}" >= {start}'
+    if end is not None:
+        range_condition += f' AND "updatetarget"."{column}" < {end}'
+    return (
+        f" WHERE ({where}) AND {range_condition}"
+        if where
+        else f" WHERE {range_condition}"
+    )
+
+
+def _get_single_pass_update_table(
+    seed_table_name, update_table_strategy, seed_rows, key_range
+):
+    """
+    One UPDATE for every where-group, choosing each column's value with a CASE expression.
+    Rows not matched by any condition keep their current value.
+    """
+    assignments = []
+    wheres = []
+    unconditional = False
+    for column_name, pairs in update_table_strategy.group_by_column().items():
+        cases = []
+        default = f'"{column_name}"'
+        for where, column_strategy in pairs:
+            value = _get_column_subquery(seed_table_name, column_strategy, seed_rows)
+            if where is None:
+                default = value
+                unconditional = True
+            else:
+                cases.append(f"WHEN ({where}) THEN {value}")
+                if where not in wheres:
+                    wheres.append(where)
+
+        if len(cases) > 0:
+            assignments.append(
+                f"\"{column_name}\" = CASE {' '.join(cases)} ELSE {default} END"
+            )
+        else:
+            assignments.append(f'"{column_name}" = {default}')
+
+    # only rows matching a condition need to be touched, unless something is updated unconditionally
+    where = None if unconditional else " OR ".join([f"({w})" for w in wheres])
+
+    return 'UPDATE {} AS "updatetarget" SET {}{};'.format(
+        _get_qualified_table_name(
+            update_table_strategy.schema, update_table_strategy.table_name
+        ),
+        ",".join(assignments),
+        _get_where_clause(where, key_range),
+    )
+
+
+def get_update_table(
+    seed_table_name, update_table_strategy, seed_rows=None, key_range=None
+):
+    """
+    :param seed_rows: the seed table's row count, see get_seed_row_count.
+    If not given, the count is looked up by every row's subquery.
+    :param key_range: optional (column, start, end), to only update rows where start <= column < end.
+    end may be None, for no upper bound
+    """
+    if seed_rows is None:
+        seed_rows = f'(SELECT MAX("{_ID}") FROM "{seed_table_name}")'
+
+    if (
+        update_table_strategy.single_pass
+        and not update_table_strategy.where_references_updated_columns()
+    ):
+        return [
+            _get_single_pass_update_table(
+                seed_table_name, update_table_strategy, seed_rows, key_range
+            )
+        ]
+
     # group on where_condition
     # build lists of update statements based on the where
     output_statements = []
@@ -124,12 +211,13 @@ def get_update_table(seed_table_name, update_table_strategy):
         for column_name, column_strategy in column_map.items():
             where_update_statements[where].append(
                 '"{}" = {}'.format(
-                    column_name, _get_column_subquery(seed_table_name, column_strategy)
+                    column_name,
+                    _get_column_subquery(seed_table_name, column_strategy, seed_rows),
                 )
             )
 
         assignments = ",".join(where_update_statements[where])
-        where_clause = f" WHERE {where}" if where else ""
+        where_clause = _get_where_clause(where, key_range)
 
         output_statements.append(
             'UPDATE {} AS "updatetarget" SET {}{};'.format(
@@ -144,6 +232,58 @@ def get_update_table(seed_table_name, update_table_strategy):
     return output_statements
 
 
-# TODO: fix for postgres
+def get_primary_key_columns(table_strategy):
+    qualified_name = _get_qualified_table_name(
+        table_strategy.schema, table_strategy.table_name
+    )
+    return (
+        "SELECT string_agg(a.attname, ',') "
+        "FROM pg_index i JOIN pg_attribute a ON a.attrelid = i.indrelid AND a.attnum = ANY(i.indkey) "
+        f"WHERE i.indrelid = '{qualified_name}'::regclass AND i.indisprimary;"
+    )
+
+
+def get_chunk_starts(table_strategy, column, chunk_size):
+    """
+    The first key of every `chunk_size` rows, in key order. Chunks follow the rows, so sparse keys don't make empty
+    chunks
+    """
+    qualified_name = _get_qualified_table_name(
+        table_strategy.schema, table_strategy.table_name
+    )
+    return (
+        f'SELECT "{column}" FROM ('
+        f'SELECT "{column}", ROW_NUMBER() OVER (ORDER BY "{column}") AS _row FROM {qualified_name}'
+        f") AS _keys WHERE (_row - 1) % {chunk_size} = 0 ORDER BY 1;"
+    )
+
+
+def get_row_estimates():
+    return (
+        "SELECT n.nspname || '.' || c.relname, c.reltuples::bigint "
+        "FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace "
+        "WHERE c.relkind IN ('r', 'p') AND n.nspname NOT IN ('pg_catalog', 'information_schema');"
+    )
+
+
+def get_table_count():
+    """
+    The number of tables pg_dump writes data for. Partitioned tables have no data of their own, their partitions do
+    """
+    return (
+        "SELECT COUNT(*) "
+        "FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace "
+        "WHERE c.relkind = 'r' AND n.nspname NOT IN ('pg_catalog', 'information_schema');"
+    )
+
+
 def get_dumpsize_estimate(database_name):
-    return "SELECT 1;"
+    """
+    The on-disk size of the current database's tables, including TOAST but not indexes.
+    database_name is unused: catalog queries only see the database the client is connected to
+    """
+    return (
+        "SELECT SUM(pg_total_relation_size(c.oid) - pg_indexes_size(c.oid))::bigint "
+        "FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace "
+        "WHERE c.relkind = 'r' AND n.nspname NOT IN ('pg_catalog', 'information_schema');"
+    )
@@ -0,0 +1,89 @@
+from pynonymizer.database.exceptions import DumpParseError
+from pynonymizer.database.postgres import dumpfile
+from pynonymizer.database.stream import StreamProvider
+
+
+class PostgreSqlStreamProvider(StreamProvider):
+    """
+    Anonymizes a plain-format pg_dump file on its way to the output, without a postgres server.
+    The rows of COPY blocks for updated tables are rewritten, and the COPY blocks of truncated and deleted tables are
+    emptied. Everything else is written unchanged.
+
+    Rows are sent to the workers in batches of `__BATCH_ROWS`.
+    """
+
+    __BATCH_ROWS = 1000
+
+    def _get_table_key(self, table_strategy):
+        return table_strategy.schema or "public", table_strategy.table_name
+
+    def _escape_value(self, value):
+        return dumpfile.escape_copy_value(value)
+
+    def _parse_literal(self, value):
+        return dumpfile.parse_sql_literal(value)
+
+    def __get_replacements(self, schema, table_name, columns, column_plan):
+        if columns is None:
+            raise DumpParseError(f"COPY for table {schema}.{table_name} has no columns")
+
+        column_indexes = {column: i for i, column in enumerate(columns)}
+        replacements = []
+        for column_name, (kind, payload) in column_plan.items():
+            if column_name not in column_indexes:
+                raise DumpParseError(
+                    f"unknown column {schema}.{table_name}.{column_name}"
+                )
+            replacements.append((column_indexes[column_name], kind, payload))
+
+        return replacements
+
+    def _read_items(self, lines, plan):
+        # while in a COPY block: None to drop its rows, or (table name, column count, replacements) to rewrite them
+        copy = None
+        in_copy = False
+        batch = []
+
+        for line in lines:
+            if not in_copy:
+                if line.startswith(b"COPY "):
+                    match = dumpfile.match_copy(line)
+                    if match is not None:
+                        schema, table_name, columns = match
+                        table_key = (schema, table_name)
+                        if table_key in plan.drop_tables:
+                            in_copy, copy = True, None
+                        elif table_key in plan.update_tables:
+                            replacements = self.__get_replacements(
+                                schema,
+                                table_name,
+                                columns,
+                                plan.update_tables[table_key],
+                            )
+                            in_copy = True
+                            copy = (
+                                f"{schema}.{table_name}",
+                                len(columns),
+                                replacements,
+                            )
+                yield line
+                continue
+
+            if dumpfile.is_end_of_data(line):
+                if batch:
+                    yield dumpfile.rewrite_copy_rows, (batch, *copy)
+                    batch = []
+                in_copy = False
+                yield line
+                continue
+
+            if copy is None:
+                continue
+
+            batch.append(line)
+            if len(batch) >= self.__BATCH_ROWS:
+                yield dumpfile.rewrite_copy_rows, (batch, *copy)
+                batch = []
+
+        if batch:
+            yield dumpfile.rewrite_copy_rows, (batch, *copy)
@@ -1 +1,28 @@
 SEED_TABLE_NAME = "_pynonymizer_seed_fake_data"
+
+
+def parse_chunk_starts(value):
+    """
+    Parse a chunk start query result: the first key of each chunk, one per line
+    :return: A list of ints, or None (empty table, or a non-integer key)
+    """
+    try:
+        starts = [int(line) for line in value.split()]
+    except ValueError:
+        return None
+
+    return starts if len(starts) > 0 else None
+
+
+def get_key_ranges(starts):
+    """
+    Turn the first key of each chunk into [start, end) ranges. The last range has no end (None), so it also covers
+    keys added since the starts were read
+    """
+    return list(zip(starts, starts[1:] + [None]))
+
+
+def describe_key_range(key_range):
+    """A (column, start, end) key range, for progress descriptions"""
+    column, start, end = key_range
+    return f"{column} >= {start}" if end is None else f"{start} <= {column} < {end}"
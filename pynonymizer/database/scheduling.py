@@ -0,0 +1,130 @@
+import heapq
+import logging
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from pynonymizer.strategy.table import TableStrategyTypes
+
+logger = logging.getLogger(__name__)
+
+
+def parse_row_estimates(output, separator="\t"):
+    """
+    Parse the "<table><separator><rows>" lines of a catalog row estimate query
+    :return: a dict of table name: estimated rows
+    """
+    estimates = {}
+    for line in output.splitlines():
+        try:
+            table_name, rows = line.rsplit(separator, 1)
+            estimates[table_name] = max(int(float(rows)), 0)
+        except ValueError:
+            # unparsable, likely NULL (e.g. views, or tables that have never been analyzed)
+            continue
+
+    return estimates
+
+
+def estimate_costs(tasks, table_rows):
+    """
+    Estimate how much work each task is, in rows processed
+    :param tasks: a list of task tuples, each starting with a table strategy
+    :param table_rows: a function returning a table strategy's estimated row count
+    :return: a list of costs, one for each task
+    """
+    # tables split into several tasks (e.g. chunked updates) share their rows between them
+    table_tasks = Counter(task[0] for task in tasks)
+
+    costs = []
+    for task in tasks:
+        table_strategy = task[0]
+        if table_strategy.strategy_type == TableStrategyTypes.TRUNCATE:
+            # truncates drop the table's data without reading it
+            costs.append(0)
+        elif table_strategy.strategy_type == TableStrategyTypes.UPDATE_COLUMNS:
+            # each where-group is a separate pass over the table
+            passes = len(table_strategy.group_by_where())
+            costs.append(
+                table_rows(table_strategy) * passes / table_tasks[table_strategy]
+            )
+        else:
+            costs.append(table_rows(table_strategy))
+
+    return costs
+
+
+def predict_makespan(costs, workers):
+    """
+    The largest total cost given to any one worker, when tasks are handed out in order to whichever worker is free
+    first.
+    """
+    loads = [0] * max(min(workers, len(costs)), 1)
+    for cost in costs:
+        heapq.heappush(loads, heapq.heappop(loads) + cost)
+
+    return max(loads)
+
+
+class LargestFirstSchedule:
+    """
+    Runs tasks on a pool of workers, largest first (LPT scheduling), so the biggest tables can't be left running on
+    their own at the end while every other worker is idle.
+
+    Tasks are timed as they run, and the predicted makespan is logged against the actual one afterwards.
+    """
+
+    def __init__(self, tasks, costs, workers):
+        # stable, so tasks with equal (or unknown) costs keep the strategyfile order
+        ordered = sorted(zip(tasks, costs), key=lambda pair: pair[1], reverse=True)
+
+        self.tasks = [task for task, cost in ordered]
+        self.costs = [cost for task, cost in ordered]
+        self.workers = workers
+
+        self.__lock = threading.Lock()
+        self.__busy_seconds = 0
+
+    def __timed(self, fn, *args):
+        start = time.perf_counter()
+        try:
+            return fn(*args)
+        finally:
+            with self.__lock:
+                self.__busy_seconds += time.perf_counter() - start
+
+    def run(self, fn, *args):
+        """
+        Call fn(*args, *task) for every task, across the workers
+        """
+        logger.debug(
+            "Scheduling %d tasks largest first, estimated rows: %s",
+            len(self.tasks),
+            self.costs,
+        )
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.workers) as e:
+            for task in self.tasks:
+                e.submit(self.__timed, fn, *args, *task)
+
+        self.__log_makespan(time.perf_counter() - start)
+
+    def __log_makespan(self, actual_seconds):
+        total_cost = sum(self.costs)
+        if total_cost <= 0 or self.__busy_seconds <= 0:
+            logger.debug("Ran %d tasks in %.2fs", len(self.tasks), actual_seconds)
+            return
+
+        # rows per second for a single worker, as measured over this run
+        throughput = total_cost / self.__busy_seconds
+        predicted_seconds = predict_makespan(self.costs, self.workers) / throughput
+
+        logger.info(
+            "Ran %d tasks in %.2fs (predicted %.2fs at %.0f rows/s per worker)",
+            len(self.tasks),
+            actual_seconds,
+            predicted_seconds,
+            throughput,
+        )
@@ -0,0 +1,293 @@
+import logging
+from abc import ABC, abstractmethod
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from pynonymizer.database.exceptions import (
+    UnsupportedColumnStrategyError,
+    UnsupportedStreamStrategyError,
+    UnsupportedTableStrategyError,
+)
+from pynonymizer.database.io import InputProgress, open_input, open_output
+from pynonymizer.strategy.table import TableStrategyTypes
+from pynonymizer.strategy.update_column import UpdateColumnStrategyTypes
+
+logger = logging.getLogger(__name__)
+
+# shared, read-only data for jobs (e.g. seed pools), set once in each worker process
+_job_context = None
+
+
+def _set_job_context(context):
+    global _job_context
+    _job_context = context
+
+
+def _run_job(job, args):
+    return job(_job_context, *args)
+
+
+class StreamPlan:
+    """
+    What to do with each table's data while streaming a dump
+    """
+
+    def __init__(self, drop_tables, update_tables):
+        """
+        :param drop_tables: a set of table keys whose data should be dropped
+        :param update_tables: a dict of table key: {column name: (kind, payload)}
+        """
+        self.drop_tables = drop_tables
+        self.update_tables = update_tables
+
+
+class StreamProvider(ABC):
+    """
+    A base for providers that anonymize a plain sql dump on its way from input to output, without a database server.
+
+    There is no database, so the process steps only record what to do: the input path (RESTORE_DB) and strategy
+    (ANONYMIZE_DB). The whole dump is read, rewritten and written during DUMP_DB.
+
+    Subclasses split the dump into statements with `_read_items`, yielding either bytes to be written unchanged, or
+    (job, args) tuples. Jobs are module-level functions called as job(context, *args), and run in a pool of
+    `db_workers` processes. Their output is written in the original order.
+    """
+
+    # how many items can be waiting to be written, per worker
+    __QUEUE_DEPTH = 16
+
+    def __init__(
+        self,
+        db_host,
+        db_user,
+        db_pass,
+        db_name,
+        seed_rows,
+        progress,
+        db_port=None,
+        seed_batch_size=None,
+    ):
+        self.db_name = db_name
+        self.seed_rows = int(seed_rows)
+        self.progress = progress
+
+        self.__input_path = None
+        self.__database_strategy = None
+        self.__db_workers = 1
+
+    @abstractmethod
+    def _get_table_key(self, table_strategy):
+        """The key used to identify a table strategy's table in the dump"""
+
+    @abstractmethod
+    def _escape_value(self, value):
+        """A seed value as an sql literal, in bytes"""
+
+    @abstractmethod
+    def _parse_literal(self, value):
+        """
+        A constant sql literal (e.g. from a `literal` column strategy) as it should be written into the dump
+        :return: bytes, or None if the value isn't a constant
+        """
+
+    def _get_column_plan(self, column_strategy):
+        """
+        How a column should be rewritten
+        :return: a (kind, payload) pair
+        """
+        if column_strategy.strategy_type == UpdateColumnStrategyTypes.FAKE_UPDATE:
+            return "fake", column_strategy.qualifier
+        elif column_strategy.strategy_type == UpdateColumnStrategyTypes.UNIQUE_EMAIL:
+            return "unique_email", None
+        elif column_strategy.strategy_type == UpdateColumnStrategyTypes.UNIQUE_LOGIN:
+            return "unique_login", None
+        elif column_strategy.strategy_type == UpdateColumnStrategyTypes.EMPTY:
+            return "empty", None
+        elif column_strategy.strategy_type == UpdateColumnStrategyTypes.LITERAL:
+            # there is nothing to evaluate sql with, so only constants can be written into the data
+            literal = self._parse_literal(str(column_strategy.value))
+            if literal is None:
+                raise UnsupportedStreamStrategyError(
+                    f"literal {column_strategy.value}. Only constant values are supported"
+                )
+            return "literal", literal
+        else:
+            raise UnsupportedColumnStrategyError(column_strategy)
+
+    @abstractmethod
+    def _read_items(self, lines, plan):
+        """
+        Split the dump's lines into items: bytes to write as-is, or (job, args) tuples to run
+        """
+
+    def __get_plan(self):
+        drop_tables = set()
+        update_tables = {}
+
+        if self.__database_strategy is None:
+            return StreamPlan(drop_tables, update_tables)
+
+        for table_strategy in self.__database_strategy.table_strategies:
+            table_key = self._get_table_key(table_strategy)
+            if table_strategy.strategy_type in (
+                TableStrategyTypes.TRUNCATE,
+                TableStrategyTypes.DELETE,
+            ):
+                drop_tables.add(table_key)
+            elif table_strategy.strategy_type == TableStrategyTypes.UPDATE_COLUMNS:
+                columns = update_tables.setdefault(table_key, {})
+                for column_strategy in table_strategy.column_strategies:
+                    columns[column_strategy.column_name] = self._get_column_plan(
+                        column_strategy
+                    )
+            else:
+                raise UnsupportedTableStrategyError(table_strategy)
+
+        return StreamPlan(drop_tables, update_tables)
+
+    def __get_seed_pools(self):
+        """
+        Generate `seed_rows` values for each fake_update type, like the seed table of a database provider
+        :return: a dict of qualifier: list of sql literals
+        """
+        if self.__database_strategy is None:
+            return {}
+
+        qualifier_map = self.__database_strategy.fake_update_qualifier_map
+        pools = {}
+        with self.progress(
+            desc="Generating seed data",
+            total=self.seed_rows * len(qualifier_map),
+            unit="values",
+        ) as progressbar:
+            for qualifier, column_strategy in qualifier_map.items():
+                pools[qualifier] = [
+                    self._escape_value(column_strategy.value)
+                    for i in range(0, self.seed_rows)
+                ]
+                progressbar.update(self.seed_rows)
+
+        return pools
+
+    def create_database(self):
+        logger.debug("%s: create_database ignored, there is no database", self.db_name)
+
+    def drop_database(self):
+        logger.debug("%s: drop_database ignored, there is no database", self.db_name)
+
+    def restore_database(
+        self, input_path, skip_data=None, db_workers=1, io_queue_depth=None
+    ):
+        """
+        Nothing is restored: the input is read during dump_database
+        """
+        self.__input_path = input_path
+
+    def anonymize_database(self, database_strategy, db_workers):
+        """
+        Nothing is anonymized yet: the strategy is applied during dump_database
+        """
+        if (
+            len(database_strategy.before_scripts) > 0
+            or len(database_strategy.after_scripts) > 0
+        ):
+            raise UnsupportedStreamStrategyError("before/after scripts")
+
+        for table_strategy in database_strategy.table_strategies:
+            if table_strategy.strategy_type != TableStrategyTypes.UPDATE_COLUMNS:
+                continue
+            for column_strategy in table_strategy.column_strategies:
+                if column_strategy.where_condition is not None:
+                    raise UnsupportedStreamStrategyError(
+                        f"where condition on {table_strategy.qualified_name}.{column_strategy.column_name}"
+                    )
+                self._get_column_plan(column_strategy)
+
+        self.__database_strategy = database_strategy
+        self.__db_workers = db_workers
+
+    def dump_database(
+        self, output_path, db_workers=1, compression=None, io_queue_depth=None
+    ):
+        """
+        Read, anonymize and write the dump. Statements are rewritten by the workers given to anonymize_database
+        :param compression: optional, io.CompressionOptions for compressed outputs
+        :param io_queue_depth: ignored, statements are already rewritten in parallel
+        """
+        if self.__input_path is None:
+            raise UnsupportedStreamStrategyError(
+                "dumping without an input. RESTORE_DB must be run in the same process"
+            )
+
+        plan = self.__get_plan()
+        context = {"pools": self.__get_seed_pools()}
+
+        input_obj, dumpsize, position = open_input(self.__input_path)
+        output_obj, close_writer = open_output(output_path, compression)
+        try:
+            with self.progress(
+                desc="Anonymizing dump",
+                total=dumpsize,
+                unit="B",
+                unit_scale=True,
+                unit_divisor=1000,
+            ) as bar:
+                input_progress = InputProgress(bar, position)
+
+                def read_lines():
+                    for line in input_obj:
+                        input_progress.update(line)
+                        yield line
+                    input_progress.finish()
+
+                items = self._read_items(read_lines(), plan)
+                if self.__db_workers > 1:
+                    self.__write_parallel(items, output_obj, context)
+                else:
+                    self.__write(items, output_obj, context)
+        finally:
+            if close_writer:
+                output_obj.close()
+            input_obj.close()
+
+    def __write(self, items, output_obj, context):
+        for item in items:
+            if isinstance(item, bytes):
+                output_obj.write(item)
+            else:
+                job, args = item
+                output_obj.write(job(context, *args))
+
+    def __write_parallel(self, items, output_obj, context):
+        max_pending = self.__db_workers * self.__QUEUE_DEPTH
+        pending = deque()
+
+        with ProcessPoolExecutor(
+            max_workers=self.__db_workers,
+            initializer=_set_job_context,
+            initargs=(context,),
+        ) as executor:
+            for item in items:
+                if isinstance(item, bytes):
+                    if len(pending) == 0:
+                        output_obj.write(item)
+                        continue
+                    pending.append(item)
+                else:
+                    job, args = item
+                    pending.append(executor.submit(_run_job, job, args))
+
+                # write in order, waiting on the oldest job once enough are queued
+                while len(pending) > max_pending or (
+                    len(pending) > 0
+                    and (isinstance(pending[0], bytes) or pending[0].done())
+                ):
+                    written = pending.popleft()
+                    output_obj.write(
+                        written if isinstance(written, bytes) else written.result()
+                    )
+
+            for written in pending:
+                output_obj.write(
+                    written if isinstance(written, bytes) else written.result()
+                )
@@ -1,20 +1,42 @@
 from dataclasses import dataclass
 import logging
 from typing import Optional
+from pynonymizer.database.io import (
+    DEFAULT_QUEUE_DEPTH,
+    CompressionOptions,
+    InvalidCompressionLevelError,
+    check_compression_level,
+)
 from pynonymizer.database.mssql import MsSqlProvider
 from pynonymizer.database.mysql import MySqlProvider
+from pynonymizer.database.mysql import execution as mysql_execution
+from pynonymizer.database.mysql.stream import MySqlStreamProvider
 from pynonymizer.database.postgres import PostgreSqlProvider
+from pynonymizer.database.postgres import execution as postgres_execution
+from pynonymizer.database.postgres.stream import PostgreSqlStreamProvider
 from pynonymizer.strategy.parser import StrategyParser
 from pynonymizer.strategy.config import read_config
 from pynonymizer.exceptions import ArgumentValidationError
 from pynonymizer.process_steps import ProcessSteps
 from pynonymizer.strategy.database import DatabaseStrategy
+from pynonymizer.strategy.table import TableStrategyTypes
 
 import uuid
 import os
 
 logger = logging.getLogger(__name__)
 
+# db-type kwargs that only accept a fixed set of values
+_DB_KWARG_CHOICES = {
+    "mysql": {
+        "execution_mode": mysql_execution.EXECUTION_MODES,
+        "dump_mode": mysql_execution.DUMP_MODES,
+    },
+    "postgres": {
+        "execution_mode": postgres_execution.EXECUTION_MODES,
+    },
+}
+
 
 def get_temp_db_name(filename=None):
     name, _ = os.path.splitext(os.path.basename(filename))
@@ -35,7 +57,12 @@ def pynonymize(
     db_name=None,
     db_port=None,
     seed_rows=None,
+    seed_batch_size=None,
     ignore_anonymization_errors=False,
+    restore_filter=False,
+    compress_level=None,
+    compress_threads=1,
+    io_queue_depth=DEFAULT_QUEUE_DEPTH,
     **kwargs,
 ):
     """
@@ -60,9 +87,15 @@ def pynonymize(
             if db_name is None:
                 db_name = get_temp_db_name(strategyfile_path)
 
+    compression = CompressionOptions(level=compress_level, threads=compress_threads)
     if not actions.skipped(ProcessSteps.DUMP_DB):
         if output_path is None:
             validations.append("Missing OUTPUT")
+        else:
+            try:
+                check_compression_level(output_path, compression)
+            except InvalidCompressionLevelError as error:
+                validations.append(str(error))
 
     # do not validate db_user/password as these are managed by providers
     # Mysql supports my.cnf files with additional config, so we have to assume db_host, db_user, db_password, db_port could all be in there
@@ -80,6 +113,13 @@ def pynonymize(
         if k.startswith(db_arg_prefix):
             db_kwargs[k[len(db_arg_prefix) :]] = v
 
+    for k, choices in _DB_KWARG_CHOICES.get(db_type, {}).items():
+        v = db_kwargs.get(k)
+        if v is not None and v not in choices:
+            validations.append(
+                f"Unknown {db_arg_prefix}{k} '{v}', expected one of {choices}"
+            )
+
     logger.debug(
         "Database: (%s:%s)%s@%s name: %s", db_host, db_port, db_type, db_user, db_name
     )
@@ -90,6 +130,10 @@ def pynonymize(
         Provider = PostgreSqlProvider
     elif db_type == "mssql":
         Provider = MsSqlProvider
+    elif db_type == "mysql-stream":
+        Provider = MySqlStreamProvider
+    elif db_type == "postgres-stream":
+        Provider = PostgreSqlStreamProvider
     else:
         validations.append(f"{db_type} is not a known database type.")
 
@@ -111,6 +155,7 @@ def pynonymize(
         db_name=db_name,
         db_port=db_port,
         seed_rows=seed_rows,
+        seed_batch_size=seed_batch_size,
         progress=progress,
         **db_kwargs,
     )
@@ -122,7 +167,27 @@ def pynonymize(
 
     logger.info(actions.summary(ProcessSteps.RESTORE_DB))
     if not actions.skipped(ProcessSteps.RESTORE_DB):
-        db_provider.restore_database(input_path)
+        # data that will be truncated/deleted during anonymization doesn't need to be restored
+        skip_data = None
+        if restore_filter and not actions.skipped(ProcessSteps.ANONYMIZE_DB):
+            skip_data = strategy.data_discarding_table_strategies
+            for table_strategy in skip_data:
+                logger.info(
+                    "Skipping data for %s during restore, as it will be %s",
+                    table_strategy.qualified_name,
+                    (
+                        "truncated"
+                        if table_strategy.strategy_type == TableStrategyTypes.TRUNCATE
+                        else "deleted"
+                    ),
+                )
+
+        db_provider.restore_database(
+            input_path,
+            skip_data=skip_data,
+            db_workers=db_workers,
+            io_queue_depth=io_queue_depth,
+        )
 
     logger.info(actions.summary(ProcessSteps.ANONYMIZE_DB))
     if not actions.skipped(ProcessSteps.ANONYMIZE_DB):
@@ -134,7 +199,12 @@ def pynonymize(
 
     logger.info(actions.summary(ProcessSteps.DUMP_DB))
     if not actions.skipped(ProcessSteps.DUMP_DB):
-        db_provider.dump_database(output_path)
+        db_provider.dump_database(
+            output_path,
+            db_workers=db_workers,
+            compression=compression,
+            io_queue_depth=io_queue_depth,
+        )
 
     logger.info(actions.summary(ProcessSteps.DROP_DB))
     if not actions.skipped(ProcessSteps.DROP_DB):
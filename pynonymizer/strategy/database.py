@@ -41,6 +41,16 @@ class DatabaseStrategy:
 
         return column_strategies
 
+    @property
+    def data_discarding_table_strategies(self):
+        """table strategies that discard all of a table's data"""
+        return [
+            table_strategy
+            for table_strategy in self.table_strategies
+            if table_strategy.strategy_type
+            in (TableStrategyTypes.TRUNCATE, TableStrategyTypes.DELETE)
+        ]
+
     @property
     def all_column_strategies(self):
         column_strategies = {}
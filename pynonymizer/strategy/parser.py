@@ -168,9 +168,30 @@ class StrategyParser:
                     self.__parse_update_column(column) for column in normalized_columns
                 ]
 
-                return UpdateColumnsTableStrategy(
+                table_strategy = UpdateColumnsTableStrategy(
                     column_strategies=parsed_columns, **table_config
                 )
+                chunk_size = table_strategy.chunk_size
+                if chunk_size is not None and (
+                    not isinstance(chunk_size, int)
+                    or isinstance(chunk_size, bool)
+                    or chunk_size < 1
+                ):
+                    raise ConfigSyntaxError(
+                        "{}: chunk_size must be a positive integer, got {}".format(
+                            table_strategy.qualified_name, chunk_size
+                        )
+                    )
+                if (
+                    table_strategy.single_pass
+                    and table_strategy.where_references_updated_columns()
+                ):
+                    logger.warning(
+                        "%s: single_pass is not possible, as a where condition references an updated column. Each where condition will be run separately.",
+                        table_strategy.qualified_name,
+                    )
+
+                return table_strategy
             else:
                 raise UnknownTableStrategyError(table_config)
 
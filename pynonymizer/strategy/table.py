@@ -1,5 +1,6 @@
 from enum import Enum
 from abc import ABC, abstractmethod
+import re
 
 
 class TableStrategyTypes(Enum):
@@ -36,8 +37,17 @@ class TruncateTableStrategy(TableStrategy):
 class UpdateColumnsTableStrategy(TableStrategy):
     strategy_type = TableStrategyTypes.UPDATE_COLUMNS
 
-    def __init__(self, table_name, column_strategies, schema=None):
+    def __init__(
+        self,
+        table_name,
+        column_strategies,
+        schema=None,
+        chunk_size=None,
+        single_pass=False,
+    ):
         super().__init__(table_name=table_name, schema=schema)
+        self.chunk_size = chunk_size
+        self.single_pass = single_pass
         self.__column_strategies = []
         for column_strategy in column_strategies:
             self.__column_strategies.append(column_strategy)
@@ -60,6 +70,46 @@ class UpdateColumnsTableStrategy(TableStrategy):
 
         return grouped_columns
 
+    def group_by_column(self):
+        """
+        returns a map of columns, each with a list of (where condition, column strategy) pairs.
+        This gives the same result as running each where-group in turn: the first matching pair wins, and an
+        unconditional pair (where None) can only be last.
+        :return:
+        """
+        grouped_columns = {}
+
+        for where_condition, column_map in self.group_by_where().items():
+            for column_name, column_strategy in column_map.items():
+                # an unconditional update overrides everything before it
+                if where_condition is None or column_name not in grouped_columns:
+                    grouped_columns[column_name] = []
+
+                grouped_columns[column_name].insert(
+                    0, (where_condition, column_strategy)
+                )
+
+        return grouped_columns
+
+    def where_references_updated_columns(self):
+        """
+        True if any where condition mentions a column this strategy updates.
+        When running where-groups in turn, these conditions see the updates made by previous groups.
+        """
+        column_names = {
+            column_strategy.column_name for column_strategy in self.__column_strategies
+        }
+        for where_condition in self.group_by_where().keys():
+            if where_condition is None:
+                continue
+            for column_name in column_names:
+                if re.search(
+                    rf"\b{re.escape(column_name)}\b", where_condition, re.IGNORECASE
+                ):
+                    return True
+
+        return False
+
     @property
     def column_strategies(self):
         return self.__column_strategies
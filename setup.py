@@ -35,5 +35,10 @@ setuptools.setup(
     entry_points={"console_scripts": ["pynonymizer = pynonymizer.cli:cli"]},
     setup_requires=["pytest-runner"],
     tests_require=["pytest"],
-    extras_require={"mssql": ["pyodbc>=4.0.26"]},
+    extras_require={
+        "mssql": ["pyodbc>=4.0.26"],
+        "postgres": ["psycopg>=3.1"],
+        "zstd": ["zstandard>=0.18"],
+        "lz4": ["lz4>=4"],
+    },
 )
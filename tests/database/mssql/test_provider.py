@@ -0,0 +1,123 @@
+from functools import partial
+from unittest.mock import PropertyMock, call, patch
+import pytest
+from tqdm import tqdm
+from pynonymizer.database.provider import SEED_TABLE_NAME
+from pynonymizer.strategy.parser import StrategyParser
+from pynonymizer.strategy.update_column import FakeUpdateColumnStrategy
+
+pytest.importorskip("pyodbc")
+
+from pynonymizer.database.mssql import MsSqlProvider
+
+
+@pytest.fixture
+def connection():
+    with patch("pyodbc.connect") as connect:
+        connection = connect.return_value
+        connection.execute.return_value.nextset.return_value = False
+        yield connection
+
+
+def make_provider(**kwargs):
+    return MsSqlProvider(
+        db_host=None,
+        db_user="user",
+        db_pass="pass",
+        db_name="db",
+        seed_rows=10,
+        progress=partial(tqdm, disable=True),
+        driver="ODBC Driver 18 for SQL Server",
+        **kwargs,
+    )
+
+
+def executed_statements(connection):
+    return [call.args[0] for call in connection.execute.call_args_list]
+
+
+def update_statements(connection):
+    return [
+        statement
+        for statement in executed_statements(connection)
+        if " UPDATE " in statement
+    ]
+
+
+@pytest.fixture
+def strategy():
+    return StrategyParser().parse_config(
+        {
+            "tables": {
+                "people": {
+                    "columns": {"first_name": "first_name", "email": "unique_email"}
+                }
+            }
+        }
+    )
+
+
+def test_anonymize_database__identity__should_seek_seed_rows_by_random_id(
+    connection, strategy
+):
+    make_provider(seed_lookup="identity").anonymize_database(strategy, db_workers=1)
+
+    assert update_statements(connection) == [
+        "SET ANSI_WARNINGS OFF;"
+        f"DECLARE @n INT = (SELECT MAX([_id]) FROM [{SEED_TABLE_NAME}]);"
+        " UPDATE [people] SET "
+        f"[first_name] = ( SELECT TOP 1 [first_name] FROM [{SEED_TABLE_NAME}] WHERE [_id] >= [_seed_lookup].[_rid] ORDER BY [_id]),"
+        "[email] = ( SELECT CONCAT(convert(varchar(38),NEWID()), '@example.com') )"
+        " FROM [people]"
+        " CROSS APPLY (SELECT ABS(CHECKSUM(NEWID()) % @n) + 1 AS [_rid]) AS [_seed_lookup];"
+        " SET ANSI_WARNINGS ON;"
+    ]
+
+
+def test_anonymize_database__identity__should_not_look_up_seed_rows_unless_needed(
+    connection,
+):
+    strategy = StrategyParser().parse_config(
+        {"tables": {"people": {"columns": {"email": "unique_email"}}}}
+    )
+
+    make_provider(seed_lookup="identity").anonymize_database(strategy, db_workers=1)
+
+    assert update_statements(connection) == [
+        "SET ANSI_WARNINGS OFF; UPDATE [people] SET "
+        "[email] = ( SELECT CONCAT(convert(varchar(38),NEWID()), '@example.com') ); "
+        "SET ANSI_WARNINGS ON;"
+    ]
+
+
+def test_anonymize_database__newid__should_sort_seed_rows_per_row(connection, strategy):
+    make_provider().anonymize_database(strategy, db_workers=1)
+
+    assert update_statements(connection) == [
+        "SET ANSI_WARNINGS OFF; UPDATE [people] SET "
+        f"[first_name] = ( SELECT TOP 1 [first_name] FROM [{SEED_TABLE_NAME}] WHERE [people].[first_name] LIKE '%' OR [people].[first_name] IS NULL ORDER BY NEWID()),"
+        "[email] = ( SELECT CONCAT(convert(varchar(38),NEWID()), '@example.com') ); "
+        "SET ANSI_WARNINGS ON;"
+    ]
+
+
+def test_anonymize_database__should_seed_in_batches_with_fast_executemany(
+    connection, strategy
+):
+    cursor = connection.cursor.return_value
+
+    with patch.object(
+        FakeUpdateColumnStrategy, "value", new_callable=PropertyMock
+    ) as value:
+        value.return_value = "Jane"
+        make_provider(seed_batch_size=4).anonymize_database(strategy, db_workers=1)
+
+    assert cursor.fast_executemany is True
+    assert cursor.executemany.call_args_list == [
+        call(
+            f"INSERT INTO [{SEED_TABLE_NAME}]([first_name]) VALUES ( ?);",
+            [["Jane"]] * rows,
+        )
+        for rows in [4, 4, 2]
+    ]
+    cursor.close.assert_called_once()
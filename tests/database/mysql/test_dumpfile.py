@@ -0,0 +1,28 @@
+import pytest
+from pynonymizer.database.mysql.dumpfile import TableDataFilter
+
+DUMP = b"""CREATE TABLE `audit` (`id` int);
+INSERT INTO `audit` VALUES (1),(2);
+INSERT INTO `audit_archive` VALUES (3);
+DELIMITER ;;
+CREATE TRIGGER `t` AFTER INSERT ON `accounts` FOR EACH ROW
+INSERT INTO `audit` VALUES (NEW.id);;
+DELIMITER ;
+INSERT INTO `audit` VALUES (4);
+"""
+
+
+@pytest.mark.parametrize("chunk_size", [1, 5, 8192])
+def test_filter__should_drop_inserts_for_tables(chunk_size):
+    chunks = [DUMP[i : i + chunk_size] for i in range(0, len(DUMP), chunk_size)]
+
+    filtered = b"".join(TableDataFilter(["audit"])(chunks))
+
+    assert filtered == (
+        b"CREATE TABLE `audit` (`id` int);\n"
+        b"INSERT INTO `audit_archive` VALUES (3);\n"
+        b"DELIMITER ;;\n"
+        b"CREATE TRIGGER `t` AFTER INSERT ON `accounts` FOR EACH ROW\n"
+        b"INSERT INTO `audit` VALUES (NEW.id);;\n"
+        b"DELIMITER ;\n"
+    )
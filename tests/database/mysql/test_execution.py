@@ -0,0 +1,93 @@
+import re
+from unittest.mock import patch
+import pytest
+from pynonymizer.database.exceptions import DependencyError
+from pynonymizer.database.mysql import execution
+
+
+def fake_mysqldump(args, stdout):
+    # write the non-connection arguments, so the output shows which part was dumped
+    stdout.write((" ".join(args[1:]) + "\n").encode())
+    return 1 if "broken" in args else 0
+
+
+@pytest.fixture
+def dumper():
+    with patch("shutil.which", return_value="/usr/bin/mysqldump"):
+        return execution.MySqlDumpRunner(None, None, None, "db", None, "--quick")
+
+
+def read_all(stream):
+    return b"".join(iter(lambda: stream.read(4), b"")).decode()
+
+
+def test_open_parallel__should_join_parts_in_dump_order(dumper):
+    with patch("subprocess.call", side_effect=fake_mysqldump) as call:
+        stream = dumper.open_parallel(
+            ["actor", "film", "rental"], jobs=1, table_sizes={"rental": 100}
+        )
+        output = read_all(stream)
+        dumper.close()
+
+    assert output.splitlines() == [
+        "--quick --no-data --skip-triggers --skip-routines --skip-events db",
+        "--quick --no-create-info --skip-triggers --skip-routines --skip-events db actor",
+        "--quick --no-create-info --skip-triggers --skip-routines --skip-events db film",
+        "--quick --no-create-info --skip-triggers --skip-routines --skip-events db rental",
+        "--quick --no-data --no-create-info db",
+    ]
+    # the largest table is started right after the schema
+    assert call.call_args_list[1].args[0][-1] == "rental"
+
+
+def test_open_parallel__should_keep_skip_triggers():
+    with patch("shutil.which", return_value="/usr/bin/mysqldump"):
+        dumper = execution.MySqlDumpRunner(
+            None, None, None, "db", None, "--skip-triggers"
+        )
+    with patch("subprocess.call", side_effect=fake_mysqldump):
+        stream = dumper.open_parallel(["actor"], jobs=1)
+        output = read_all(stream)
+        dumper.close()
+
+    assert output.splitlines()[-1] == "--skip-triggers --no-data --no-create-info db"
+
+
+def test_open_parallel__should_raise_on_failed_parts(dumper):
+    with patch("subprocess.call", side_effect=fake_mysqldump):
+        stream = dumper.open_parallel(["actor", "broken"], jobs=2)
+        with pytest.raises(DependencyError):
+            read_all(stream)
+        dumper.close()
+
+
+@pytest.fixture
+def session_input():
+    """the bytes sent to a mysql client session, which answers each marker query"""
+    written = []
+    with patch("subprocess.Popen") as popen:
+        process = popen.return_value
+        process.stdin.write.side_effect = written.append
+        process.stdout.readline.side_effect = lambda: (
+            re.search(rb"SELECT '(\w+)';\n$", written[-1]).group(1) + b"\n"
+        )
+        yield written
+
+
+@pytest.mark.parametrize(
+    "statement,expected",
+    [
+        ("UPDATE t SET a = 1", b"UPDATE t SET a = 1\n;\n"),
+        ("UPDATE t SET a = 1;", b"UPDATE t SET a = 1;\n"),
+        ("UPDATE t SET a = 1 -- done", b"UPDATE t SET a = 1 -- done\n;\n"),
+        ("UPDATE t SET a = 1; # done", b"UPDATE t SET a = 1; # done\n"),
+        ("UPDATE t SET a = ';' /* x; */", b"UPDATE t SET a = ';' /* x; */\n;\n"),
+    ],
+)
+def test_session_execute__should_terminate_statements(
+    session_input, statement, expected
+):
+    session = execution.MySqlSession(["mysql"])
+    session.execute(statement)
+
+    assert session_input[0].startswith(expected + b"SELECT '")
@@ -0,0 +1,58 @@
+from functools import partial
+from unittest.mock import patch
+import pytest
+from tqdm import tqdm
+from pynonymizer.database.mysql import MySqlProvider, query_factory
+from pynonymizer.database.provider import SEED_TABLE_NAME
+from pynonymizer.strategy.parser import StrategyParser
+
+
+@pytest.fixture
+def runner():
+    with patch("pynonymizer.database.mysql.execution.MySqlCmdRunner") as cmd_runner:
+        with patch("pynonymizer.database.mysql.execution.MySqlDumpRunner"):
+            with patch("pynonymizer.database.mysql.sleep"):
+                yield cmd_runner.return_value
+
+
+@pytest.fixture
+def provider(runner):
+    return MySqlProvider(
+        db_host=None,
+        db_user="user",
+        db_pass="pass",
+        db_name="db",
+        seed_rows=10,
+        progress=partial(tqdm, disable=True),
+    )
+
+
+def executed_statements(runner):
+    statements = []
+    for call in runner.db_execute.call_args_list:
+        statement = call.args[0]
+        statements += statement if isinstance(statement, list) else [statement]
+    return statements
+
+
+# the client's output ends with a newline, in both session and process mode
+@pytest.mark.parametrize("key_output,key_columns", [("id\n", ["id"]), ("NULL\n", None)])
+def test_anonymize_database__should_parse_primary_key_output(
+    provider, runner, key_output, key_columns
+):
+    strategy = StrategyParser().parse_config(
+        {"tables": {"people": {"columns": {"name": "first_name"}}}}
+    )
+    runner.get_single_result.side_effect = lambda statement: {
+        query_factory.get_primary_key_columns("db", "people"): key_output,
+        query_factory.get_row_estimates("db"): "people\t100\n",
+    }[statement]
+
+    provider.anonymize_database(strategy, db_workers=1)
+
+    assert query_factory.get_update_table(
+        SEED_TABLE_NAME,
+        strategy.table_strategies[0],
+        seed_rows=10,
+        key_columns=key_columns,
+    )[0] in executed_statements(runner)
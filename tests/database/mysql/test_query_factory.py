@@ -0,0 +1,93 @@
+from pynonymizer.database.mysql import query_factory
+from pynonymizer.strategy.table import UpdateColumnsTableStrategy
+from pynonymizer.strategy.update_column import (
+    FakeUpdateColumnStrategy,
+    LiteralUpdateColumnStrategy,
+)
+from pynonymizer.fake import FakeColumnGenerator
+
+
+def _update_strategy(column_strategies):
+    return UpdateColumnsTableStrategy("people", column_strategies)
+
+
+def test_update_table__should_look_up_seed_rows_by_primary_key():
+    generator = FakeColumnGenerator()
+    strategy = _update_strategy([FakeUpdateColumnStrategy("name", generator, "name")])
+
+    statements = query_factory.get_update_table(
+        "_pynonymizer_seed_fake_data", strategy, seed_rows=150, key_columns=["id"]
+    )
+
+    assert statements == [
+        "UPDATE `people` SET `name` = ( SELECT `name` FROM `_pynonymizer_seed_fake_data` "
+        "WHERE `_id` = MOD(CRC32(CONCAT_WS(',', 'people', `people`.`id`)), 150) + 1);"
+    ]
+
+
+def test_update_table__without_primary_key__should_pick_random_seed_rows():
+    generator = FakeColumnGenerator()
+    strategy = _update_strategy(
+        [
+            FakeUpdateColumnStrategy("name", generator, "name"),
+            FakeUpdateColumnStrategy("city", generator, "city"),
+        ]
+    )
+
+    (statement,) = query_factory.get_update_table(
+        "_pynonymizer_seed_fake_data", strategy, seed_rows=150
+    )
+
+    # hashing the updated columns would give equal values the same fake data
+    assert "CRC32" not in statement
+    assert statement.count("ORDER BY RAND() LIMIT 1") == 2
+
+
+def test_update_table__single_pass__should_merge_where_groups():
+    strategy = UpdateColumnsTableStrategy(
+        "people",
+        [
+            LiteralUpdateColumnStrategy("name", "('a')"),
+            LiteralUpdateColumnStrategy("name", "('b')", where="role = 'admin'"),
+            LiteralUpdateColumnStrategy("email", "('c')", where="role = 'user'"),
+        ],
+        single_pass=True,
+    )
+
+    statements = query_factory.get_update_table("seed", strategy)
+
+    assert statements == [
+        "UPDATE `people` SET "
+        "`name` = CASE WHEN (role = 'admin') THEN ('b') ELSE ('a') END,"
+        "`email` = CASE WHEN (role = 'user') THEN ('c') ELSE `email` END;"
+    ]
+
+
+def test_update_table__single_pass__should_only_touch_matching_rows():
+    strategy = UpdateColumnsTableStrategy(
+        "people",
+        [
+            LiteralUpdateColumnStrategy("name", "('b')", where="role = 'admin'"),
+            LiteralUpdateColumnStrategy("email", "('c')", where="role = 'user'"),
+        ],
+        single_pass=True,
+    )
+
+    (statement,) = query_factory.get_update_table("seed", strategy)
+
+    assert statement.endswith(" WHERE (role = 'admin') OR (role = 'user');")
+
+
+def test_update_table__single_pass__should_fall_back_when_where_uses_updated_columns():
+    strategy = UpdateColumnsTableStrategy(
+        "people",
+        [
+            LiteralUpdateColumnStrategy("name", "('a')"),
+            LiteralUpdateColumnStrategy("role", "('b')", where="name = 'admin'"),
+        ],
+        single_pass=True,
+    )
+
+    statements = query_factory.get_update_table("seed", strategy)
+
+    assert len(statements) == 2
@@ -0,0 +1,183 @@
+import re
+from functools import partial
+import pytest
+from tqdm import tqdm
+from pynonymizer.database.exceptions import (
+    DumpParseError,
+    UnsupportedStreamStrategyError,
+)
+from pynonymizer.database.mysql.dumpfile import (
+    find_statement_end,
+    parse_create_table_columns,
+    parse_sql_literal,
+    rewrite_insert,
+)
+from pynonymizer.database.mysql.stream import MySqlStreamProvider
+from pynonymizer.strategy.parser import StrategyParser
+
+CONTEXT = {"pools": {"first_name": [b"'Ann'"], "last_name": [b"'Bee'"]}}
+
+DUMP = b"""CREATE TABLE `customer` (
+  `id` int NOT NULL,
+  `first_name` varchar(45) NOT NULL,
+  `note` text COMMENT 'a;b',
+  PRIMARY KEY (`id`)
+) ENGINE=InnoDB;
+INSERT INTO `customer` VALUES (1,'Jo','it\\'s; (here)'),(2,'Al',NULL);
+INSERT INTO `audit` VALUES (1),(2);
+INSERT INTO `film` (`id`,`title`) VALUES (1,'a
+multi-line; value');
+DELIMITER ;;
+CREATE TRIGGER `t` AFTER INSERT ON `customer` FOR EACH ROW
+INSERT INTO `audit` VALUES (NEW.id);;
+DELIMITER ;
+"""
+
+
+def test_find_statement_end__should_skip_strings():
+    data = b"INSERT INTO `t` VALUES ('a;\\';b'),(';');\nINSERT"
+    assert find_statement_end(data) == data.index(b"\n")
+    assert find_statement_end(b"INSERT INTO `t` VALUES ('a;") == -1
+
+
+def test_parse_create_table_columns__should_skip_keys():
+    assert parse_create_table_columns(DUMP[: DUMP.index(b";\n") + 1]) == [
+        "id",
+        "first_name",
+        "note",
+    ]
+
+
+@pytest.mark.parametrize(
+    "literal,expected",
+    [
+        ("NULL", b"NULL"),
+        ("-12.5", b"-12.5"),
+        ("( 'it''s \\'here\\'' )", b"'it''s \\'here\\''"),
+        ("CONCAT(first_name, 'x')", None),
+        ("'a', (SELECT 1)", None),
+    ],
+)
+def test_parse_sql_literal(literal, expected):
+    assert parse_sql_literal(literal) == expected
+
+
+def test_rewrite_insert__should_replace_columns():
+    statement = b"INSERT INTO `customer` VALUES (1,'Jo','x,(y)'),(2,'Al',NULL);\n"
+    output = rewrite_insert(
+        CONTEXT,
+        statement,
+        "customer",
+        ["id", "first_name", "note"],
+        {"first_name": ("fake", "first_name"), "note": ("literal", b"NULL")},
+    )
+    assert output == (b"INSERT INTO `customer` VALUES (1,'Ann',NULL),(2,'Ann',NULL);\n")
+
+
+def test_rewrite_insert__should_prefer_column_list():
+    statement = b"INSERT INTO `customer` (`note`, `id`) VALUES ('x',1);"
+    output = rewrite_insert(
+        CONTEXT, statement, "customer", None, {"NOTE": ("empty", None)}
+    )
+    assert output == b"INSERT INTO `customer` (`note`, `id`) VALUES ('',1);"
+
+
+def test_rewrite_insert__should_raise_on_mismatched_rows():
+    with pytest.raises(DumpParseError):
+        rewrite_insert(
+            CONTEXT,
+            b"INSERT INTO `customer` VALUES (1,'Jo');",
+            "customer",
+            ["id", "first_name", "note"],
+            {"first_name": ("empty", None)},
+        )
+
+
+def test_rewrite_insert__should_raise_on_unknown_column_order():
+    with pytest.raises(DumpParseError):
+        rewrite_insert(
+            CONTEXT,
+            b"INSERT INTO `customer` VALUES (1);",
+            "customer",
+            None,
+            {"first_name": ("empty", None)},
+        )
+
+
+def anonymize_dump(tmp_path, config, db_workers=1):
+    input_path = tmp_path / "input.sql"
+    output_path = tmp_path / "output.sql"
+    input_path.write_bytes(DUMP)
+
+    provider = MySqlStreamProvider(
+        db_host=None,
+        db_user=None,
+        db_pass=None,
+        db_name="db",
+        seed_rows=5,
+        progress=partial(tqdm, disable=True),
+    )
+    provider.restore_database(str(input_path))
+    provider.anonymize_database(StrategyParser().parse_config(config), db_workers)
+    provider.dump_database(str(output_path))
+
+    return output_path.read_bytes()
+
+
+@pytest.mark.parametrize("db_workers", [1, 2])
+def test_dump_database__should_rewrite_dump(tmp_path, db_workers):
+    output = anonymize_dump(
+        tmp_path,
+        {
+            "tables": {
+                "customer": {"columns": {"first_name": "first_name", "note": "empty"}},
+                "audit": "truncate",
+                "film": {"columns": {"title": "unique_login"}},
+            }
+        },
+        db_workers,
+    )
+
+    # the CREATE TABLE (and its comment) and the triggers are kept as they were
+    assert output.startswith(DUMP[: DUMP.index(b"INSERT")])
+    assert output.endswith(DUMP[DUMP.index(b"DELIMITER") :])
+    assert b"'Jo'" not in output and b"here" not in output
+    assert re.search(rb"INSERT INTO `customer` VALUES \(1,'[^']+',''\),\(2,", output)
+    assert b"INSERT INTO `audit`" not in output.split(b"DELIMITER")[0]
+    assert b"multi-line" not in output
+
+
+def test_dump_database__should_raise_on_missing_columns(tmp_path):
+    with pytest.raises(DumpParseError):
+        anonymize_dump(
+            tmp_path,
+            {"tables": {"film": {"columns": {"description": "unique_login"}}}},
+        )
+
+
+def test_anonymize_database__should_reject_expression_literals(tmp_path):
+    with pytest.raises(UnsupportedStreamStrategyError):
+        anonymize_dump(
+            tmp_path,
+            {
+                "tables": {
+                    "customer": {"columns": {"note": "(CONCAT(first_name, 'x'))"}}
+                }
+            },
+        )
+
+
+def test_anonymize_database__should_reject_where_conditions(tmp_path):
+    with pytest.raises(UnsupportedStreamStrategyError):
+        anonymize_dump(
+            tmp_path,
+            {
+                "tables": {
+                    "customer": {
+                        "columns": {
+                            "note": {"type": "empty", "where": "id > 1"},
+                        }
+                    }
+                }
+            },
+        )
@@ -0,0 +1,79 @@
+import pytest
+from pynonymizer.database.postgres.dumpfile import (
+    ARCHIVE_CUSTOM,
+    ARCHIVE_DIRECTORY,
+    TableDataFilter,
+    get_input_archive_format,
+    get_output_archive_format,
+    get_restore_list,
+)
+
+DUMP = b"""CREATE TABLE public.audit (id integer);
+COPY public.audit (id) FROM stdin;
+1
+\\N
+\\.
+COPY public."Accounts" (id) FROM stdin;
+2
+\\.
+"""
+
+
+@pytest.mark.parametrize("chunk_size", [1, 5, 8192])
+def test_filter__should_empty_copy_blocks_for_tables(chunk_size):
+    chunks = [DUMP[i : i + chunk_size] for i in range(0, len(DUMP), chunk_size)]
+
+    filtered = b"".join(TableDataFilter([(None, "audit")])(chunks))
+
+    assert filtered == (
+        b"CREATE TABLE public.audit (id integer);\n"
+        b"COPY public.audit (id) FROM stdin;\n"
+        b"\\.\n"
+        b'COPY public."Accounts" (id) FROM stdin;\n'
+        b"2\n"
+        b"\\.\n"
+    )
+
+
+TOC = """;
+; Archive created at 2024-01-01 00:00:00 UTC
+;
+215; 1259 16390 TABLE public actor postgres
+3456; 0 16390 TABLE DATA public actor postgres
+3457; 0 16398 TABLE DATA public audit postgres
+3458; 0 16402 TABLE DATA sales audit postgres
+"""
+
+
+def test_get_restore_list__should_comment_out_skipped_data():
+    restore_list, table_count = get_restore_list(TOC, {("public", "audit")})
+
+    assert table_count == 2
+    assert restore_list == TOC.replace(
+        "3457; 0 16398 TABLE DATA", ";3457; 0 16398 TABLE DATA"
+    )
+
+
+def test_get_input_archive_format(tmp_path):
+    custom = tmp_path / "db.backup"
+    custom.write_bytes(b"PGDMP\x01\x0e")
+    plain = tmp_path / "db.sql"
+    plain.write_bytes(b"SET statement_timeout = 0;")
+
+    assert get_input_archive_format(str(tmp_path)) == ARCHIVE_DIRECTORY
+    assert get_input_archive_format(str(custom)) == ARCHIVE_CUSTOM
+    assert get_input_archive_format(str(plain)) is None
+    assert get_input_archive_format("-") is None
+
+
+@pytest.mark.parametrize(
+    "write_path,expected",
+    [
+        ("out/", ARCHIVE_DIRECTORY),
+        ("out.dump", ARCHIVE_CUSTOM),
+        ("out.sql.gz", None),
+        ("-", None),
+    ],
+)
+def test_get_output_archive_format(write_path, expected):
+    assert get_output_archive_format(write_path) == expected
@@ -0,0 +1,32 @@
+from unittest.mock import patch
+import pytest
+from pynonymizer.database.postgres.execution import PSqlCmdRunner
+
+
+@pytest.fixture
+def popen():
+    with patch("shutil.which", return_value="/usr/bin/psql"), patch(
+        "subprocess.Popen"
+    ) as popen:
+        popen.return_value.wait.return_value = 0
+        yield popen
+
+
+@pytest.fixture
+def runner(popen):
+    return PSqlCmdRunner("localhost", "user", "pass", "db")
+
+
+def test_copy__should_stop_on_error(runner, popen):
+    runner.copy("COPY seed FROM STDIN;", ["a\n"])
+
+    args = popen.call_args.args[0]
+    assert args[args.index("-v") + 1] == "ON_ERROR_STOP=1"
+    popen.return_value.stdin.write.assert_any_call(b"COPY seed FROM STDIN;\n")
+
+
+def test_open__should_not_stop_on_error_by_default(runner, popen):
+    runner.open()
+    runner.close()
+
+    assert "ON_ERROR_STOP=1" not in popen.call_args.args[0]
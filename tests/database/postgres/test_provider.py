@@ -0,0 +1,216 @@
+import os
+from functools import partial
+from unittest.mock import patch
+import pytest
+import yaml
+from tqdm import tqdm
+from pynonymizer.database.postgres import PostgreSqlProvider, query_factory
+from pynonymizer.database.provider import SEED_TABLE_NAME
+from pynonymizer.strategy.parser import StrategyParser
+from pynonymizer.strategy.table import TableStrategyTypes
+
+
+@pytest.fixture
+def strategy():
+    filepath = os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), "../../strategy/smoke_test.yml"
+    )
+    with open(filepath) as file:
+        return StrategyParser().parse_config(yaml.safe_load(file.read()))
+
+
+@pytest.fixture
+def runner():
+    with patch("pynonymizer.database.postgres.execution.PSqlCmdRunner") as cmd_runner:
+        with patch("pynonymizer.database.postgres.execution.PSqlDumpRunner"):
+            yield cmd_runner.return_value
+
+
+@pytest.fixture
+def provider(runner):
+    return PostgreSqlProvider(
+        db_host=None,
+        db_user="user",
+        db_pass="pass",
+        db_name="db",
+        seed_rows=10,
+        progress=partial(tqdm, disable=True),
+    )
+
+
+def executed_statements(runner):
+    statements = []
+    for call in runner.db_execute.call_args_list:
+        statement = call.args[0]
+        statements += statement if isinstance(statement, list) else [statement]
+    return statements
+
+
+def expected_table_statements(table_strategy):
+    if table_strategy.strategy_type == TableStrategyTypes.TRUNCATE:
+        return [query_factory.get_truncate_table(table_strategy)]
+    elif table_strategy.strategy_type == TableStrategyTypes.DELETE:
+        return [query_factory.get_delete_table(table_strategy)]
+    else:
+        return query_factory.get_update_table(SEED_TABLE_NAME, table_strategy)
+
+
+@pytest.mark.parametrize("db_workers", [1, 4])
+def test_anonymize_database__should_run_each_table_once(
+    provider, runner, strategy, db_workers
+):
+    provider.anonymize_database(strategy, db_workers=db_workers)
+
+    statements = executed_statements(runner)
+    for table_strategy in strategy.table_strategies:
+        table_statements = [
+            statement
+            for statement in statements
+            if f'"{table_strategy.table_name}"' in statement
+        ]
+        expected = expected_table_statements(table_strategy)
+
+        assert len(table_statements) == len(expected)
+
+
+def test_anonymize_database__chunk_size__should_update_each_key_range(provider, runner):
+    strategy = StrategyParser().parse_config(
+        {"tables": {"accounts": {"chunk_size": 40, "columns": {"name": "name"}}}}
+    )
+    runner.get_single_result.side_effect = lambda statement: {
+        query_factory.get_seed_row_count(SEED_TABLE_NAME): "10\n",
+        query_factory.get_primary_key_columns(strategy.table_strategies[0]): "id\n",
+        query_factory.get_chunk_starts(
+            strategy.table_strategies[0], "id", 40
+        ): "1\n41\n81\n",
+        query_factory.get_row_estimates(): "public.accounts|100\n",
+    }[statement]
+
+    provider.anonymize_database(strategy, db_workers=2)
+
+    updates = [s for s in executed_statements(runner) if s.startswith("UPDATE")]
+    assert sorted(updates) == sorted(
+        query_factory.get_update_table(
+            SEED_TABLE_NAME,
+            strategy.table_strategies[0],
+            seed_rows=10,
+            key_range=("id", start, end),
+        )[0]
+        for start, end in [(1, 41), (41, 81), (81, None)]
+    )
+
+
+def test_anonymize_database__chunk_size__sparse_keys__should_follow_rows(
+    provider, runner
+):
+    strategy = StrategyParser().parse_config(
+        {"tables": {"accounts": {"chunk_size": 1000, "columns": {"name": "name"}}}}
+    )
+    # 2500 rows with keys spread over 1..10^10: three chunks, not ten million
+    runner.get_single_result.side_effect = lambda statement: {
+        query_factory.get_seed_row_count(SEED_TABLE_NAME): "10\n",
+        query_factory.get_primary_key_columns(strategy.table_strategies[0]): "id\n",
+        query_factory.get_chunk_starts(
+            strategy.table_strategies[0], "id", 1000
+        ): "1\n4000000000\n9000000000\n",
+        query_factory.get_row_estimates(): "public.accounts|2500\n",
+    }[statement]
+
+    provider.anonymize_database(strategy, db_workers=2)
+
+    updates = [s for s in executed_statements(runner) if s.startswith("UPDATE")]
+    assert len(updates) == 3
+    assert any(
+        update.endswith('WHERE "updatetarget"."id" >= 9000000000;')
+        for update in updates
+    )
+
+
+def test_anonymize_database__chunk_size_without_primary_key__should_update_at_once(
+    provider, runner
+):
+    strategy = StrategyParser().parse_config(
+        {"tables": {"accounts": {"chunk_size": 40, "columns": {"name": "name"}}}}
+    )
+    runner.get_single_result.side_effect = lambda statement: {
+        query_factory.get_seed_row_count(SEED_TABLE_NAME): "10\n",
+        query_factory.get_primary_key_columns(strategy.table_strategies[0]): "\n",
+        query_factory.get_row_estimates(): "public.accounts|100\n",
+    }[statement]
+
+    provider.anonymize_database(strategy, db_workers=2)
+
+    updates = [s for s in executed_statements(runner) if s.startswith("UPDATE")]
+    assert updates == query_factory.get_update_table(
+        SEED_TABLE_NAME, strategy.table_strategies[0], seed_rows=10
+    )
+
+
+def test_restore_database__archive__should_use_pg_restore(provider, tmp_path):
+    strategy = StrategyParser().parse_config(
+        {"tables": {"audit": "truncate", "accounts": {"columns": {"name": "name"}}}}
+    )
+    with patch(
+        "pynonymizer.database.postgres.execution.PgRestoreRunner"
+    ) as restore_runner:
+        restore_runner.return_value.list.return_value = (
+            "3456; 0 16390 TABLE DATA public audit postgres\n"
+            "3457; 0 16398 TABLE DATA public accounts postgres\n"
+        )
+        use_lists = []
+        restore_runner.return_value.restore.side_effect = (
+            lambda input_path, jobs, use_list, on_table: use_lists.append(
+                open(use_list).read()
+            )
+        )
+
+        provider.restore_database(
+            str(tmp_path),
+            skip_data=strategy.data_discarding_table_strategies,
+            db_workers=4,
+        )
+
+    restore_runner.return_value.restore.assert_called_once()
+    assert restore_runner.return_value.restore.call_args.kwargs["jobs"] == 4
+    assert use_lists == [
+        ";3456; 0 16390 TABLE DATA public audit postgres\n"
+        "3457; 0 16398 TABLE DATA public accounts postgres\n"
+    ]
+
+
+@pytest.mark.parametrize("estimate,expected", [("1000\n", 850), ("\n", None)])
+def test_dump_database__should_estimate_dump_size(
+    provider, runner, tmp_path, estimate, expected
+):
+    runner.get_single_result.side_effect = lambda statement: {
+        query_factory.get_dumpsize_estimate("db"): estimate
+    }[statement]
+
+    with patch("pynonymizer.database.postgres.dump") as dump:
+        provider.dump_database(str(tmp_path / "dump.sql"))
+
+    assert dump.call_args.args[3] == pytest.approx(expected)
+
+
+def test_anonymize_database__should_limit_sessions_to_workers(
+    provider, runner, strategy
+):
+    provider.anonymize_database(strategy, db_workers=4)
+
+    # one per worker, plus the main thread
+    assert runner.set_max_sessions.call_args_list[0].args == (5,)
+    assert runner.set_max_sessions.call_args_list[-1].args == (None,)
+
+
+@pytest.mark.parametrize("count,expected", [("3\n", 3), ("0\n", None), ("\n", None)])
+def test_dump_database__archive__should_count_tables_with_data(
+    provider, runner, tmp_path, count, expected
+):
+    runner.get_single_result.side_effect = lambda statement: {
+        query_factory.get_table_count(): count
+    }[statement]
+
+    with patch.object(provider, "progress") as progress:
+        provider.dump_database(str(tmp_path / "dump.dump"))
+
+    assert progress.call_args.kwargs["total"] == expected
@@ -0,0 +1,35 @@
+from unittest.mock import Mock
+from pynonymizer.database.postgres import query_factory
+from pynonymizer.strategy.table import UpdateColumnsTableStrategy
+from pynonymizer.strategy.update_column import FakeUpdateColumnStrategy
+from pynonymizer.fake import FakeColumnGenerator
+
+
+def test_copy_seed_data__should_escape_copy_delimiters():
+    strategy = Mock(value="tab\there\nnew\\line")
+
+    data = query_factory.get_copy_seed_data({"text": strategy}, 1)
+
+    assert data == "tab\\there\\nnew\\\\line\n"
+
+
+def test_copy_seed_data__should_write_nulls_as_marker():
+    data = query_factory.get_copy_seed_data(
+        {"a": Mock(value=None), "b": Mock(value=1)}, 2
+    )
+
+    assert data == "\\N\t1\n\\N\t1\n"
+
+
+def test_update_table__should_use_constant_seed_row_count():
+    generator = FakeColumnGenerator()
+    strategy = UpdateColumnsTableStrategy(
+        "people", [FakeUpdateColumnStrategy("name", generator, "name")]
+    )
+
+    (statement,) = query_factory.get_update_table(
+        "_pynonymizer_seed_fake_data", strategy, seed_rows=150
+    )
+
+    assert "MAX(" not in statement
+    assert "::bit(32)::int), 150) + 1" in statement
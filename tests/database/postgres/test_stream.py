@@ -0,0 +1,161 @@
+from functools import partial
+import pytest
+from tqdm import tqdm
+from pynonymizer.database.exceptions import (
+    DumpParseError,
+    UnsupportedStreamStrategyError,
+)
+from pynonymizer.database.postgres.dumpfile import (
+    escape_copy_value,
+    match_copy,
+    parse_sql_literal,
+    rewrite_copy_rows,
+)
+from pynonymizer.database.postgres.stream import PostgreSqlStreamProvider
+from pynonymizer.strategy.parser import StrategyParser
+
+DUMP = b"""CREATE TABLE public.customer (id integer, first_name text, note text);
+COPY public.customer (id, first_name, note) FROM stdin;
+1\tJo\tit's\\ta\\nnote
+2\tAl\t\\N
+\\.
+COPY public.audit (id) FROM stdin;
+1
+2
+\\.
+COPY "Sales"."Order" (id, "Total") FROM stdin;
+1\t9.99
+\\.
+"""
+
+
+def test_match_copy__should_parse_columns():
+    assert match_copy(b'COPY "Sales"."Order" (id, "Total") FROM stdin;\n') == (
+        "Sales",
+        "Order",
+        ["id", "Total"],
+    )
+    assert match_copy(b"COPY customer (id) FROM stdin;\n") == (
+        "public",
+        "customer",
+        ["id"],
+    )
+    assert match_copy(b"COPY customer TO stdout;\n") is None
+
+
+def test_escape_copy_value():
+    assert escape_copy_value(None) == b"\\N"
+    assert escape_copy_value("a\tb\nc\\d") == b"a\\tb\\nc\\\\d"
+
+
+@pytest.mark.parametrize(
+    "literal,expected",
+    [
+        ("NULL", b"\\N"),
+        ("12.5", b"12.5"),
+        ("true", b"t"),
+        ("'it''s\t'", b"it's\\t"),
+        ("( 'x' )", b"x"),
+        ("NOW()", None),
+        ("'a' || 'b'", None),
+    ],
+)
+def test_parse_sql_literal(literal, expected):
+    assert parse_sql_literal(literal) == expected
+
+
+def test_rewrite_copy_rows__should_replace_fields():
+    context = {"pools": {"first_name": [b"Ann"]}}
+    rows = [b"1\tJo\tx\n", b"2\tAl\t\\N\n"]
+
+    output = rewrite_copy_rows(
+        context,
+        rows,
+        "public.customer",
+        3,
+        [(1, "fake", "first_name"), (2, "literal", b"\\N")],
+    )
+
+    assert output == b"1\tAnn\t\\N\n2\tAnn\t\\N\n"
+
+
+def test_rewrite_copy_rows__should_raise_on_mismatched_rows():
+    with pytest.raises(DumpParseError):
+        rewrite_copy_rows({"pools": {}}, [b"1\tJo\n"], "public.customer", 3, [])
+
+
+def anonymize_dump(tmp_path, config, db_workers=1):
+    input_path = tmp_path / "input.sql"
+    output_path = tmp_path / "output.sql"
+    input_path.write_bytes(DUMP)
+
+    provider = PostgreSqlStreamProvider(
+        db_host=None,
+        db_user=None,
+        db_pass=None,
+        db_name="db",
+        seed_rows=5,
+        progress=partial(tqdm, disable=True),
+    )
+    provider.restore_database(str(input_path))
+    provider.anonymize_database(StrategyParser().parse_config(config), db_workers)
+    provider.dump_database(str(output_path))
+
+    return output_path.read_bytes()
+
+
+@pytest.mark.parametrize("db_workers", [1, 2])
+def test_dump_database__should_rewrite_copy_blocks(tmp_path, db_workers):
+    output = anonymize_dump(
+        tmp_path,
+        {
+            "tables": [
+                {
+                    "table_name": "customer",
+                    "type": "update_columns",
+                    "columns": {"first_name": "unique_login", "note": "empty"},
+                },
+                {"table_name": "audit", "type": "truncate"},
+                {
+                    "table_name": "Order",
+                    "type": "update_columns",
+                    "schema": "Sales",
+                    "columns": {"Total": {"type": "literal", "value": "0"}},
+                },
+            ]
+        },
+        db_workers,
+    )
+
+    lines = output.splitlines()
+    customers = [line.split(b"\t") for line in lines[2:4]]
+    assert [row[0] for row in customers] == [b"1", b"2"]
+    assert all(len(row[1]) == 32 and row[2] == b"" for row in customers)
+    assert lines[4:8] == [
+        b"\\.",
+        b"COPY public.audit (id) FROM stdin;",
+        b"\\.",
+        b'COPY "Sales"."Order" (id, "Total") FROM stdin;',
+    ]
+    assert lines[8:] == [b"1\t0", b"\\."]
+
+
+def test_dump_database__should_raise_on_missing_columns(tmp_path):
+    with pytest.raises(DumpParseError):
+        anonymize_dump(
+            tmp_path, {"tables": {"customer": {"columns": {"email": "empty"}}}}
+        )
+
+
+def test_anonymize_database__should_reject_expression_literals(tmp_path):
+    with pytest.raises(UnsupportedStreamStrategyError):
+        anonymize_dump(
+            tmp_path,
+            {
+                "tables": {
+                    "customer": {
+                        "columns": {"note": {"type": "literal", "value": "NOW()"}}
+                    }
+                }
+            },
+        )
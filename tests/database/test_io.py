@@ -0,0 +1,270 @@
+import bz2
+import errno
+import gzip
+import lzma
+import os
+import subprocess
+import sys
+import time
+import zlib
+from functools import partial
+from unittest.mock import patch
+import pytest
+from tqdm import tqdm
+from pynonymizer.database.io import (
+    AdaptiveChunkSize,
+    CompressionOptions,
+    InvalidCompressionLevelError,
+    UnknownInputTypeError,
+    open_input,
+    open_output,
+    pipelined,
+    restore,
+)
+
+DATA = b"".join(
+    b"INSERT INTO `t` VALUES (%d,'row %d');\n" % (i, i) for i in range(5000)
+)
+
+
+@pytest.mark.parametrize("ext,module", [(".gz", gzip), (".xz", lzma)])
+@pytest.mark.parametrize("threads", [1, 4])
+def test_open_output__should_write_readable_compressed_files(
+    tmp_path, ext, module, threads
+):
+    write_path = str(tmp_path / f"dump.sql{ext}")
+    output_obj, close_writer = open_output(
+        write_path, CompressionOptions(level=1, threads=threads, block_size=10000)
+    )
+    for i in range(0, len(DATA), 777):
+        output_obj.write(DATA[i : i + 777])
+    output_obj.close()
+
+    assert close_writer
+    with module.open(write_path, "rb") as file:
+        assert file.read() == DATA
+
+
+def test_open_output__parallel_gzip__should_write_independent_members(tmp_path):
+    write_path = str(tmp_path / "dump.sql.gz")
+    output_obj, _ = open_output(
+        write_path, CompressionOptions(threads=2, block_size=len(DATA) // 2)
+    )
+    output_obj.write(DATA[: len(DATA) // 2])
+    output_obj.write(DATA[len(DATA) // 2 :])
+    output_obj.close()
+
+    with open(write_path, "rb") as file:
+        compressed = file.read()
+    first_member = zlib.decompressobj(wbits=31)
+    assert first_member.decompress(compressed) == DATA[: len(DATA) // 2]
+    assert gzip.decompress(first_member.unused_data) == DATA[len(DATA) // 2 :]
+
+
+@pytest.mark.parametrize(
+    "name,level", [("dump.sql.gz", 10), ("dump.sql.xz", 10), ("dump.sql.zst", 23)]
+)
+def test_open_output__should_reject_invalid_levels(tmp_path, name, level):
+    write_path = tmp_path / name
+
+    with pytest.raises(InvalidCompressionLevelError):
+        open_output(str(write_path), CompressionOptions(level=level))
+    assert not write_path.exists()
+
+
+@pytest.mark.parametrize(
+    "name,compress",
+    [
+        ("dump.sql", lambda data: data),
+        ("dump.sql.gz", gzip.compress),
+        ("dump.sql.xz", lzma.compress),
+        ("dump.sql.bz2", bz2.compress),
+        # detected by content, not extension
+        ("dump.backup", gzip.compress),
+    ],
+)
+def test_open_input__should_detect_compression(tmp_path, name, compress):
+    read_path = tmp_path / name
+    read_path.write_bytes(compress(DATA))
+
+    input_obj, size, position = open_input(str(read_path))
+    with input_obj:
+        assert input_obj.read() == DATA
+        # the size and position are the file's, not the uncompressed data's
+        assert size == read_path.stat().st_size
+        if position is not None:
+            assert position() == size
+
+
+def test_open_input__should_reject_unknown_files(tmp_path):
+    read_path = tmp_path / "dump.txt"
+    read_path.write_bytes(DATA)
+
+    with pytest.raises(UnknownInputTypeError):
+        open_input(str(read_path))
+
+
+@pytest.mark.parametrize("module,ext", [("zstandard", ".zst"), ("lz4", ".lz4")])
+@pytest.mark.parametrize("threads", [1, 2])
+def test_optional_formats__should_round_trip(tmp_path, module, ext, threads):
+    pytest.importorskip(module)
+    write_path = str(tmp_path / f"dump.sql{ext}")
+
+    output_obj, _ = open_output(
+        write_path, CompressionOptions(threads=threads, block_size=10000)
+    )
+    output_obj.write(DATA)
+    output_obj.close()
+
+    input_obj, _, _ = open_input(write_path)
+    with input_obj:
+        assert input_obj.read() == DATA
+
+
+def test_adaptive_chunk_size__should_follow_throughput():
+    chunk_size = AdaptiveChunkSize(initial=1024, maximum=8192, target_seconds=0.1)
+
+    for i in range(5):
+        chunk_size.record(0.01)
+    assert chunk_size.size == 8192
+
+    chunk_size.record(0.5)
+    assert chunk_size.size == 4096
+    chunk_size.record(0.1)
+    assert chunk_size.size == 4096
+
+
+def restore_throughput(read_path, **kwargs):
+    """restore into a `cat > /dev/null` stand-in for the database client, returning MB/s"""
+    process = subprocess.Popen("cat > /dev/null", shell=True, stdin=subprocess.PIPE)
+    started = time.perf_counter()
+    try:
+        restore(partial(tqdm, disable=True), read_path, process.stdin, **kwargs)
+    finally:
+        process.stdin.close()
+        assert process.wait() == 0
+    return os.path.getsize(read_path) / (time.perf_counter() - started) / 1e6
+
+
+# writes 64MB, so only runs on request. Results are recorded as junitxml properties (pytest --junitxml)
+@pytest.mark.skipif(
+    not os.environ.get("PYNONYMIZER_BENCHMARK"),
+    reason="set PYNONYMIZER_BENCHMARK=1 to run benchmarks",
+)
+@pytest.mark.skipif(sys.platform == "win32", reason="needs a posix shell")
+def test_restore__benchmark(tmp_path, record_property):
+    read_path = tmp_path / "dump.sql"
+    with open(read_path, "wb") as file:
+        for i in range(64):
+            file.write(DATA[: 1024 * 1024].ljust(1024 * 1024, b"\n"))
+
+    # the previous behaviour: 8KB chunks, flushed after every write
+    fixed = restore_throughput(
+        str(read_path), chunk_size=8192, flush_interval=0, zero_copy=False
+    )
+    adaptive = restore_throughput(str(read_path), zero_copy=False)
+    zero_copy = restore_throughput(str(read_path))
+
+    record_property("restore_fixed_mb_s", round(fixed))
+    record_property("restore_adaptive_mb_s", round(adaptive))
+    record_property("restore_zero_copy_mb_s", round(zero_copy))
+
+
+@pytest.mark.parametrize("queue_depth", [0, 1, 4])
+def test_pipelined__should_keep_order(queue_depth):
+    assert list(pipelined(iter(range(1000)), queue_depth)) == list(range(1000))
+
+
+def test_pipelined__should_raise_reader_errors():
+    def chunks():
+        yield b"a"
+        raise EOFError("truncated")
+
+    with pytest.raises(EOFError):
+        list(pipelined(chunks(), 2))
+
+
+def test_pipelined__should_bound_read_ahead():
+    read = []
+
+    def chunks():
+        for i in range(100):
+            read.append(i)
+            yield i
+
+    iterator = pipelined(chunks(), 2)
+    next(iterator)
+    time.sleep(0.2)
+    # the chunk handed over, the queue, and one waiting to be queued
+    assert len(read) <= 4
+
+    # stopping early releases the reader
+    iterator.close()
+    assert len(read) <= 5
+
+
+def restore_to_file(tmp_path, read_path, **kwargs):
+    output_path = tmp_path / "restored.sql"
+    with open(output_path, "wb") as output:
+        process = subprocess.Popen(["cat"], stdin=subprocess.PIPE, stdout=output)
+        try:
+            restore(partial(tqdm, disable=True), read_path, process.stdin, **kwargs)
+        finally:
+            process.stdin.close()
+            process.wait()
+    return output_path.read_bytes()
+
+
+@pytest.mark.skipif(
+    not (hasattr(os, "splice") or hasattr(os, "sendfile")), reason="no zero-copy"
+)
+def test_restore__plain_file__should_zero_copy(tmp_path):
+    read_path = tmp_path / "dump.sql"
+    read_path.write_bytes(DATA)
+
+    with patch("pynonymizer.database.io.pipelined") as pipelined_mock:
+        assert restore_to_file(tmp_path, str(read_path)) == DATA
+    pipelined_mock.assert_not_called()
+
+
+def test_restore__zero_copy_unsupported__should_fall_back(tmp_path):
+    read_path = tmp_path / "dump.sql"
+    read_path.write_bytes(DATA)
+
+    unsupported = OSError(errno.EINVAL, "Invalid argument")
+    with patch("os.splice", side_effect=unsupported, create=True), patch(
+        "os.sendfile", side_effect=unsupported, create=True
+    ):
+        assert restore_to_file(tmp_path, str(read_path)) == DATA
+
+
+class RecordingBar:
+    def __init__(self, total, **kwargs):
+        self.total = total
+        self.n = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def update(self, n):
+        self.n += n
+
+
+def test_restore__multi_member_gzip__should_report_compressed_progress(tmp_path):
+    read_path = tmp_path / "dump.sql.gz"
+    # the last member's size trailer only covers the last member
+    read_path.write_bytes(gzip.compress(DATA) + gzip.compress(DATA[:100]))
+    bars = []
+
+    def progress(**kwargs):
+        bars.append(RecordingBar(**kwargs))
+        return bars[-1]
+
+    with open(tmp_path / "restored.sql", "wb") as target:
+        restore(progress, str(read_path), target, chunk_size=4096)
+
+    assert (tmp_path / "restored.sql").read_bytes() == DATA + DATA[:100]
+    assert bars[0].total == bars[0].n == read_path.stat().st_size
@@ -0,0 +1,102 @@
+import threading
+from unittest.mock import Mock
+from pynonymizer.database.pool import ThreadConnectionPool
+
+
+def run_in_thread(fn):
+    results = []
+    thread = threading.Thread(target=lambda: results.append(fn()))
+    thread.start()
+    thread.join()
+    return results[0]
+
+
+def test_get__should_reuse_connection_in_same_thread():
+    pool = ThreadConnectionPool(Mock)
+
+    assert pool.get() is pool.get()
+    assert pool.created == 1
+
+
+def test_get__should_give_each_live_thread_its_own_connection():
+    pool = ThreadConnectionPool(Mock)
+    barrier = threading.Barrier(2)
+    connections = []
+
+    def worker():
+        connections.append(pool.get())
+        barrier.wait()
+
+    threads = [threading.Thread(target=worker) for i in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert connections[0] is not connections[1]
+    assert pool.created == 2
+
+
+def test_get__should_hand_over_connection_from_finished_thread():
+    pool = ThreadConnectionPool(Mock)
+
+    first = run_in_thread(pool.get)
+    second = run_in_thread(pool.get)
+
+    assert first is second
+    assert pool.created == 1
+    assert pool.handed_over == 1
+
+
+def test_get__max_size__should_wait_for_a_connection_to_be_released():
+    pool = ThreadConnectionPool(Mock, max_size=1)
+    first_got = threading.Event()
+    release = threading.Event()
+    connections = []
+
+    def first():
+        connections.append(pool.get())
+        first_got.set()
+        release.wait()
+
+    first_thread = threading.Thread(target=first)
+    first_thread.start()
+    first_got.wait()
+
+    second_thread = threading.Thread(target=lambda: connections.append(pool.get()))
+    second_thread.start()
+    second_thread.join(timeout=0.3)
+    assert second_thread.is_alive()
+    assert len(connections) == 1
+
+    release.set()
+    first_thread.join()
+    second_thread.join(timeout=5)
+
+    assert not second_thread.is_alive()
+    assert connections[0] is connections[1]
+    assert pool.created == 1
+    assert pool.handed_over == 1
+    assert pool.peak_size == 1
+
+
+def test_close__should_close_all_connections():
+    pool = ThreadConnectionPool(Mock)
+    main_connection = pool.get()
+    thread_connection = run_in_thread(pool.get)
+
+    pool.close()
+
+    main_connection.close.assert_called_once()
+    thread_connection.close.assert_called_once()
+    assert pool.size == 0
+
+
+def test_discard__should_close_and_replace_connection():
+    pool = ThreadConnectionPool(Mock)
+    connection = pool.get()
+
+    pool.discard()
+
+    connection.close.assert_called_once()
+    assert pool.get() is not connection
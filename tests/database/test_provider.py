@@ -0,0 +1,28 @@
+from pynonymizer.database.provider import (
+    describe_key_range,
+    get_key_ranges,
+    parse_chunk_starts,
+)
+
+
+def test_get_key_ranges__should_cover_every_key_once():
+    assert get_key_ranges([1, 5, 9]) == [(1, 5), (5, 9), (9, None)]
+    assert get_key_ranges([7]) == [(7, None)]
+
+
+def test_get_key_ranges__sparse_keys__should_make_one_range_per_chunk():
+    # chunks follow the rows, not the key values, however far apart they are
+    starts = [1, 10**6, 10**9, 10**10]
+    assert len(get_key_ranges(starts)) == 4
+
+
+def test_parse_chunk_starts__should_reject_non_integer_keys():
+    assert parse_chunk_starts("3\n12\n") == [3, 12]
+    assert parse_chunk_starts("a\nb\n") is None
+    assert parse_chunk_starts("\n") is None
+    assert parse_chunk_starts("") is None
+
+
+def test_describe_key_range():
+    assert describe_key_range(("id", 1, 5)) == "1 <= id < 5"
+    assert describe_key_range(("id", 5, None)) == "id >= 5"
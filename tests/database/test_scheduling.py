@@ -0,0 +1,47 @@
+from pynonymizer.database.scheduling import (
+    LargestFirstSchedule,
+    estimate_costs,
+    parse_row_estimates,
+    predict_makespan,
+)
+from pynonymizer.strategy.table import (
+    DeleteTableStrategy,
+    TruncateTableStrategy,
+    UpdateColumnsTableStrategy,
+)
+from pynonymizer.strategy.update_column import LiteralUpdateColumnStrategy
+
+
+def test_parse_row_estimates__should_skip_unknown_counts():
+    assert parse_row_estimates("a\t10\nb\tNULL\npublic.c\t-1\n") == {
+        "a": 10,
+        "public.c": 0,
+    }
+
+
+def test_estimate_costs__should_share_rows_between_chunks():
+    update = UpdateColumnsTableStrategy(
+        "update", [LiteralUpdateColumnStrategy("name", "('')")]
+    )
+    delete = DeleteTableStrategy("delete")
+    truncate = TruncateTableStrategy("truncate")
+    tasks = [(update, 1), (update, 2), (delete,), (truncate,)]
+
+    costs = estimate_costs(tasks, lambda table_strategy: 100)
+
+    assert costs == [50, 50, 100, 0]
+
+
+def test_predict_makespan__should_balance_across_workers():
+    assert predict_makespan([5, 4, 3, 3, 3], workers=2) == 10
+    assert predict_makespan([5, 4], workers=4) == 5
+    assert predict_makespan([], workers=4) == 0
+
+
+def test_run__should_start_largest_tasks_first():
+    started = []
+    schedule = LargestFirstSchedule([("a",), ("b",), ("c",)], [1, 10, 1], workers=1)
+
+    schedule.run(lambda prefix, name: started.append(prefix + name), "table_")
+
+    assert started == ["table_b", "table_a", "table_c"]
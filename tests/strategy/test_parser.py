@@ -103,6 +103,29 @@ def test_smoke_test__should_contain_update_column_table(strategy_parser, smoke_t
     assert update_columns.strategy_type == TableStrategyTypes.UPDATE_COLUMNS
 
 
+def test_update_columns__should_parse_chunk_size(strategy_parser):
+    strategy = strategy_parser.parse_config(
+        {"tables": {"accounts": {"chunk_size": 1000, "columns": {"name": "name"}}}}
+    )
+
+    assert strategy.table_strategies[0].chunk_size == 1000
+
+
+@pytest.mark.parametrize("chunk_size", [0, -1, "1000", 1.5, True])
+def test_update_columns__should_reject_invalid_chunk_size(strategy_parser, chunk_size):
+    with pytest.raises(ConfigSyntaxError):
+        strategy_parser.parse_config(
+            {
+                "tables": {
+                    "accounts": {
+                        "chunk_size": chunk_size,
+                        "columns": {"name": "name"},
+                    }
+                }
+            }
+        )
+
+
 def test_smoke_test__should_contain_scripts(strategy_parser, smoke_test):
     strategy = strategy_parser.parse_config(smoke_test)
 
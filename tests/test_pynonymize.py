@@ -0,0 +1,28 @@
+import pytest
+from tqdm import tqdm
+from pynonymizer.exceptions import ArgumentValidationError
+from pynonymizer.process_steps import ProcessSteps, StepActionMap
+from pynonymizer.pynonymize import pynonymize
+
+
+@pytest.mark.parametrize(
+    "db_type,kwargs",
+    [
+        ("mysql", {"mysql_execution_mode": "sessions"}),
+        ("mysql", {"mysql_dump_mode": "threaded"}),
+        ("postgres", {"postgres_execution_mode": "psycopg2"}),
+    ],
+)
+def test_pynonymize__unknown_mode__should_fail_validation(db_type, kwargs):
+    with pytest.raises(ArgumentValidationError) as error:
+        pynonymize(
+            progress=tqdm,
+            actions=StepActionMap(only_step=ProcessSteps.CREATE_DB),
+            db_type=db_type,
+            db_workers=1,
+            db_name="db",
+            **kwargs,
+        )
+
+    assert len(error.value.validation_messages) == 1
+    assert list(kwargs.values())[0] in error.value.validation_messages[0]